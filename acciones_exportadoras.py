@@ -5,130 +5,32 @@ Created on Thu Jul 28 10:48:24 2022
 @author: lauta
 """
 
-import os
-
-# cargar las variables de entorno
-api_key = os.environ['API_EOD']
-# Por seguridad, es mejor guardar las contraseñas y usuarios en las variables de entorno
-bcch_user = os.environ['BCCH_USER']
-bcch_pwd = os.environ['BCCH_PWD']
-
-from eod import EodHistoricalData
-from bcch import BancoCentralDeChile
+from clientes import cliente_eod
+from datos import serie_macro
+from tendencia import filtro_hp
+from ventanas import AlmacenVentanas, MediaExponencial
+from precios import PanelPrecios
+from betas import rendimientos, betas
+from cuantiles import Resumen
+from cribado import cribar, INDICES
+from calculos import ajuste_lineal
 import pandas as pd
-import requests
 import numpy as np
 
 # Crear la instancia
-client = EodHistoricalData(api_key)
-client_bcch = BancoCentralDeChile(bcch_user, bcch_pwd)
+client = cliente_eod()
+# Estados financieros TTM de ejecuciones anteriores
+almacen_ttm = AlmacenVentanas.cargar()
+# Precios diarios de ejecuciones anteriores (se actualizan con la API bulk)
+panel_precios = PanelPrecios.cargar()
 # Datos referenciales al codigo
-indice_mercado = 'SPIPSA.INDX'
-
-def fundamental_caller(stock_ticker:str, filter_:str, delete_extras:bool=True, resample_:bool=False):
-    """
-    Solicitar los datos a la API EOD Historical data y dejarla lista para usar.
-    Parameters
-    ----------
-    stock_ticker : str
-        codigo acción junto a su exchange.
-    filter_ : str
-        Campos a solicitar en la solicitud.
-    delete_extras : bool, optional
-        Campos inncesarios para el analisis. The default is True.
-    resample_ : bool, optional
-        Remuestrar a una frecuencia de tiempo superior?. The default is False.
-    Returns
-    -------
-    temp_ : pd.DataFrame
-        Datos financieros fundamentales para la acción en una base TTM.
-    """
-    # solcitar los datos
-    temp_ = pd.DataFrame(
-        client.get_fundamental_equity(
-            stock_ticker, 
-            filter_=filter_
-            )
-        ).T[::-1]
-    
-    # borrar la moneda de la accion
-    if delete_extras:
-        temp_.drop('currency_symbol', axis=1, inplace=True)
-        # borrar la fecha de subida del informe
-        temp_.drop('filing_date', axis=1, inplace=True)
-        
-    # hacer del index la fecha
-    temp_['date'] = pd.to_datetime(temp_['date'])
-    temp_.set_index('date', inplace=True)
-    
-    # Todos los datos a numerico
-    temp_ = temp_.apply(pd.to_numeric, errors='ignore')
-    
-    # calcular en base a TTM
-    temp_ = temp_.rolling(window=4, min_periods=4).sum()
-    
-    if resample_:
-        temp_ = temp_.resample('Y').sum()
-    
-    return temp_
-
-def cleaner(serie:str, resam:str=None, operations:list=None):
-    """
-    Limpiar la serie proveniente del la APIy dejarla lista para ocupar
+# exchanges de EOD a comparar; el indice de cada uno está en cribado.INDICES
+exchanges = ['SN']
+indice_mercado = INDICES['SN']
+# betas estimados con los precios semanales contra el indice (2 años, ajuste de
+# Vasicek) en vez del Technicals::Beta de EOD, que queda solo si falta el local
+betas_locales = True
 
-    Parameters
-    ----------
-    serie : str
-        id de la serie macro a solicitar.
-    resam : str
-        frecuencia para el resampling.
-    operation : list
-        operación(es) para agregar los datos resampliandos.
-
-    Returns
-    -------
-    pandas DataFrame
-        serie lista para ocupar.
-
-    """
-    serie_ = pd.DataFrame(client_bcch.get_macro(serie=serie))
-    serie_['value'] = pd.to_numeric(serie_['value'], errors='coerce')
-    serie_['indexDateString'] = pd.to_datetime(serie_['indexDateString'], format='%d-%m-%Y')
-    serie_.set_index('indexDateString', inplace=True)
-    del serie_['statusCode']
-    
-    if resam is not None:
-        if operations is not None:
-            serie_ = serie_.resample(resam).agg(operations)
-            # renombrar las columnas
-            serie_.columns = ['_'.join(x) for x in serie_.columns]
-            return serie_
-        else:
-            print('Ocupar ')
-    else:
-        return serie_
-    
-def beta_normalizer(data:dict, columna_tiempo:str='date'):
-    """
-    Normalizar los datos de precios para el instrumento solicitado
-    Parameters
-    ----------
-    data : dict
-        Precios del instrumento en base OHLCV.
-    columna_tiempo : str, optional
-        Nombre de columna de tiempo. The default is 'date'.
-    Returns
-    -------
-    data : pd.Series
-        Datos normalizados.
-    """
-    data = pd.DataFrame(data)
-    # transformar a tiempo
-    data[columna_tiempo] = pd.to_datetime(data[columna_tiempo])
-    # incorporarlo como indice
-    data.set_index(columna_tiempo, inplace=True)
-    return data
-    
 #%% Filtrar por las acciones expuestas a los sectores exportadores
 
 """
@@ -160,85 +62,17 @@ Filtros:
     La deuda no tiene ninguna relación con el ROE (fuerte)
     Menores yields tienden (debilmente) a menores ROE
 """
-# solicitar todas las empresas del mercado chileno
-simbolos = pd.DataFrame(
-    client.get_exchange_symbols(
-        exchange='SN'
-        )
-    )
-
-# 2. Filtrar solo por las que esten en CLP.
-simbolos = simbolos[simbolos['Currency'] == 'CLP']
-
-# Solicitar a cada empresa el sector en que se encuentra, para así
-# caracterizar las industrias disponibles en la API
-industrias_empresas = pd.DataFrame()
-import time
-import math
-for row in range(simbolos.shape[0]):
-    try:
-        ind_ = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='General')['Industry']
-        sec_ = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='General')['Sector']
-        # parte de valorización
-        ev_ebitda = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Valuation::EnterpriseValueEbitda')
-        ev_rev = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Valuation::EnterpriseValueRevenue')
-        pb = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Valuation::PriceBookMRQ')
-        ps = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Valuation::PriceSalesTTM')
-        pe = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Valuation::TrailingPE')
-        # Highlights
-        roe = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Highlights::ReturnOnEquityTTM')
-        roa = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Highlights::ReturnOnAssetsTTM')
-        # ROIC = NOPAT / Avergae Invested Capital = (EBIT*(1-tax)) / (Fixed Assets + Net Working Capital)
-        inc_ = fundamental_caller(simbolos.iloc[row, 0] + ".SN", filter_='Financials::Income_Statement::quarterly')
-        bs_ = fundamental_caller(simbolos.iloc[row, 0] + ".SN", filter_='Financials::Balance_Sheet::quarterly')
-        taxes = (inc_['incomeTaxExpense'] / inc_['incomeBeforeTax'])[-4:].mean()
-        if math.isnan(taxes):
-            taxes = 0.27 # https://tradingeconomics.com/chile/corporate-tax-rate
-        capital = (bs_.netWorkingCapital + bs_.nonCurrentAssetsTotal).rolling(window=4).mean()
-        if (math.isnan(capital[-1])) & (sec_!='Financial Services'):
-            capital = bs_.netInvestedCapital.rolling(window=4).mean()
-            roic = ((inc_['incomeBeforeTax']*(1-taxes)) / capital)[-4:].mean()
-            
-        elif sec_=='Financial Services':
-            roic = roe
-        
-        else:
-            roic = ((inc_['incomeBeforeTax']*(1-taxes)) / capital)[-4:].mean()
-        
-        op_margin = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Highlights::OperatingMarginTTM')
-        mkt_cap = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Highlights::MarketCapitalization')
-        # parte de technicals
-        beta = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='Technicals::Beta')
-        # parte dividendos
-        payout = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='SplitsDividends::PayoutRatio')
-        fw_yield = client.get_fundamental_equity(simbolos.iloc[row, 0] + ".SN", filter_='SplitsDividends::ForwardAnnualDividendYield')
-        new_row = pd.DataFrame([{
-            'empresa':simbolos.iloc[row, 0] + ".SN", 
-            'sector':sec_,
-            'industria': ind_,
-            'ev_ebitda': ev_ebitda,
-            'ev_rev': ev_rev,
-            'pb': pb,
-            'ps': ps,
-            'pe': pe,
-            'roe':roe,
-            'roa': roa,
-            'roic':roic,
-            'op_margin': op_margin,
-            'mkt_cap': float(mkt_cap),
-            'beta': float(beta),
-            'payout': payout,
-            'fw_yield': fw_yield,
-                                 }])
-        industrias_empresas = pd.concat([industrias_empresas, new_row]).reset_index(drop=True)
-        print(f"{simbolos.iloc[row, 0] + '.SN'}")
-    except:
-        print(f"No se pudo para {simbolos.iloc[row, 0] + '.SN'}")
-    time.sleep(2)
+# Datos de todas las empresas de cada exchange: cada pagina de listados en un
+# hilo aparte y cada exchange con su propio ritmo de solicitudes a EOD. En
+# Santiago solo las que transan en pesos chilenos.
+# La capitalización bursatil queda en pesos. El ROIC se resume a medida que
+# llegan las paginas de cada exchange (sketches que se unen entre hilos).
+resumen = Resumen(['roic'])
+industrias_empresas = cribar(exchanges, monedas={'SN': 'CLP'}, destino='CLP',
+                             panel_precios=panel_precios, resumen=resumen)
+print(f"{resumen.sketches['roic'].n} empresas, ROIC mediano {round(resumen.mediana('roic')*100, 2)}%")
     
 #%% Limpiando los datos
-industrias_empresas.sort_values(by=['sector', 'industria'], inplace=True)
-industrias_empresas.set_index('empresa', inplace=True)
 # imputar NA en cada columna por la mediana de cada sector, si es el unico, medinana del mercado
 sectors = industrias_empresas.sector.value_counts().index.to_list()
 for sec in sectors:
@@ -247,21 +81,38 @@ for sec in sectors:
     temp_columns = temp_.columns
     # ir por cada columna llenada los NAs con la mediana
     for col in temp_columns:
-        industrias_empresas[col].replace(
+        industrias_empresas[col] = industrias_empresas[col].replace(
             to_replace=np.nan, 
-            value=industrias_empresas[col].median(), 
-            inplace=True 
+            value=industrias_empresas[col].median()
             )
     
     print(f"Listo el sector de {sec}")
     
+#%% Betas de todo el mercado contra el indice, en una sola pasada
+# indice de mercado de cada empresa segun su exchange
+indices_empresas = industrias_empresas['exchange'].map(INDICES).fillna(indice_mercado)
+# precios al dia: las acciones nuevas traen su historia, el resto solo los dias faltantes
+panel_precios.actualizar(tickers=industrias_empresas.index.to_list() + indices_empresas.unique().tolist())
+panel_precios.guardar()
+if betas_locales:
+    # una pasada por exchange, contra su propio indice
+    for indice, empresas_ in industrias_empresas.groupby(indices_empresas):
+        betas_ = betas(
+            rendimientos(panel_precios.precios(empresas_.index.intersection(panel_precios.tickers).to_list() + [indice])),
+            indice, window=104, ajuste='vasicek'
+            )
+        industrias_empresas.loc[empresas_.index, 'beta'] = betas_['beta_ajustado'].reindex(empresas_.index).fillna(empresas_['beta'])
+
 #%% Agregando el wacc
 # calculo de la tasa de retorno exigida al patrimonio
-# retornos promedios anualizados del indice de mercado elegido
-r_m = beta_normalizer(client.get_prices_eod(indice_mercado)).resample('M').mean().close.pct_change().dropna().mean()*100*12
+# retornos promedios anualizados del indice de mercado de cada exchange
+r_m = panel_precios.precios(indices_empresas.unique().tolist(), 'close').resample(pd.offsets.MonthEnd()).mean().pct_change(fill_method=None).mean()*100*12
+r_m = indices_empresas.map(r_m)
 # tasa libre de riesgo (bono chileno + spread empresas chilenas)
 r_f = client.get_instrument_ta('US10Y.INDX', function='ema', period=20, filter_='last_ema') +\
-    ( cleaner('F019.SPS.PBP.91.D').ewm(span=20).mean().iloc[-1, 0] / 100 ) # el spread esta en puntos base
+    ( almacen_ttm.ultimo('F019.SPS.PBP.91.D', serie_macro('F019.SPS.PBP.91.D'), MediaExponencial(span=20)) / 100 ) # el spread esta en puntos base
+# medias al dia para la proxima ejecucion
+almacen_ttm.guardar()
 # tasa de descuento para el patrimonio
 # Discount rate = Cost of Equity = Risk Free Rate + (Levered Beta * Equity Risk Premium)
 # calcular el wacc para accion del mercado chileno
@@ -270,14 +121,13 @@ industrias_empresas['wacc'] = (r_f + industrias_empresas['beta']*(r_m - r_f)) /
 #%% Agregando la tasa de crecimiento permanente
 
 # PIB, volumen a precios del año anterior encadenado, referencia 2018 (miles de millones de pesos encadenados)
-pib_ = cleaner('F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T').pct_change().rolling(window=16).mean() * 4
+pib_ = serie_macro('F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T').pct_change().rolling(window=16).mean() * 4
 
 # Ocupare el promedio a largo plazo de chile
-import statsmodels.api as sm
 # El autor del filtro recomienda 1600 para data trimestral
-cycle, trend = sm.tsa.filters.hpfilter(pib_.dropna(), 1600)
+cycle, trend = filtro_hp(pib_.dropna(), 1600)
 # El último dato es el que importa
-perpetual_growth_rate = trend[-1]
+perpetual_growth_rate = trend.iloc[-1]
 
 #%% Version Damodoran pb vs pb
 industrias_empresas['mv_bv'] = (industrias_empresas['roic']-perpetual_growth_rate)/\
@@ -288,9 +138,9 @@ industrias_empresas['roe_r'] = industrias_empresas['roe'] - perpetual_growth_rat
 
 #%% Graficando los resultados
 import matplotlib.pyplot as plt
-from sklearn.metrics import r2_score
 # Filtrar por las empresas del quintal 60 hacia arriba en market cap (3er quintil)
-mkt_cap_filter = pd.to_numeric(industrias_empresas['mkt_cap'], errors='coerce').quantile(0.6)
+# la tabla ya está en memoria y con los NA imputados: cuantil exacto
+mkt_cap_filter = industrias_empresas['mkt_cap'].quantile(0.6)
 # filtrar las empresas que tengan un roic mayor que la tasa permanente de retorno
 empresas = industrias_empresas
 # empresas = empresas[empresas['wacc']>perpetual_growth_rate]
@@ -301,9 +151,11 @@ empresas = empresas[empresas['mkt_cap']>=mkt_cap_filter]
 
 x = empresas.roic_wacc.values.flatten() * 100
 y = empresas.mv_bv.values.flatten()
+# medianas exactas del spread y del MV/BV de las empresas filtradas
+mediana_x = empresas['roic_wacc'].median() * 100
+mediana_y = empresas['mv_bv'].median()
 
-modelo = np.poly1d(np.polyfit(x, y, 1))
-r_2 = r2_score(y, modelo(x))
+modelo, r_2 = ajuste_lineal(x, y)
 
 fig, ax = plt.subplots(figsize=(10, 5))
 
@@ -314,11 +166,11 @@ plt.title('Se consideran empresas en el 4to y 5to quintil de cap. bursátil')
 ax.set_ylabel('MV/BV')
 ax.set_xlabel('ROIC - WACC (%)')
 # limites de valorización
-ax.axhline(y=np.median(y), color='tab:red', linestyle='dashed')
-ax.axvline(x=np.median(x), color='tab:red', linestyle='dashed')
-ax.fill_betweenx(y=np.linspace(np.median(y), np.max(y)), x1=np.min(x), x2=np.median(x), 
+ax.axhline(y=mediana_y, color='tab:red', linestyle='dashed')
+ax.axvline(x=mediana_x, color='tab:red', linestyle='dashed')
+ax.fill_betweenx(y=np.linspace(mediana_y, np.max(y)), x1=np.min(x), x2=mediana_x, 
                  facecolor='tab:red', alpha=0.4, edgecolor="tab:red")
-ax.fill_betweenx(y=np.linspace(np.min(y), np.median(y)), x1=np.median(x), x2=np.max(x), facecolor='tab:green', alpha=0.4)
+ax.fill_betweenx(y=np.linspace(np.min(y), mediana_y), x1=mediana_x, x2=np.max(x), facecolor='tab:green', alpha=0.4)
 ax.text(0.4, 0.8,  
          r"$R^{2} = $" + f"{round(r_2,2)}", 
          horizontalalignment='center',
@@ -341,5 +193,5 @@ ax.text(0.2, -0.17,
 plt.show()
 
 # Empresas subvaloradas
-subvaloradas = industrias_empresas[(industrias_empresas['roic_wacc']>=np.median(x)) & (industrias_empresas['mv_bv']<=np.median(y))].index.to_list()
+subvaloradas = industrias_empresas[(industrias_empresas['roic_wacc']*100>=mediana_x) & (industrias_empresas['mv_bv']<=mediana_y)].index.to_list()
 print(f"Las empresas infravaloradas para el mercado chileno son: {subvaloradas}")
\ No newline at end of file
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Almacen columnar local (Arrow IPC / Feather v2) para series, precios y
+fundamentales.
+
+Cada tabla se guarda sin compresión en su propio archivo, de modo que los
+procesos la abren con memoria mapeada y leen las columnas numericas sin
+copiarlas: varios procesos que leen la misma serie comparten una sola
+copia fisica en el cache del sistema operativo. Junto a cada tabla un
+'<tabla>.json' guarda su tipo, frecuencia, columnas y rango de fechas; el
+catalogo es la unión de esos archivos, así dos procesos que escriben
+tablas distintas no se pisan.
+
+Pasan por el almacen las series del Banco Central (datos.py), el panel
+de precios ('precios/close', 'precios/adjusted_close', ver precios.py) y
+los estados financieros del backtest ('fundamentales/<ticker>', ver
+valor_historico.py). Los estados TTM (ventanas.py) siguen en su propio
+archivo del cache.
+
+Requiere pyarrow, que se importa recién al leer o escribir.
+
+@author: lauta
+"""
+
+import os
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from clientes import directorio_cache
+
+
+_COLUMNA_FECHA = '__fecha'
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+    except ImportError as error:
+        raise ImportError('El almacen columnar requiere pyarrow (pip install pyarrow)') from error
+    return pa
+
+class AlmacenColumnar:
+    """
+    Tablas indexadas por fecha guardadas como archivos Arrow IPC.
+
+    Parameters
+    ----------
+    ruta : str, optional
+        Carpeta del almacen. The default is 'columnar' en el directorio de cache.
+
+    """
+
+    def __init__(self, ruta:str=None):
+        self.ruta = ruta or os.path.join(directorio_cache(), 'columnar')
+        os.makedirs(self.ruta, exist_ok=True)
+
+    @property
+    def _ruta_catalogo(self):
+        # catalogo unico de versiones anteriores, solo se lee
+        return os.path.join(self.ruta, 'catalogo.json')
+
+    def _archivo(self, nombre:str, extension:str='arrow'):
+        # los codigos del BCCh y los tickers solo tienen letras, numeros, '.', '-' y '_'
+        seguro = ''.join(c if c.isalnum() or c in '.-_' else '_' for c in nombre)
+        return os.path.join(self.ruta, f'{seguro}.{extension}')
+
+    def _temporal(self, ruta:str):
+        # propio de cada proceso e hilo, para que dos escrituras no compartan el archivo
+        return f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def _leer_entrada(self, nombre:str):
+        try:
+            with open(self._archivo(nombre, 'json'), encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            pass
+        if os.path.exists(self._ruta_catalogo):
+            with open(self._ruta_catalogo, encoding='utf-8') as archivo:
+                return json.load(archivo).get(nombre)
+        return None
+
+    def _leer_catalogo(self):
+        catalogo = {}
+        if os.path.exists(self._ruta_catalogo):
+            with open(self._ruta_catalogo, encoding='utf-8') as archivo:
+                catalogo = json.load(archivo)
+        for nombre_archivo in os.listdir(self.ruta):
+            if nombre_archivo.endswith('.json') and nombre_archivo != 'catalogo.json':
+                try:
+                    with open(os.path.join(self.ruta, nombre_archivo), encoding='utf-8') as archivo:
+                        entrada = json.load(archivo)
+                except FileNotFoundError:
+                    continue
+                catalogo[entrada.pop('nombre')] = entrada
+        # las tablas eliminadas pueden seguir en el catalogo antiguo
+        return {n: e for n, e in catalogo.items() if os.path.exists(os.path.join(self.ruta, e['archivo']))}
+
+    def catalogo(self):
+        """
+        Tablas disponibles en el almacen.
+
+        Returns
+        -------
+        pd.DataFrame
+            Una fila por tabla con su tipo, filas, columnas y rango de fechas.
+
+        """
+        return pd.DataFrame.from_dict(self._leer_catalogo(), orient='index')
+
+    def frecuencia(self, nombre:str):
+        """Frecuencia nativa registrada en el catalogo (o None)."""
+        return (self._leer_entrada(nombre) or {}).get('frecuencia')
+
+    def escrita(self, nombre:str):
+        """Momento en que se guardó la tabla (o None)."""
+        escrita = (self._leer_entrada(nombre) or {}).get('escrita')
+        return None if escrita is None else pd.Timestamp(escrita)
+
+    def contiene(self, nombre:str):
+        return self._leer_entrada(nombre) is not None and os.path.exists(self._archivo(nombre))
+
+    def guardar(self, nombre:str, tabla:pd.DataFrame, tipo:str='serie', frecuencia:str=None):
+        """
+        Escribir (o reemplazar) una tabla indexada por fecha.
+
+        Parameters
+        ----------
+        nombre : str
+            Codigo de la serie, ticker o identificador de la tabla.
+        tabla : pd.DataFrame
+            Datos con un DatetimeIndex.
+        tipo : str, optional
+            'serie', 'precios', 'fundamentales', etc. The default is 'serie'.
+        frecuencia : str, optional
+            Frecuencia nativa ('D', 'M', 'Q', 'A'). The default is None.
+
+        """
+        pa = _pyarrow()
+        columnas = {_COLUMNA_FECHA: pa.array(tabla.index.values.astype('datetime64[ns]'))}
+        for columna in tabla.columns:
+            valores = tabla[columna]
+            if pd.api.types.is_numeric_dtype(valores):
+                # los NaN quedan como NaN (sin mascara de nulos) para leerlos sin copia
+                columnas[str(columna)] = pa.array(valores.to_numpy(dtype=float))
+            else:
+                columnas[str(columna)] = pa.array(valores.astype(object), from_pandas=True)
+        tabla_arrow = pa.table(columnas)
+
+        archivo = self._archivo(nombre)
+        temporal = self._temporal(archivo)
+        with pa.OSFile(temporal, 'wb') as destino:
+            with pa.ipc.new_file(destino, tabla_arrow.schema) as escritor:
+                escritor.write_table(tabla_arrow)
+        os.replace(temporal, archivo)
+
+        entrada = {
+            'nombre': nombre,
+            'tipo': tipo,
+            'frecuencia': frecuencia,
+            'archivo': os.path.basename(archivo),
+            'filas': len(tabla),
+            'columnas': [str(c) for c in tabla.columns],
+            'desde': None if tabla.empty else str(tabla.index.min().date()),
+            'hasta': None if tabla.empty else str(tabla.index.max().date()),
+            'escrita': pd.Timestamp.now().isoformat(),
+            }
+        metadatos = self._archivo(nombre, 'json')
+        temporal = self._temporal(metadatos)
+        with open(temporal, 'w', encoding='utf-8') as archivo_metadatos:
+            json.dump(entrada, archivo_metadatos, indent=1, ensure_ascii=False)
+        os.replace(temporal, metadatos)
+
+    def leer(self, nombre:str, columnas:list=None):
+        """
+        Abrir una tabla con memoria mapeada.
+
+        Las columnas numericas se entregan sin copia y son de solo lectura.
+
+        Parameters
+        ----------
+        nombre : str
+            Identificador de la tabla.
+        columnas : list, optional
+            Subconjunto de columnas a leer. The default is None (todas).
+
+        Returns
+        -------
+        pd.DataFrame
+            Tabla indexada por fecha.
+
+        """
+        pa = _pyarrow()
+        # los buffers de la tabla mantienen vivo el mapeo mientras se ocupen
+        fuente = pa.memory_map(self._archivo(nombre), 'r')
+        tabla_arrow = pa.ipc.open_file(fuente).read_all()
+
+        indice = pd.DatetimeIndex(tabla_arrow.column(_COLUMNA_FECHA).to_numpy())
+        nombres = [c for c in tabla_arrow.column_names if c != _COLUMNA_FECHA]
+        if columnas is not None:
+            nombres = [c for c in nombres if c in columnas]
+
+        datos = {}
+        for columna in nombres:
+            arreglo = tabla_arrow.column(columna)
+            if pa.types.is_floating(arreglo.type) and arreglo.num_chunks == 1 and arreglo.null_count == 0:
+                datos[columna] = arreglo.chunk(0).to_numpy(zero_copy_only=True)
+            else:
+                datos[columna] = arreglo.to_numpy(zero_copy_only=False)
+
+        # una sola columna de floats se envuelve sin copiar
+        if len(datos) == 1 and next(iter(datos.values())).dtype == np.float64:
+            columna, valores = next(iter(datos.items()))
+            return pd.DataFrame(valores.reshape(-1, 1), index=indice, columns=[columna], copy=False)
+        return pd.DataFrame(datos, index=indice, copy=False)
+
+    def eliminar(self, nombre:str):
+        """
+        Borrar una tabla y su entrada del catalogo.
+        """
+        for ruta in (self._archivo(nombre, 'json'), self._archivo(nombre)):
+            if os.path.exists(ruta):
+                os.remove(ruta)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Cliente asincrono (asyncio + aiohttp) de la API de series del Banco
+Central de Chile.
+
+Todas las solicitudes comparten una sola sesión HTTP (conexiones
+reutilizadas) y un semaforo limita cuantas están en vuelo a la vez, de
+modo que el catalogo completo de exportaciones se descarga desde un solo
+event loop sin ocupar un hilo por solicitud:
+
+    datos = await cliente.get_macro_many(['F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M', ...])
+
+Cada respuesta tiene el mismo formato que `BancoCentralDeChile.get_macro`
+(la lista de observaciones), así que se limpia con `calculos.limpiar_serie`.
+
+Requiere aiohttp, que se importa recién al descargar.
+
+@author: lauta
+"""
+
+import asyncio
+
+
+URL_BCCH = 'https://si3.bcentral.cl/SieteRestWS/SieteRestWS.ashx'
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError as error:
+        raise ImportError('El cliente asincrono requiere aiohttp (pip install aiohttp)') from error
+    return aiohttp
+
+class ErrorBCCh(Exception):
+    """La API respondió con un codigo de error."""
+
+class ClienteBCChAsincrono:
+    """
+    Cliente asincrono de la API del Banco Central.
+
+    Parameters
+    ----------
+    usuario : str
+        Usuario de la API.
+    clave : str
+        Contraseña de la API.
+    url : str, optional
+        Endpoint de la API. The default is URL_BCCH (o el servidor local
+        de servidor_bcch.py para pruebas).
+    concurrencia : int, optional
+        Maximo de solicitudes simultaneas. The default is 100.
+    timeout : int, optional
+        Segundos maximos por solicitud. The default is 300.
+    reintentos : int, optional
+        Intentos ante errores de red antes de fallar. The default is 3.
+
+    """
+
+    def __init__(self, usuario:str, clave:str, url:str=None, concurrencia:int=100,
+                 timeout:int=300, reintentos:int=3):
+        self.usuario = usuario
+        self.clave = clave
+        self.url = url or URL_BCCH
+        self.concurrencia = concurrencia
+        self.timeout = timeout
+        self.reintentos = reintentos
+
+    def sesion(self):
+        """
+        Sesión HTTP con un pool de conexiones del tamaño de la concurrencia.
+        """
+        aiohttp = _aiohttp()
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrencia),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def solicitar(self, sesion, serie:str, firstdate:str=None, lastdate:str=None):
+        """
+        Respuesta completa (JSON) de GetSeries para una serie.
+
+        Parameters
+        ----------
+        sesion : aiohttp.ClientSession
+            Sesión abierta con `sesion()`.
+        serie : str
+            codigo de la serie.
+        firstdate, lastdate : str, optional
+            Rango de fechas 'YYYY-MM-DD'. The default is None (toda la historia).
+
+        Returns
+        -------
+        dict
+            Respuesta de la API.
+
+        """
+        aiohttp = _aiohttp()
+        parametros = {'user': self.usuario, 'pass': self.clave, 'function': 'GetSeries', 'timeseries': serie}
+        if firstdate is not None:
+            parametros['firstdate'] = firstdate
+        if lastdate is not None:
+            parametros['lastdate'] = lastdate
+
+        for intento in range(self.reintentos):
+            try:
+                async with sesion.get(self.url, params=parametros) as respuesta:
+                    respuesta.raise_for_status()
+                    # la API responde text/plain en algunos casos
+                    datos = await respuesta.json(content_type=None)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if intento == self.reintentos - 1:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** intento)
+
+        if datos.get('Codigo') != 0:
+            raise ErrorBCCh(f"{serie}: {datos.get('Descripcion')} Codigo: {datos.get('Codigo')}")
+        return datos
+
+    async def get_macro(self, sesion, serie:str, firstdate:str=None, lastdate:str=None):
+        """
+        Observaciones de una serie, igual que `BancoCentralDeChile.get_macro`.
+        """
+        datos = await self.solicitar(sesion, serie, firstdate, lastdate)
+        return datos['Series']['Obs']
+
+    async def get_macro_many(self, series:list, omitir_errores:bool=False, **fechas):
+        """
+        Observaciones de varias series, descargadas en forma concurrente.
+
+        Parameters
+        ----------
+        series : list
+            codigos de las series.
+        omitir_errores : bool, optional
+            Si es True, las series que fallan no se incluyen en el
+            resultado; si no, se levanta el primer error una vez terminadas
+            todas. The default is False.
+        **fechas
+            firstdate y/o lastdate para todas las series.
+
+        Returns
+        -------
+        dict
+            codigo -> lista de observaciones.
+
+        """
+        series = list(dict.fromkeys(series))
+        semaforo = asyncio.Semaphore(self.concurrencia)
+
+        async with self.sesion() as sesion:
+            async def una(serie):
+                async with semaforo:
+                    return await self.get_macro(sesion, serie, **fechas)
+            resultados = await asyncio.gather(*(una(s) for s in series), return_exceptions=True)
+
+        datos = {}
+        for serie, resultado in zip(series, resultados):
+            if isinstance(resultado, BaseException):
+                if not omitir_errores:
+                    raise resultado
+                continue
+            datos[serie] = resultado
+        return datos
+
+async def get_macro_many(series:list, **opciones):
+    """
+    `ClienteBCChAsincrono.get_macro_many` con el cliente de `clientes.cliente_bcch_asincrono`.
+    """
+    from clientes import cliente_bcch_asincrono
+    return await cliente_bcch_asincrono().get_macro_many(series, **opciones)
+
+def ejecutar(corrutina):
+    """
+    Ejecutar una corrutina desde codigo sincrono.
+
+    Si ya hay un event loop corriendo en este hilo (por ejemplo en la
+    consola de Spyder/IPython), se ejecuta en un hilo aparte.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corrutina)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as hilo:
+        return hilo.submit(asyncio.run, corrutina).result()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Betas de todas las acciones de un mercado contra un indice, calculadas
+localmente desde los precios.
+
+`rendimientos` lleva una tabla fecha x ticker de precios (por ejemplo de
+`precios.PanelPrecios`) a retornos, semanales por defecto, y
+`betas_moviles` estima la regresión de cada ticker contra el indice en
+ventanas moviles para todos los tickers a la vez, con sumas acumuladas en
+el tiempo. `betas` entrega la ultima ventana y, opcionalmente, el beta
+ajustado de Blume o de Vasicek.
+
+@author: lauta
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def rendimientos(precios:pd.DataFrame, frecuencia:str='W-FRI'):
+    """
+    Retornos simples de cada columna al cierre de cada periodo.
+
+    Parameters
+    ----------
+    precios : pd.DataFrame
+        Tabla fecha x ticker.
+    frecuencia : str, optional
+        Periodo de los retornos; None los deja diarios. The default is
+        'W-FRI' (semanales, al cierre del viernes).
+
+    Returns
+    -------
+    pd.DataFrame
+
+    """
+    if frecuencia is not None:
+        precios = precios.resample(frecuencia).last()
+    return precios.pct_change(fill_method=None).iloc[1:]
+
+def betas_moviles(rendimientos_:pd.DataFrame, mercado, window:int, min_obs:int=None):
+    """
+    Beta de cada ticker contra el mercado en ventanas moviles.
+
+    Parameters
+    ----------
+    rendimientos_ : pd.DataFrame
+        Retornos fecha x ticker.
+    mercado : str | pd.Series
+        Columna de `rendimientos_` con el indice, o sus retornos.
+    window : int
+        Numero de periodos de cada ventana.
+    min_obs : int, optional
+        Minimo de periodos con datos del ticker y del mercado dentro de la
+        ventana. The default is None (la ventana completa).
+
+    Returns
+    -------
+    dict
+        'beta', 'error' (error estandar del beta) y 'n': DataFrames fecha
+        x ticker.
+
+    """
+    min_obs = window if min_obs is None else min_obs
+    if isinstance(mercado, str):
+        rendimientos_, mercado = rendimientos_.drop(columns=mercado), rendimientos_[mercado]
+    mercado = mercado.reindex(rendimientos_.index)
+
+    y = rendimientos_.to_numpy(dtype=float)
+    x = mercado.to_numpy(dtype=float)[:, None]
+    mascara = ~np.isnan(y) & ~np.isnan(x)
+    y = np.where(mascara, y, 0.0)
+    x = np.where(mascara, x, 0.0)
+
+    def movil(a):
+        acumulada = np.cumsum(a, axis=0)
+        acumulada[window:] = acumulada[window:] - acumulada[:-window]
+        return acumulada
+
+    n = movil(mascara.astype(float))
+    sx, sy = movil(x), movil(y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = movil(x**2) - sx**2 / n
+        syy = movil(y**2) - sy**2 / n
+        sxy = movil(x * y) - sx * sy / n
+        beta = sxy / sxx
+        residuos = np.clip(syy - beta * sxy, 0, None) / (n - 2)
+        error = np.sqrt(residuos / sxx)
+    invalidas = n < max(min_obs, 3)
+
+    def tabla(valores):
+        return pd.DataFrame(np.where(invalidas, np.nan, valores), index=rendimientos_.index, columns=rendimientos_.columns)
+    return {'beta': tabla(beta), 'error': tabla(error), 'n': tabla(n)}
+
+def blume(beta):
+    """Beta ajustado de Blume: 2/3 del beta estimado y 1/3 del beta del mercado."""
+    return 0.67 * beta + 0.33
+
+def vasicek(beta:pd.Series, error:pd.Series, prior:float=None, varianza_prior:float=None):
+    """
+    Beta ajustado de Vasicek: promedio del beta estimado y del beta del
+    grupo, ponderado por la precisión de cada uno.
+
+    Parameters
+    ----------
+    beta, error : pd.Series
+        Beta estimado de cada ticker y su error estandar.
+    prior : float, optional
+        Beta del grupo. The default is None (media de corte transversal).
+    varianza_prior : float, optional
+        Varianza del beta del grupo. The default is None (varianza de corte
+        transversal).
+
+    Returns
+    -------
+    pd.Series
+
+    """
+    prior = beta.mean() if prior is None else prior
+    varianza_prior = beta.var() if varianza_prior is None else varianza_prior
+    peso = varianza_prior / (varianza_prior + error**2)
+    return peso * beta + (1 - peso) * prior
+
+def betas(rendimientos_:pd.DataFrame, mercado, window:int=None, min_obs:int=26, ajuste:str=None):
+    """
+    Beta de cada ticker en la ultima ventana.
+
+    Parameters
+    ----------
+    rendimientos_ : pd.DataFrame
+        Retornos fecha x ticker.
+    mercado : str | pd.Series
+        Columna de `rendimientos_` con el indice, o sus retornos.
+    window : int, optional
+        Numero de periodos de la ventana. The default is None (toda la
+        muestra).
+    min_obs : int, optional
+        Minimo de periodos con datos. The default is 26 (medio año de
+        retornos semanales).
+    ajuste : str, optional
+        'blume' o 'vasicek' agregan la columna 'beta_ajustado'. The
+        default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por ticker con beta, error y n.
+
+    """
+    window = len(rendimientos_) if window is None else min(window, len(rendimientos_))
+    moviles = betas_moviles(rendimientos_, mercado, window, min_obs)
+    tabla = pd.DataFrame({nombre: valores.iloc[-1] for nombre, valores in moviles.items()})
+    if ajuste == 'blume':
+        tabla['beta_ajustado'] = blume(tabla['beta'])
+    elif ajuste == 'vasicek':
+        tabla['beta_ajustado'] = vasicek(tabla['beta'], tabla['error'])
+    elif ajuste is not None:
+        raise ValueError(f"Ajuste desconocido {ajuste}, los validos son 'blume' y 'vasicek'")
+    return tabla
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Calculos compartidos por los scripts: limpieza de series, porciones,
+ROIC y valorización por flujos descontados.
+
+Este modulo solo depende de pandas y numpy, de modo que refrescar tablas
+no requiere cargar herramientas de graficos ni de estadistica. El filtro
+de Hodrick-Prescott está en `tendencia`.
+
+@author: lauta
+"""
+
+import math
+
+import pandas as pd
+import numpy as np
+
+
+#%% Limpieza de datos
+
+def _fechas_bcch(fechas:list):
+    """
+    Convertir fechas 'dd-mm-YYYY' a datetime64 sin pasar por objetos de Python.
+
+    Las fechas se unen en un solo bloque de bytes y los digitos de dia, mes
+    y año se leen como enteros en forma vectorizada. Si algun texto no
+    tiene ese formato exacto se ocupa `pd.to_datetime`.
+    """
+    n = len(fechas)
+    try:
+        bruto = np.frombuffer(''.join(fechas).encode('ascii'), dtype=np.uint8)
+    except (TypeError, UnicodeEncodeError):
+        bruto = None
+    if bruto is None or bruto.size != 10 * n:
+        return pd.DatetimeIndex(pd.to_datetime(fechas, format='%d-%m-%Y'))
+
+    bruto = bruto.reshape(n, 10)
+    digitos = bruto[:, [0, 1, 3, 4, 6, 7, 8, 9]].astype(np.int32) - ord('0')
+    dia = digitos[:, 0] * 10 + digitos[:, 1]
+    mes = digitos[:, 2] * 10 + digitos[:, 3]
+    anio = digitos[:, 4] * 1000 + digitos[:, 5] * 100 + digitos[:, 6] * 10 + digitos[:, 7]
+    validas = (
+        (bruto[:, 2] == ord('-')) & (bruto[:, 5] == ord('-')) &
+        ((digitos >= 0) & (digitos <= 9)).all(axis=1) &
+        (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= 31)
+        )
+    if not validas.all():
+        return pd.DatetimeIndex(pd.to_datetime(fechas, format='%d-%m-%Y'))
+
+    meses = ((anio - 1970) * 12 + mes - 1).astype('datetime64[M]')
+    fecha = meses.astype('datetime64[D]') + (dia - 1)
+    # dias que no existen en el mes (ej. 31-04) se informan igual que pandas
+    if (fecha.astype('datetime64[M]') != meses).any():
+        return pd.DatetimeIndex(pd.to_datetime(fechas, format='%d-%m-%Y'))
+    return pd.DatetimeIndex(fecha.astype('datetime64[ns]'))
+
+def limpiar_serie(datos:list):
+    """
+    Transformar la respuesta de `get_macro` en un DataFrame indexado por fecha.
+
+    Las fechas y los valores se convierten directamente a datetime64 y
+    float64, sin columnas intermedias de objetos.
+
+    Parameters
+    ----------
+    datos : list
+        Observaciones entregadas por la API del Banco Central.
+
+    Returns
+    -------
+    serie_ : pd.DataFrame
+        Serie con la columna 'value' numerica y el indice de fechas.
+
+    """
+    fechas = [obs['indexDateString'] for obs in datos]
+    valores = [obs['value'] for obs in datos]
+    try:
+        valores = np.array(valores, dtype=float)
+    except (TypeError, ValueError):
+        # textos no numericos quedan como NaN
+        valores = pd.to_numeric(pd.Series(valores, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+    indice = _fechas_bcch(fechas)
+    indice.name = 'indexDateString'
+    return pd.DataFrame({'value': valores}, index=indice)
+
+def acumular(serie_:pd.DataFrame, rolling_:bool=True, window:int=12, operacion_:str='sum',
+             almacen=None, clave:str=None):
+    """
+    Seguimiento anual (o de la ventana solicitada) de una serie.
+
+    Parameters
+    ----------
+    serie_ : pd.DataFrame
+        Serie limpia.
+    rolling_ : bool, optional
+        Seguimiento anual?. The default is True.
+    window : int
+        Numero de periodos para el calculo
+    operacion_ : str, optional
+        'sum' o 'mean'. The default is 'sum'.
+    almacen : ventanas.AlmacenVentanas, optional
+        Si se entrega, solo se calculan los periodos nuevos de la serie.
+    clave : str, optional
+        Identificador de la serie dentro del almacen.
+
+    Returns
+    -------
+    pd.DataFrame
+        Serie acumulada en la ventana.
+
+    """
+    if not rolling_:
+        return serie_
+    if operacion_ not in ('sum', 'mean'):
+        raise ValueError("Los unicos valores validos para la operacion son 'sum' y 'mean'")
+    if almacen is not None:
+        return almacen.acumular(clave, serie_, window=window, operacion=operacion_)
+    if operacion_ == 'sum':
+        return serie_.rolling(window=window).sum()
+    return serie_.rolling(window=window).mean()
+
+def remuestrear(serie_:pd.DataFrame, resam:str=None, operations:list=None):
+    """
+    Remuestrear una serie con una o varias operaciones de agregación.
+
+    Parameters
+    ----------
+    serie_ : pd.DataFrame
+        Serie limpia.
+    resam : str
+        frecuencia para el resampling.
+    operations : list
+        operación(es) para agregar los datos resampliandos.
+
+    Returns
+    -------
+    pd.DataFrame
+        serie lista para ocupar.
+
+    """
+    if resam is None:
+        return serie_
+    if operations is None:
+        raise ValueError('Se debe indicar la(s) operacion(es) para el remuestreo')
+    serie_ = serie_.resample(resam).agg(operations)
+    # renombrar las columnas
+    serie_.columns = ['_'.join(x) for x in serie_.columns]
+    return serie_
+
+# ultimo segmento de los codigos del BCCh: Diaria, Mensual, Trimestral, Anual
+_FRECUENCIAS_BCCH = {'D': 'D', 'M': 'M', 'T': 'Q', 'A': 'A'}
+
+def frecuencia_nativa(codigo:str=None, serie_:pd.DataFrame=None):
+    """
+    Frecuencia de publicación de una serie: 'D', 'M', 'Q' o 'A'.
+
+    Parameters
+    ----------
+    codigo : str, optional
+        codigo BCCh de la serie, su ultimo segmento indica la frecuencia.
+    serie_ : pd.DataFrame, optional
+        Datos de la serie, para inferir la frecuencia si el codigo no la indica.
+
+    Returns
+    -------
+    str | None
+        Frecuencia, o None si no se puede determinar.
+
+    """
+    if codigo is not None:
+        frecuencia = _FRECUENCIAS_BCCH.get(codigo.rsplit('.', 1)[-1])
+        if frecuencia is not None:
+            return frecuencia
+    if serie_ is None or len(serie_.index) < 3:
+        return None
+    # mediana de dias entre observaciones, robusta a feriados y meses de distinto largo
+    dias = np.median(np.diff(serie_.index.values).astype('timedelta64[D]').astype(float))
+    if dias < 7:
+        return 'D'
+    if dias < 45:
+        return 'M'
+    if dias < 135:
+        return 'Q'
+    return 'A'
+
+def _a_numerico(columna:pd.Series):
+    """Columna numerica si todos sus valores lo son; si no, la misma columna."""
+    try:
+        return pd.to_numeric(columna)
+    except (ValueError, TypeError):
+        return columna
+
+def normalizar_fundamentales(datos:dict, delete_extras:bool=True, resample_:bool=False,
+                             almacen=None, clave:str=None):
+    """
+    Dejar los estados financieros trimestrales de EOD en base TTM.
+
+    Parameters
+    ----------
+    datos : dict
+        Respuesta de `get_fundamental_equity` para un estado financiero.
+    delete_extras : bool, optional
+        Borrar los campos inncesarios para el analisis. The default is True.
+    resample_ : bool, optional
+        Remuestrar a una frecuencia anual?. The default is False.
+    almacen : ventanas.AlmacenVentanas, optional
+        Si se entrega, el TTM solo se calcula para los trimestres nuevos.
+    clave : str, optional
+        Identificador del estado financiero dentro del almacen.
+
+    Returns
+    -------
+    temp_ : pd.DataFrame
+        Datos financieros fundamentales para la acción en una base TTM.
+
+    """
+    temp_ = pd.DataFrame(datos).T[::-1]
+
+    # borrar la moneda de la accion y la fecha de subida del informe
+    if delete_extras:
+        temp_ = temp_.drop(['currency_symbol', 'filing_date'], axis=1)
+
+    # hacer del index la fecha
+    temp_['date'] = pd.to_datetime(temp_['date'])
+    temp_.set_index('date', inplace=True)
+
+    # Todos los datos a numerico (las columnas de texto quedan como están)
+    temp_ = temp_.apply(_a_numerico)
+
+    # calcular en base a TTM
+    if almacen is not None:
+        temp_ = almacen.acumular(clave, temp_.select_dtypes('number'), window=4, operacion='sum')
+    else:
+        temp_ = temp_.rolling(window=4, min_periods=4).sum()
+
+    if resample_:
+        temp_ = temp_.resample(pd.offsets.YearEnd()).sum()
+
+    return temp_
+
+def normalizar_precios(data:dict, columna_tiempo:str='date'):
+    """
+    Normalizar los datos de precios para el instrumento solicitado
+
+    Parameters
+    ----------
+    data : dict
+        Precios del instrumento en base OHLCV.
+    columna_tiempo : str, optional
+        Nombre de columna de tiempo. The default is 'date'.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Datos normalizados.
+
+    """
+    data = pd.DataFrame(data)
+    # transformar a tiempo
+    data[columna_tiempo] = pd.to_datetime(data[columna_tiempo])
+    # incorporarlo como indice
+    data.set_index(columna_tiempo, inplace=True)
+    return data
+
+#%% Composición de las exportaciones
+
+def porcion(tabla:pd.DataFrame, total:str):
+    """
+    Porcentaje de cada columna respecto a la columna del total.
+
+    Parameters
+    ----------
+    tabla : pd.DataFrame
+        Series de una categoria, incluyendo su total.
+    total : str
+        Nombre de la columna con el total.
+
+    Returns
+    -------
+    pd.DataFrame
+        Porcentajes (%) para cada periodo.
+
+    """
+    return tabla.divide(tabla[total], axis=0) * 100
+
+def pareto(ultimo:pd.Series):
+    """
+    Tabla de Pareto para el último dato reportado.
+
+    Parameters
+    ----------
+    ultimo : pd.Series
+        Valores de cada subserie en el último periodo.
+
+    Returns
+    -------
+    pareto_ : pd.DataFrame
+        Valores ordenados de manera descendente y su porcentaje acumulado.
+
+    """
+    pareto_ = pd.DataFrame(
+        data=ultimo.values,
+        columns=['count'],
+        index=ultimo.index
+        )
+    # ordenarlas de manera descendente
+    pareto_ = pareto_.sort_values(by='count', ascending=False)
+    # añadir una columna del porcentaje acumulado
+    pareto_['cumperc'] = pareto_['count'].cumsum() / pareto_['count'].sum() * 100
+    return pareto_
+
+def ajuste_lineal(x:np.ndarray, y:np.ndarray):
+    """
+    Regresión lineal simple y su coeficiente de determinación.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Variable explicativa.
+    y : np.ndarray
+        Variable explicada.
+
+    Returns
+    -------
+    modelo : np.poly1d
+        Recta ajustada.
+    r_2 : float
+        R2 del ajuste.
+
+    """
+    modelo = np.poly1d(np.polyfit(x, y, 1))
+    residuos = y - modelo(x)
+    r_2 = 1 - np.sum(residuos**2) / np.sum((y - np.mean(y))**2)
+    return modelo, r_2
+
+#%% Rentabilidad
+
+def roic(inc_:pd.DataFrame, bs_:pd.DataFrame, sector:str, roe:float, tasa_impuestos:float=0.27):
+    """
+    ROIC = NOPAT / Capital invertido promedio = (EBIT*(1-tax)) / (Activos fijos + Capital de trabajo)
+
+    Parameters
+    ----------
+    inc_ : pd.DataFrame
+        Estado de resultados en base TTM.
+    bs_ : pd.DataFrame
+        Balance en base TTM.
+    sector : str
+        Sector de la empresa. Para 'Financial Services' se ocupa el ROE.
+    roe : float
+        Retorno sobre el patrimonio de la empresa.
+    tasa_impuestos : float, optional
+        Tasa a ocupar si la empresa no reporta impuestos. The default is 0.27.
+
+    Returns
+    -------
+    float
+        ROIC promedio del último año.
+
+    """
+    if sector == 'Financial Services':
+        return roe
+
+    taxes = (inc_['incomeTaxExpense'] / inc_['incomeBeforeTax']).iloc[-4:].mean()
+    if math.isnan(taxes):
+        taxes = tasa_impuestos # https://tradingeconomics.com/chile/corporate-tax-rate
+    capital = (bs_.netWorkingCapital + bs_.nonCurrentAssetsTotal).rolling(window=4).mean()
+    if math.isnan(capital.iloc[-1]):
+        capital = bs_.netInvestedCapital.rolling(window=4).mean()
+
+    return ((inc_['incomeBeforeTax']*(1-taxes)) / capital).iloc[-4:].mean()
+
+#%% Valorización por flujos de caja descontados (Damodaran)
+
+def valor_pte_flujos(flujos_proyectados:list, periodos:int, tasa_dcto:float):
+    """
+    Calculo del valor presente de una serie de datos
+
+    Parameters
+    ----------
+    flujos_proyectados : list
+        Flujos de caja libre proyectados para la accion.
+    periodos : int
+        Numero de años a proyectar el flujo de caja.
+    tasa_dcto : float
+        Tasa de descuento.
+
+    Returns
+    -------
+    float
+        Suma del valor presente de los flujos de caja proyectados.
+
+    """
+    ffc_proyectados = [ flujos_proyectados[i-1]/( (1+tasa_dcto)**i ) for i in range(1, periodos) ]
+    return sum(ffc_proyectados)
+
+def porcentaje_accion(ref1, ref2):
+    return round(((ref1 - ref2) / ref2)*100, 2)
+
+def margen_ebitda(inc_:pd.DataFrame):
+    """
+    Paso 1: margen operacional antes de impuestos (EBITDA margin) promedio.
+    """
+    ebitda = inc_['netIncome'] + inc_['depreciationAndAmortization'] +\
+        inc_['interestExpense'] + inc_['incomeTaxExpense']
+    return (ebitda / inc_['totalRevenue']).mean()
+
+def tasa_libre_riesgo_local(r_f_us:float, exp_inf_cl:float, exp_inf_us:float):
+    """
+    Tasa libre de riesgo local transformada (pagina 159 libro damodoran).
+    """
+    return ((1+r_f_us) * ((1+exp_inf_cl) / (1+exp_inf_us))) - 1
+
+def costo_capital(r_f:float, r_e:float, beta:float, de:float, spread:float, tasa_impuestos:float):
+    """
+    Paso 2: costo de capital para la firma.
+
+    Parameters
+    ----------
+    r_f : float
+        Tasa libre de riesgo local.
+    r_e : float
+        Retorno esperado del mercado.
+    beta : float
+        Beta de la acción.
+    de : float
+        Razón deuda / patrimonio.
+    spread : float
+        Spread de la deuda soberana (decimal).
+    tasa_impuestos : float
+        Tasa de impuestos corporativos.
+
+    Returns
+    -------
+    float
+        Costo de capital ponderado.
+
+    """
+    cost_of_equity = r_f + beta * (r_e - r_f)
+    cost_of_debt = r_f + spread
+    return cost_of_equity * (1 - de) + cost_of_debt * (1-tasa_impuestos) * de
+
+def retorno_capital(inc_:pd.DataFrame, bs_:pd.DataFrame, tasa_impuestos:float):
+    """
+    Paso 3: retorno sobre el capital invertido (ROC) promedio.
+    """
+    nopat = inc_['ebit'] * (1-tasa_impuestos)
+    invested_capital = (bs_['netReceivables'] + bs_['inventory'] - bs_['accountsPayable']) +\
+        bs_['propertyPlantAndEquipmentNet'] + bs_['goodWill'] + bs_['otherAssets']
+    return np.mean(nopat / invested_capital)
+
+def valor_activos_operativos(margen:float, ingresos:float, crecimiento:float, tasa_impuestos:float,
+                             tasa_reinversion:float, costo_capital:float):
+    """
+    Paso 4: valor de los activos operativos con ingresos operacionales normalizados.
+    """
+    normalized_op_income = margen * ingresos
+    return (normalized_op_income * (1+crecimiento)*(1-tasa_impuestos)*(1-tasa_reinversion)) /\
+        (costo_capital - crecimiento)
+
+def valor_por_accion(value_op_assets:float, cash:float, non_op_assets:float, total_debt:float,
+                     minority_interest:float, available_shares:float):
+    """
+    Paso 5: valor intrinseco por accion.
+    """
+    return (value_op_assets + cash + non_op_assets - total_debt - minority_interest) / available_shares
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecución incremental de las celdas de los scripts.
+
+Cada celda es una función que declara las series del Banco Central que
+ocupa y las celdas de las que depende. Su resultado se guarda junto a una
+huella (hash) del codigo de la función (y de las funciones del
+repositorio que ocupa), de los datos de sus series y de las huellas de
+las celdas anteriores; al ejecutar nuevamente, solo se recalculan las
+celdas cuya huella cambió. Así una nueva publicación de las
+exportaciones recalcula las celdas de exportaciones, pero no las que
+dependen de otras series.
+
+@author: lauta
+"""
+
+import os
+import pickle
+import hashlib
+import inspect
+
+import pandas as pd
+
+from clientes import directorio_cache, temporal
+
+
+def huella_datos(tabla:pd.DataFrame):
+    """
+    Hash del contenido de una tabla (indice, columnas y valores).
+
+    Parameters
+    ----------
+    tabla : pd.DataFrame
+        Datos a resumir.
+
+    Returns
+    -------
+    str
+        Huella hexadecimal.
+
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(list(tabla.columns)).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(tabla, index=True).values.tobytes())
+    return h.hexdigest()
+
+# solo el codigo de los modulos de este directorio entra en la huella
+_DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+def _propio(objeto):
+    """Función, clase o modulo definido en los scripts del repositorio?"""
+    try:
+        archivo = inspect.getsourcefile(objeto)
+    except TypeError:
+        return False
+    return archivo is not None and os.path.dirname(os.path.abspath(archivo)) == _DIRECTORIO
+
+def _fuente(objeto):
+    try:
+        return inspect.getsource(objeto).encode('utf-8')
+    except (OSError, TypeError):
+        codigo = getattr(objeto, '__code__', None)
+        if codigo is None:
+            return repr(objeto).encode('utf-8')
+        return codigo.co_code + repr(codigo.co_consts).encode('utf-8')
+
+def _nombres(codigo):
+    """Nombres globales que ocupa un bytecode, incluidas sus funciones internas."""
+    nombres = set(codigo.co_names)
+    for constante in codigo.co_consts:
+        if inspect.iscode(constante):
+            nombres |= _nombres(constante)
+    return nombres
+
+def _dependencias(objeto):
+    """Funciones, clases y modulos propios a los que hace referencia `objeto`."""
+    if inspect.isclass(objeto):
+        funciones = []
+        for miembro in vars(objeto).values():
+            miembro = getattr(miembro, '__func__', getattr(miembro, 'fget', miembro))
+            if inspect.isfunction(miembro):
+                funciones.append(miembro)
+    elif inspect.isfunction(objeto):
+        funciones = [objeto]
+    else:
+        return []
+    dependencias = []
+    for funcion in funciones:
+        globales = funcion.__globals__
+        for nombre in sorted(_nombres(funcion.__code__)):
+            valor = globales.get(nombre)
+            if valor is not None and (inspect.isfunction(valor) or inspect.isclass(valor)
+                                      or inspect.ismodule(valor)) and _propio(valor):
+                dependencias.append(inspect.unwrap(valor) if inspect.isfunction(valor) else valor)
+    return dependencias
+
+def huella_codigo(funcion):
+    """
+    Hash del codigo fuente de una función y de lo que ocupa del repositorio.
+
+    Se recorren las funciones y clases de los scripts a las que hace
+    referencia (p.ej. `pareto`, `panel`, `filtro_hp`) y, recursivamente,
+    las que ocupan estas; de los modulos propios usados como `modulo.f`
+    entra el archivo completo. Así un cambio en una función auxiliar
+    invalida el resultado guardado de las celdas que la ocupan.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    pendientes, vistos = [inspect.unwrap(funcion)], set()
+    while pendientes:
+        objeto = pendientes.pop()
+        if id(objeto) in vistos:
+            continue
+        vistos.add(id(objeto))
+        h.update(_fuente(objeto))
+        pendientes.extend(reversed(_dependencias(objeto)))
+    return h.hexdigest()
+
+class Celda:
+    """
+    Paso de calculo con sus series y celdas de entrada.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la celda (y de su resultado).
+    funcion : callable
+        Recibe como argumentos con nombre sus series y los resultados de
+        las celdas de entrada.
+    series : dict
+        nombre del argumento -> codigo de la serie, o (codigo, opciones)
+        con las opciones para la función de carga.
+    entradas : list
+        Nombres de las celdas de las que depende.
+
+    """
+
+    def __init__(self, nombre:str, funcion, series:dict=None, entradas:list=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.series = series or {}
+        self.entradas = list(entradas or [])
+
+    def codigos(self):
+        """Codigos de las series del Banco Central que ocupa la celda."""
+        return [s if isinstance(s, str) else s[0] for s in self.series.values()]
+
+class Grafo:
+    """
+    Conjunto de celdas y su cache de resultados.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre del grafo (carpeta del cache).
+    cargar : callable
+        cargar(codigo, **opciones) -> pd.DataFrame con los datos de una serie.
+    ruta : str, optional
+        Carpeta donde se guardan los resultados. The default is
+        'celdas/<nombre>' en el directorio de cache.
+    precargar : callable, optional
+        precargar(codigos) descarga de una vez todas las series que se
+        van a ocupar antes de ejecutar las celdas. The default is None.
+
+    """
+
+    def __init__(self, nombre:str, cargar, ruta:str=None, precargar=None):
+        self.nombre = nombre
+        self.cargar = cargar
+        self.precargar = precargar
+        self.ruta = ruta or os.path.join(directorio_cache(), 'celdas', nombre)
+        self.celdas = {}
+        self.recalculadas = []
+
+    def celda(self, series:dict=None, entradas:list=None, nombre:str=None):
+        """
+        Decorador para registrar una función como celda.
+        """
+        def registrar(funcion):
+            nombre_ = nombre or funcion.__name__
+            for entrada in entradas or []:
+                if entrada not in self.celdas:
+                    raise ValueError(f"La celda '{nombre_}' depende de '{entrada}', que no está registrada")
+            self.celdas[nombre_] = Celda(nombre_, funcion, series, entradas)
+            return funcion
+        return registrar
+
+    def orden(self, nombres:list=None):
+        """
+        Celdas necesarias para obtener `nombres`, en orden de ejecución.
+
+        Parameters
+        ----------
+        nombres : list, optional
+            Celdas solicitadas. The default is None (todas).
+
+        Returns
+        -------
+        list
+            Nombres de las celdas, cada una despues de sus entradas.
+
+        """
+        nombres = list(self.celdas) if nombres is None else list(nombres)
+        orden_, vistas = [], set()
+
+        def visitar(nombre):
+            if nombre in vistas:
+                return
+            if nombre not in self.celdas:
+                raise KeyError(f"No existe la celda '{nombre}'")
+            vistas.add(nombre)
+            for entrada in self.celdas[nombre].entradas:
+                visitar(entrada)
+            orden_.append(nombre)
+
+        for nombre in nombres:
+            visitar(nombre)
+        return orden_
+
+    def series(self, nombres:list=None):
+        """
+        Codigos de las series que ocupan las celdas `nombres` y sus entradas.
+        """
+        return sorted({c for nombre in self.orden(nombres) for c in self.celdas[nombre].codigos()})
+
+    def _archivo(self, nombre:str):
+        return os.path.join(self.ruta, f'{nombre}.pkl')
+
+    def _leer(self, nombre:str):
+        try:
+            with open(self._archivo(nombre), 'rb') as archivo:
+                return pickle.load(archivo)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _escribir(self, nombre:str, huella:str, resultado):
+        os.makedirs(self.ruta, exist_ok=True)
+        temporal_ = temporal(self._archivo(nombre))
+        with open(temporal_, 'wb') as archivo:
+            pickle.dump({'huella': huella, 'resultado': resultado}, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal_, self._archivo(nombre))
+
+    def _cargar_series(self, celda:Celda):
+        datos, huellas = {}, []
+        for argumento, serie in celda.series.items():
+            codigo, opciones = (serie, {}) if isinstance(serie, str) else serie
+            datos[argumento] = self.cargar(codigo, **opciones)
+            huellas.append(f'{argumento}={codigo}{sorted(opciones.items())}:{huella_datos(datos[argumento])}')
+        return datos, huellas
+
+    def ejecutar_celda(self, nombre:str, huellas_entradas:dict, resultados:dict, forzar:bool=False):
+        """
+        Ejecutar (o recuperar del cache) una celda cuyas entradas ya están calculadas.
+
+        Returns
+        -------
+        tuple
+            (huella, resultado) de la celda.
+
+        """
+        celda = self.celdas[nombre]
+        series, huellas = self._cargar_series(celda)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(huella_codigo(celda.funcion).encode('utf-8'))
+        for parte in huellas + [f'{e}:{huellas_entradas[e]}' for e in celda.entradas]:
+            h.update(parte.encode('utf-8'))
+        huella = h.hexdigest()
+
+        guardado = None if forzar else self._leer(nombre)
+        if guardado is not None and guardado['huella'] == huella:
+            return huella, guardado['resultado']
+
+        argumentos = dict(series)
+        argumentos.update({e: resultados[e] for e in celda.entradas})
+        resultado = celda.funcion(**argumentos)
+        self._escribir(nombre, huella, resultado)
+        self.recalculadas.append(nombre)
+        return huella, resultado
+
+    def ejecutar(self, nombres:list=None, forzar:bool=False):
+        """
+        Resultados de las celdas solicitadas, recalculando solo las que cambiaron.
+
+        Parameters
+        ----------
+        nombres : list, optional
+            Celdas solicitadas (y sus entradas). The default is None (todas).
+        forzar : bool, optional
+            Recalcular aunque la huella no haya cambiado. The default is False.
+
+        Returns
+        -------
+        dict
+            nombre de la celda -> resultado.
+
+        """
+        self.recalculadas = []
+        if self.precargar is not None:
+            self.precargar(self.series(nombres))
+        huellas, resultados = {}, {}
+        for nombre in self.orden(nombres):
+            huellas[nombre], resultados[nombre] = self.ejecutar_celda(nombre, huellas, resultados, forzar)
+        return resultados
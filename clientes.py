@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Clientes de las APIs (Banco Central, EOD Historical Data y FRED) y rutas
+locales de trabajo.
+
+Los clientes se crean recién cuando se solicitan por primera vez, así los
+procesos que solo calculan con datos locales no pagan el costo de importar
+ni de autenticarse contra las APIs.
+
+Las respuestas de EOD y FRED quedan guardadas como instantáneas
+(instantaneas.py). Con la variable EXPORTACIONES_FECHA=YYYY-MM-DD los
+clientes responden con las instantáneas vigentes a esa fecha, sin red, y
+los estados locales se guardan aparte en 'al/<fecha>' del cache.
+
+@author: lauta
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def cliente_bcch():
+    """
+    Instancia (única por proceso) del cliente del Banco Central de Chile.
+
+    Returns
+    -------
+    BancoCentralDeChile
+        cliente autenticado con las variables de entorno BCCH_USER y BCCH_PWD.
+
+    """
+    from bcch import BancoCentralDeChile
+    # Por seguridad, es mejor guardar las contraseñas y usuarios en las variables de entorno
+    return BancoCentralDeChile(os.environ['BCCH_USER'], os.environ['BCCH_PWD'])
+
+
+@lru_cache(maxsize=None)
+def cliente_bcch_asincrono():
+    """
+    Instancia (única por proceso) del cliente asincrono del Banco Central.
+
+    Returns
+    -------
+    bcch_asincrono.ClienteBCChAsincrono
+        cliente con las credenciales de BCCH_USER y BCCH_PWD. La variable
+        BCCH_URL permite apuntarlo al servidor local de servidor_bcch.py.
+
+    """
+    from bcch_asincrono import ClienteBCChAsincrono
+    return ClienteBCChAsincrono(
+        os.environ['BCCH_USER'], os.environ['BCCH_PWD'], url=os.environ.get('BCCH_URL')
+        )
+
+
+@lru_cache(maxsize=None)
+def cliente_eod():
+    """
+    Instancia (única por proceso) del cliente de EOD Historical Data.
+
+    Returns
+    -------
+    instantaneas.ClienteCapturado
+        EodHistoricalData autenticado con la variable de entorno API_EOD,
+        que guarda cada respuesta como instantánea.
+
+    """
+    from instantaneas import ClienteCapturado
+    if fecha_consulta() is not None:
+        return ClienteCapturado(None, 'eod')
+    from eod import EodHistoricalData
+    return ClienteCapturado(EodHistoricalData(os.environ['API_EOD']), 'eod')
+
+
+@lru_cache(maxsize=None)
+def cliente_fred():
+    """
+    Modulo fredpy configurado con la clave de la variable de entorno API_FRED.
+
+    Returns
+    -------
+    instantaneas.ClienteCapturado
+        fredpy listo para solicitar series, que guarda cada respuesta como
+        instantánea.
+
+    """
+    from instantaneas import ClienteCapturado
+    if fecha_consulta() is not None:
+        return ClienteCapturado(None, 'fred')
+    import fredpy as fp
+    fp.api_key = os.environ['API_FRED']
+    return ClienteCapturado(fp, 'fred')
+
+
+def fecha_consulta():
+    """
+    Fecha a la que está fijada la ejecución (variable EXPORTACIONES_FECHA).
+
+    Returns
+    -------
+    pd.Timestamp | None
+        None si la ejecución ocupa los datos de hoy.
+
+    """
+    fecha = os.environ.get('EXPORTACIONES_FECHA')
+    if not fecha:
+        return None
+    import pandas as pd
+    return pd.Timestamp(fecha).normalize()
+
+
+def hoy():
+    """
+    Fecha de la ejecución: la fecha fijada o, si no hay, la de hoy.
+    """
+    import pandas as pd
+    fecha = fecha_consulta()
+    return pd.Timestamp.today().normalize() if fecha is None else fecha
+
+
+def directorio_base():
+    """
+    Carpeta de cache compartida por todas las fechas de consulta.
+
+    Returns
+    -------
+    str
+        Ruta de la variable de entorno EXPORTACIONES_CACHE, o la carpeta
+        'cache' junto a los scripts. Se crea si no existe.
+
+    """
+    ruta = os.environ.get(
+        'EXPORTACIONES_CACHE',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+        )
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def directorio_cache():
+    """
+    Carpeta donde se guardan los datos y estados entre ejecuciones.
+
+    Returns
+    -------
+    str
+        `directorio_base()`, o 'al/<fecha>' dentro de ella si la ejecución
+        está fijada a una fecha. Se crea si no existe.
+
+    """
+    ruta = directorio_base()
+    fecha = fecha_consulta()
+    if fecha is not None:
+        ruta = os.path.join(ruta, 'al', fecha.strftime('%Y-%m-%d'))
+        os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def temporal(ruta:str):
+    """
+    Archivo temporal propio del proceso y del hilo para escribir `ruta` y
+    luego reemplazarla con `os.replace`.
+    """
+    return f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+@contextmanager
+def candado_archivo(ruta:str):
+    """
+    Bloqueo exclusivo de `ruta` entre procesos (sobre '<ruta>.lock').
+
+    Los estados del cache que escriben varias etapas a la vez (ventanas,
+    panel de precios) se leen, se combinan y se guardan dentro del bloqueo.
+    """
+    with open(ruta + '.lock', 'a+b') as archivo:
+        if os.name == 'nt':
+            import msvcrt
+            archivo.seek(0)
+            while True:
+                try:
+                    # LK_LOCK reintenta 10 veces (un segundo) antes de fallar
+                    msvcrt.locking(archivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                archivo.seek(0)
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Matrices de covarianza y correlación moviles entre muchas series.
+
+`CovarianzaMovil` mantiene las sumas de una ventana de observaciones y se
+actualiza agregando la fecha nueva y quitando la que sale de la ventana,
+en vez de recalcular cada ventana desde cero. Cada pareja ocupa solo las
+fechas en que ambas series tienen datos. `correlaciones_moviles` recorre
+una tabla completa y entrega un arreglo fecha x serie x serie.
+
+@author: lauta
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class CovarianzaMovil:
+    """
+    Covarianzas y correlaciones de una ventana movil de `window` fechas.
+
+    Parameters
+    ----------
+    window : int
+        Numero de fechas de la ventana.
+    centro : np.ndarray
+        Valor que se resta a cada serie antes de sumar (por ejemplo su
+        media historica), para no perder precisión con series de nivel
+        alto como el dolar o el IPSA.
+    refresco : int, optional
+        Cada cuantas actualizaciones se recalculan las sumas desde la
+        ventana, para que no se acumule el error de redondeo. The default
+        is 1000.
+
+    """
+
+    def __init__(self, window:int, centro:np.ndarray, refresco:int=1000):
+        self.window = window
+        self.centro = np.asarray(centro, dtype=float)
+        self.refresco = refresco
+        self.ventana = deque()
+        self.actualizaciones = 0
+        p = len(self.centro)
+        self.n = np.zeros((p, p))
+        self.s = np.zeros((p, p))      # suma de x_i en las fechas con x_j
+        self.ss = np.zeros((p, p))     # suma de x_i**2 en las fechas con x_j
+        self.sp = np.zeros((p, p))     # suma de x_i*x_j
+
+    def _sumar(self, valores, mascara, signo):
+        self.n += signo * np.outer(mascara, mascara)
+        self.s += signo * np.outer(valores, mascara)
+        self.ss += signo * np.outer(valores**2, mascara)
+        self.sp += signo * np.outer(valores, valores)
+
+    def _preparar(self, x):
+        x = np.asarray(x, dtype=float)
+        mascara = ~np.isnan(x)
+        return np.where(mascara, x - self.centro, 0.0), mascara.astype(float)
+
+    def agregar(self, x):
+        """Agregar una fecha (un valor por serie, NaN si falta) y quitar la más antigua si la ventana está llena."""
+        valores, mascara = self._preparar(x)
+        self.ventana.append((valores, mascara))
+        self._sumar(valores, mascara, 1)
+        if len(self.ventana) > self.window:
+            self.quitar()
+        self.actualizaciones += 1
+        if self.actualizaciones % self.refresco == 0:
+            self._recalcular()
+
+    def quitar(self):
+        """Sacar de la ventana la fecha más antigua."""
+        valores, mascara = self.ventana.popleft()
+        self._sumar(valores, mascara, -1)
+
+    def _recalcular(self):
+        for suma in (self.n, self.s, self.ss, self.sp):
+            suma[:] = 0.0
+        for valores, mascara in self.ventana:
+            self._sumar(valores, mascara, 1)
+
+    def covarianza(self, min_obs:int=2):
+        """Matriz de covarianzas muestrales (NaN en las parejas con menos de `min_obs` datos)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (self.sp - self.s * self.s.T / self.n) / (self.n - 1)
+        return np.where(self.n >= max(min_obs, 2), cov, np.nan)
+
+    def correlacion(self, min_obs:int=2):
+        """Matriz de correlaciones (NaN en las parejas con menos de `min_obs` datos)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = self.sp - self.s * self.s.T / self.n
+            var = self.ss - self.s**2 / self.n
+            corr = cov / np.sqrt(var * var.T)
+        return np.where(self.n >= max(min_obs, 2), np.clip(corr, -1, 1), np.nan)
+
+
+class MatricesMoviles:
+    """
+    Resultado de `correlaciones_moviles`.
+
+    `correlacion` y `covarianza` son arreglos fecha x serie x serie;
+    `en` y `pareja` los entregan como tablas.
+    """
+
+    def __init__(self, fechas:pd.Index, series:pd.Index, correlacion:np.ndarray, covarianza:np.ndarray):
+        self.fechas = fechas
+        self.series = series
+        self.correlacion = correlacion
+        self.covarianza = covarianza
+
+    def en(self, fecha=None, covarianza:bool=False):
+        """Matriz de la ventana que termina en `fecha` (la ultima si es None)."""
+        i = -1 if fecha is None else self.fechas.get_indexer([pd.Timestamp(fecha)], method='ffill')[0]
+        matrices = self.covarianza if covarianza else self.correlacion
+        return pd.DataFrame(matrices[i], index=self.series, columns=self.series)
+
+    def pareja(self, a, b, covarianza:bool=False):
+        """Serie de tiempo de la correlación (o covarianza) entre `a` y `b`."""
+        i, j = self.series.get_loc(a), self.series.get_loc(b)
+        matrices = self.covarianza if covarianza else self.correlacion
+        return pd.Series(matrices[:, i, j], index=self.fechas, name=(a, b))
+
+    def contra(self, series:list, covarianza:bool=False):
+        """Correlaciones de todas las series contra `series`: fecha x (serie, otra)."""
+        j = self.series.get_indexer(series)
+        matrices = self.covarianza if covarianza else self.correlacion
+        columnas = pd.MultiIndex.from_product([self.series, series])
+        return pd.DataFrame(matrices[:, :, j].reshape(len(self.fechas), -1), index=self.fechas, columns=columnas)
+
+
+def correlaciones_moviles(tabla:pd.DataFrame, window:int, min_obs:int=None):
+    """
+    Matrices de correlación y covarianza de `tabla` para cada ventana movil.
+
+    Parameters
+    ----------
+    tabla : pd.DataFrame
+        Una columna por serie, indexada por fecha (NaN donde falta el dato).
+    window : int
+        Numero de fechas de cada ventana.
+    min_obs : int, optional
+        Minimo de fechas con ambos datos dentro de la ventana. The default
+        is None (la ventana completa).
+
+    Returns
+    -------
+    MatricesMoviles
+        Con arreglos `correlacion` y `covarianza` de forma
+        (fechas, series, series); las primeras `window - 1` fechas quedan
+        en NaN.
+
+    """
+    min_obs = window if min_obs is None else min_obs
+    valores = tabla.to_numpy(dtype=float)
+    fechas, p = len(tabla), tabla.shape[1]
+    correlacion = np.full((fechas, p, p), np.nan)
+    covarianza = np.full((fechas, p, p), np.nan)
+
+    movil = CovarianzaMovil(window, np.nanmean(valores, axis=0))
+    for t, fila in enumerate(valores):
+        movil.agregar(fila)
+        if t >= window - 1:
+            correlacion[t] = movil.correlacion(min_obs)
+            covarianza[t] = movil.covarianza(min_obs)
+    return MatricesMoviles(tabla.index, tabla.columns, correlacion, covarianza)
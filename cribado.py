@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Datos del screener de acciones_exportadoras.py para varios exchanges a la vez.
+
+La lista de acciones de cada exchange se divide en paginas y cada pagina
+se procesa en un hilo aparte (el trabajo es casi todo espera de la red).
+Cada exchange tiene su propio ritmo de solicitudes (`pausa` segundos entre
+dos de sus empresas) y las paginas se reparten intercaladas entre
+exchanges, así los exchanges avanzan a la vez y el tiempo total es el del
+exchange más grande. Sobre ellos hay un tope comun para la credencial de
+EOD (`pausa_api`): con muchos exchanges ese tope, y no el exchange más
+grande, es el que limita el tiempo total. El resultado es una sola tabla
+con las columnas 'exchange' y 'moneda'.
+
+Cada pagina resume además sus columnas en sketches de cuantiles
+(cuantiles.py) que se unen a medida que las paginas terminan: los
+cuantiles del universo de varios exchanges quedan disponibles mientras se
+descarga, sin juntar la tabla completa. Sobre una tabla ya en memoria
+(y limpia) los cuantiles exactos de pandas siguen siendo los indicados.
+
+    python cribado.py SN SA MX --hilos 8
+
+@author: lauta
+"""
+
+import os
+import time
+import argparse
+import threading
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, directorio_cache
+from calculos import normalizar_fundamentales, roic
+from cuantiles import Resumen
+from monedas import TablaCambios
+
+
+# indice de mercado de EOD contra el que se estiman los betas de cada exchange
+INDICES = {
+    'SN': 'SPIPSA.INDX',  # Santiago
+    'SA': 'BVSP.INDX',    # Sao Paulo
+    'MX': 'MXX.INDX',     # Mexico
+    'BA': 'MERV.INDX',    # Buenos Aires
+    }
+
+class _Ritmo:
+    """Deja pasar una solicitud cada `pausa` segundos entre todos los hilos."""
+
+    def __init__(self, pausa:float):
+        self.pausa = pausa
+        self._siguiente = time.monotonic()
+        self._candado = threading.Lock()
+
+    def esperar(self):
+        with self._candado:
+            turno = max(self._siguiente, time.monotonic())
+            self._siguiente = turno + self.pausa
+        time.sleep(max(turno - time.monotonic(), 0))
+
+def fila_empresa(ticker:str, moneda:str=None):
+    """
+    Sector, multiplos, ROIC y datos de mercado de una empresa.
+
+    Parameters
+    ----------
+    ticker : str
+        Codigo junto a su exchange ('SQM-B.SN').
+    moneda : str, optional
+        Moneda en que transa. The default is None.
+
+    Returns
+    -------
+    dict
+        Una fila de la tabla del screener.
+
+    """
+    # todos los campos salen de una sola solicitud de fundamentales
+    datos = cliente_eod().get_fundamental_equity(ticker)
+    general, valuation, highlights = datos['General'], datos['Valuation'], datos['Highlights']
+    financieros = datos['Financials']
+    # ROIC = NOPAT / Avergae Invested Capital = (EBIT*(1-tax)) / (Fixed Assets + Net Working Capital)
+    inc_ = normalizar_fundamentales(financieros['Income_Statement']['quarterly'])
+    bs_ = normalizar_fundamentales(financieros['Balance_Sheet']['quarterly'])
+    _, _, exchange = ticker.rpartition('.')
+    return {
+        'empresa': ticker,
+        'exchange': exchange,
+        'moneda': moneda or general.get('CurrencyCode'),
+        'sector': general['Sector'],
+        'industria': general['Industry'],
+        'ev_ebitda': valuation['EnterpriseValueEbitda'],
+        'ev_rev': valuation['EnterpriseValueRevenue'],
+        'pb': valuation['PriceBookMRQ'],
+        'ps': valuation['PriceSalesTTM'],
+        'pe': valuation['TrailingPE'],
+        'roe': highlights['ReturnOnEquityTTM'],
+        'roa': highlights['ReturnOnAssetsTTM'],
+        'roic': roic(inc_, bs_, general['Sector'], highlights['ReturnOnEquityTTM']),
+        'op_margin': highlights['OperatingMarginTTM'],
+        'mkt_cap': float(highlights['MarketCapitalization']),
+        'beta': float(datos['Technicals']['Beta']),
+        'payout': datos['SplitsDividends']['PayoutRatio'],
+        'fw_yield': datos['SplitsDividends']['ForwardAnnualDividendYield'],
+        }
+
+def _pagina(listados:list, ritmos:list, tasas:dict=None, columnas:list=(), k:int=200):
+    """
+    Filas de una pagina de (ticker, moneda), su resumen y las empresas que
+    fallaron; corre dentro de un hilo del grupo.
+    """
+    filas, fallas = [], []
+    resumen = Resumen(columnas, k)
+    for ticker, moneda in listados:
+        for ritmo in ritmos:
+            ritmo.esperar()
+        try:
+            fila = fila_empresa(ticker, moneda)
+            if tasas is not None:
+                fila['mkt_cap'] *= tasas.get(fila['moneda'], np.nan)
+            filas.append(fila)
+            resumen.actualizar(fila)
+            print(ticker)
+        except Exception as error:
+            print(f"No se pudo para {ticker}")
+            fallas.append((ticker, error))
+    return filas, resumen, fallas
+
+def listados(exchange:str, moneda:str=None, tipo:str='Common Stock'):
+    """
+    Acciones de un exchange como lista de (ticker, moneda).
+
+    Parameters
+    ----------
+    exchange : str
+        Codigo del exchange en EOD ('SN', 'SA', ...).
+    moneda : str, optional
+        Solo los listados en esta moneda. The default is None (todos).
+    tipo : str, optional
+        Tipo de instrumento. The default is 'Common Stock'.
+
+    """
+    simbolos = pd.DataFrame(cliente_eod().get_exchange_symbols(exchange=exchange))
+    if simbolos.empty:
+        return []
+    if tipo is not None and 'Type' in simbolos:
+        simbolos = simbolos[simbolos['Type'] == tipo]
+    if moneda is not None:
+        simbolos = simbolos[simbolos['Currency'] == moneda]
+    return [(f"{codigo}.{exchange}", moneda_) for codigo, moneda_ in zip(simbolos['Code'], simbolos['Currency'])]
+
+def cribar(exchanges:list, monedas:dict=None, tamano:int=50, hilos:int=8, pausa:float=2,
+           pausa_api:float=0.6, destino:str=None, panel_precios=None, resumen:Resumen=None):
+    """
+    Tabla del screener para todas las acciones de `exchanges`.
+
+    Parameters
+    ----------
+    exchanges : list
+        Codigos de los exchanges en EOD.
+    monedas : dict, optional
+        exchange -> moneda exigida a sus listados (por ejemplo {'SN': 'CLP'}).
+        The default is None (todas las monedas).
+    tamano : int, optional
+        Acciones por pagina (unidad de trabajo de cada hilo). The default
+        is 50.
+    hilos : int, optional
+        Paginas simultaneas. The default is 8.
+    pausa : float, optional
+        Segundos entre dos empresas de un mismo exchange. The default is 2.
+    pausa_api : float, optional
+        Segundos entre dos empresas cualesquiera, sumando todos los
+        exchanges. EOD admite 1000 llamadas por minuto por credencial y cada
+        solicitud de fundamentales cuenta como 10. The default is 0.6.
+
+    Raises
+    ------
+    RuntimeError
+        Si hay empresas que cribar y ninguna se pudo obtener.
+    destino : str, optional
+        Moneda a la que se lleva 'mkt_cap', con el ultimo tipo de cambio
+        (ver monedas.TablaCambios). The default is None (sin convertir).
+    panel_precios : precios.PanelPrecios, optional
+        Panel con los tipos de cambio. The default is None (el del cache).
+    resumen : cuantiles.Resumen, optional
+        Sketches de las columnas a resumir; se unen con los de cada pagina
+        a medida que terminan. The default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por empresa, indexada por 'empresa', con las columnas
+        'exchange' y 'moneda'.
+
+    """
+    monedas = monedas or {}
+    api = _Ritmo(pausa_api)
+    por_exchange = []
+    for exchange in exchanges:
+        listados_ = listados(exchange, monedas.get(exchange))
+        ritmos = [_Ritmo(pausa), api]
+        por_exchange.append([(listados_[i:i + tamano], ritmos) for i in range(0, len(listados_), tamano)])
+    # primero la primera pagina de cada exchange, luego la segunda, ...
+    paginas = [pagina for ronda in zip_longest(*por_exchange) for pagina in ronda if pagina is not None]
+    tasas = None
+    if destino is not None:
+        monedas_ = {moneda for pagina, _ in paginas for _, moneda in pagina}
+        cambios = TablaCambios(panel_precios, destino, monedas=monedas_)
+        tasas = {m: cambios.tasa(m) for m in monedas_}
+    columnas = list(resumen.sketches) if resumen is not None else []
+    k = next(iter(resumen.sketches.values())).k if columnas else 200
+
+    filas, fallas = [], []
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        futuros = [ejecutor.submit(_pagina, pagina, ritmos, tasas, columnas, k) for pagina, ritmos in paginas]
+        for futuro in as_completed(futuros):
+            filas_, resumen_, fallas_ = futuro.result()
+            filas += filas_
+            fallas += fallas_
+            if resumen is not None:
+                resumen.unir(resumen_)
+    if not filas and fallas:
+        ticker, error = fallas[0]
+        raise RuntimeError(f"No se pudo obtener ninguna de las {len(fallas)} empresas de {exchanges} "
+                           f"(primer error, {ticker}: {error!r})") from error
+    if not filas:
+        return pd.DataFrame()
+    return pd.DataFrame(filas).set_index('empresa').sort_values(by=['exchange', 'sector', 'industria'])
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Datos del screener para varios exchanges')
+    parser.add_argument('exchanges', nargs='+', help='codigos de EOD (SN SA MX ...)')
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--tamano', type=int, default=50, help='acciones por pagina')
+    parser.add_argument('--salida', default=None, help="CSV de salida (por defecto 'cribado.csv' del cache)")
+    argumentos = parser.parse_args(argumentos)
+
+    tabla = cribar(argumentos.exchanges, tamano=argumentos.tamano, hilos=argumentos.hilos)
+    salida = argumentos.salida or os.path.join(directorio_cache(), 'cribado.csv')
+    tabla.to_csv(salida)
+    print(tabla.groupby(['exchange', 'moneda']).size())
+    print(f"Resultados en {salida}")
+
+if __name__ == '__main__':
+    main()
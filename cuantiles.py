@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Cuantiles aproximados de muchos valores con memoria acotada (sketch KLL).
+
+`Cuantiles` recibe los valores a medida que llegan y guarda a lo más unos
+pocos miles de ellos, sin importar cuántos se hayan agregado: cuando un
+nivel se llena se ordena y pasa la mitad de sus valores (uno de cada dos)
+al nivel siguiente, donde cada valor representa el doble de
+observaciones. Dos sketches se pueden unir, así cada proceso resume su
+parte del universo y el total se obtiene al juntarlos. El error del rango
+de un cuantil es del orden de 1.7 / k (alrededor de 1% con k=200).
+
+`Resumen` agrupa un sketch por columna de una tabla.
+
+@author: lauta
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Cuantiles:
+    """
+    Sketch KLL de una variable.
+
+    Parameters
+    ----------
+    k : int, optional
+        Capacidad del nivel superior; a mayor k, menor error y más memoria.
+        The default is 200.
+    semilla : int, optional
+        Semilla de la elección de los valores que suben de nivel. The
+        default is None.
+
+    """
+
+    _c = 2 / 3
+
+    def __init__(self, k:int=200, semilla:int=None):
+        self.k = k
+        self.niveles = [[]]
+        self.n = 0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        self._azar = np.random.default_rng(semilla)
+
+    def _capacidad(self, nivel:int):
+        return max(int(np.ceil(self.k * self._c ** (len(self.niveles) - 1 - nivel))), 2)
+
+    def _compactar(self):
+        """Subir valores de nivel hasta respetar la capacidad total."""
+        while sum(len(n) for n in self.niveles) > sum(self._capacidad(h) for h in range(len(self.niveles))):
+            for nivel, valores in enumerate(self.niveles):
+                if len(valores) >= self._capacidad(nivel):
+                    break
+            if nivel + 1 == len(self.niveles):
+                self.niveles.append([])
+            valores = np.sort(valores)
+            # con un largo impar el ultimo valor se queda en el nivel
+            resto = valores[len(valores) - len(valores) % 2:].tolist()
+            pares = valores[:len(valores) - len(valores) % 2]
+            self.niveles[nivel + 1].extend(pares[self._azar.integers(2)::2].tolist())
+            self.niveles[nivel] = resto
+
+    def actualizar(self, valores):
+        """
+        Agregar un valor o un arreglo de valores (los NaN se ignoran).
+        """
+        valores = np.atleast_1d(np.asarray(valores, dtype=float))
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+        self.n += len(valores)
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        # de a bloques, para no acumular más que la capacidad del nivel 0
+        for inicio in range(0, len(valores), self.k):
+            self.niveles[0].extend(valores[inicio:inicio + self.k].tolist())
+            self._compactar()
+        return self
+
+    def unir(self, otro:'Cuantiles'):
+        """
+        Incorporar los valores resumidos en otro sketch.
+        """
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append([])
+        for nivel, valores in enumerate(otro.niveles):
+            self.niveles[nivel].extend(valores)
+        self.n += otro.n
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self._compactar()
+        return self
+
+    def cuantil(self, q):
+        """
+        Cuantil(es) aproximado(s) `q` entre 0 y 1 (NaN si no hay valores).
+        """
+        q = np.asarray(q, dtype=float)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)[()]
+        valores = np.concatenate([np.asarray(v, dtype=float) for v in self.niveles])
+        pesos = np.concatenate([np.full(len(v), 2.0**h) for h, v in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind='stable')
+        valores, acumulado = valores[orden], np.cumsum(pesos[orden])
+        posicion = np.searchsorted(acumulado, q * acumulado[-1], side='left').clip(0, len(valores) - 1)
+        resultado = np.where(q <= 0, self.minimo, np.where(q >= 1, self.maximo, valores[posicion]))
+        return resultado[()]
+
+    def mediana(self):
+        return float(self.cuantil(0.5))
+
+    def __len__(self):
+        return self.n
+
+
+class Resumen:
+    """
+    Un sketch `Cuantiles` por columna.
+
+    Parameters
+    ----------
+    columnas : list
+        Columnas a resumir.
+    k : int, optional
+        Capacidad de cada sketch. The default is 200.
+
+    """
+
+    def __init__(self, columnas:list, k:int=200):
+        self.sketches = {columna: Cuantiles(k) for columna in columnas}
+
+    def actualizar(self, filas):
+        """
+        Agregar filas (DataFrame, lista de dicts o un dict) a cada sketch.
+        """
+        if isinstance(filas, dict):
+            filas = [filas]
+        tabla = pd.DataFrame(filas)
+        for columna, sketch in self.sketches.items():
+            if columna in tabla:
+                sketch.actualizar(pd.to_numeric(tabla[columna], errors='coerce').to_numpy(dtype=float))
+        return self
+
+    def unir(self, otro:'Resumen'):
+        """Incorporar otro resumen (por ejemplo el de otro proceso)."""
+        for columna, sketch in otro.sketches.items():
+            if columna in self.sketches:
+                self.sketches[columna].unir(sketch)
+            else:
+                self.sketches[columna] = sketch
+        return self
+
+    def cuantil(self, columna:str, q):
+        return self.sketches[columna].cuantil(q)
+
+    def mediana(self, columna:str):
+        return self.sketches[columna].mediana()
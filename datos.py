@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Acceso a las series del Banco Central compartido por todos los scripts.
+
+Cada serie se solicita a la API una sola vez por proceso: las siguientes
+llamadas reciben la copia en memoria y, si varios hilos piden la misma
+serie al mismo tiempo, solo el primero hace la solicitud y el resto espera
+su resultado. Los DataFrames entregados envuelven arreglos de solo
+lectura, de modo que ningun script puede modificar por error la copia
+compartida (las operaciones de pandas que devuelven objetos nuevos, como
+`rolling`, `resample` o `dropna`, funcionan igual que antes).
+
+Con `usar_almacen` las series se leen del almacen columnar local (memoria
+mapeada, compartida entre procesos) y solo las que faltan se solicitan a
+la API; `refrescar` las vuelve a descargar y reemplaza en el almacen. Si
+la variable de ambiente EXPORTACIONES_ALMACEN está definida, los scripts
+ocupan el almacen desde el inicio (así lo ejecuta `exportaciones.py`).
+
+`precargar` y `refrescar` descargan muchas series a la vez con el cliente
+asincrono (bcch_asincrono.py), desde un solo event loop; sin aiohttp se
+solicitan una a una con el cliente sincrono.
+
+Cada respuesta de la API se guarda como instantánea ('bcch/<codigo>', ver
+instantaneas.py); con una fecha de consulta fijada las series se leen de
+ahí y no se solicita nada.
+
+@author: lauta
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+
+import pandas as pd
+
+from clientes import cliente_bcch, cliente_bcch_asincrono, fecha_consulta
+from calculos import limpiar_serie, remuestrear, frecuencia_nativa
+from instantaneas import capturar, registrar
+
+
+_candado = threading.Lock()
+_series = {}
+_almacen = None
+
+if os.environ.get('EXPORTACIONES_ALMACEN'):
+    from almacen import AlmacenColumnar
+    _almacen = AlmacenColumnar()
+
+def _solo_lectura(serie_:pd.DataFrame):
+    """Index y valores de la serie como arreglos inmutables."""
+    valores = serie_.to_numpy(dtype=float)
+    # lo leido del almacen ya es de solo lectura y no se copia
+    if valores.flags.writeable:
+        valores = valores.copy()
+        valores.flags.writeable = False
+    return serie_.index, valores, list(serie_.columns)
+
+def _envolver(guardado:tuple):
+    """DataFrame nuevo (sin copiar los datos) sobre los arreglos guardados."""
+    indice, valores, columnas = guardado
+    return pd.DataFrame(valores, index=indice, columns=columnas, copy=False)
+
+def _obtener(clave:str, solicitar):
+    """
+    Resultado memorizado de `solicitar()`, con una sola solicitud en vuelo por clave.
+    """
+    with _candado:
+        futuro = _series.get(clave)
+        propio = futuro is None
+        if propio:
+            futuro = Future()
+            _series[clave] = futuro
+
+    if propio:
+        try:
+            futuro.set_result(solicitar())
+        except BaseException as error:
+            # no memorizar errores: el siguiente llamado vuelve a intentar
+            with _candado:
+                del _series[clave]
+            futuro.set_exception(error)
+    return futuro.result()
+
+def usar_almacen(almacen=None):
+    """
+    Leer y guardar las series en un almacen columnar local.
+
+    Parameters
+    ----------
+    almacen : almacen.AlmacenColumnar, optional
+        Almacen a ocupar. None vuelve a solicitar todo a la API.
+
+    """
+    global _almacen
+    _almacen = almacen
+
+def almacen_actual():
+    """Almacen columnar en uso (o None)."""
+    return _almacen
+
+def _macro(serie:str):
+    """Observaciones de la API (o de la instantánea vigente a la fecha de consulta)."""
+    return capturar(f'bcch/{serie}', lambda: cliente_bcch().get_macro(serie=serie))
+
+def _solicitar_macro(serie:str):
+    """Serie desde el almacen local o, si no está, desde la API."""
+    if _almacen is not None and _almacen.contiene(serie):
+        return _almacen.leer(serie)
+    serie_ = limpiar_serie(_macro(serie))
+    if _almacen is not None:
+        _almacen.guardar(serie, serie_, tipo='serie', frecuencia=frecuencia_nativa(serie, serie_))
+    return serie_
+
+def serie_macro(serie:str):
+    """
+    Serie limpia del Banco Central (memorizada y de solo lectura).
+
+    Parameters
+    ----------
+    serie : str
+        codigo de la serie.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columna 'value' indexada por fecha.
+
+    """
+    return _envolver(_obtener(serie, lambda: _solo_lectura(_solicitar_macro(serie))))
+
+def serie_remuestreada(serie:str, resam:str=None, operations:list=None):
+    """
+    Serie del Banco Central remuestreada con una o varias operaciones.
+
+    Parameters
+    ----------
+    serie : str
+        id de la serie macro a solicitar.
+    resam : str
+        frecuencia para el resampling.
+    operations : list
+        operación(es) para agregar los datos resampliandos.
+
+    Returns
+    -------
+    pandas DataFrame
+        serie lista para ocupar.
+
+    """
+    return remuestrear(serie_macro(serie), resam=resam, operations=operations)
+
+def olvidar(serie:str=None):
+    """
+    Borrar de la memoria una serie (o todas) para volver a solicitarla.
+    """
+    with _candado:
+        if serie is None:
+            _series.clear()
+        else:
+            _series.pop(serie, None)
+
+def _descargar(series:list):
+    """
+    Series limpias desde la API, en forma concurrente si aiohttp está disponible.
+
+    Las series que fallan en la descarga concurrente no se incluyen; se
+    vuelven a intentar (y reportan su error) al pedirlas una a una.
+    """
+    if not series:
+        return {}
+    if fecha_consulta() is not None:
+        return {serie: limpiar_serie(_macro(serie)) for serie in series}
+    try:
+        from bcch_asincrono import _aiohttp, ejecutar
+        _aiohttp()
+    except ImportError:
+        return {serie: limpiar_serie(_macro(serie)) for serie in series}
+    respuestas = ejecutar(cliente_bcch_asincrono().get_macro_many(series, omitir_errores=True))
+    return {serie: limpiar_serie(registrar(f'bcch/{serie}', obs)) for serie, obs in respuestas.items()}
+
+def precargar(series:list):
+    """
+    Descargar en una sola pasada las series que aún no están en memoria ni en el almacen.
+
+    Parameters
+    ----------
+    series : list
+        codigos de las series que se van a ocupar.
+
+    """
+    with _candado:
+        faltantes = [s for s in dict.fromkeys(series) if s not in _series]
+    if _almacen is not None:
+        faltantes = [s for s in faltantes if not _almacen.contiene(s)]
+    for serie, serie_ in _descargar(faltantes).items():
+        if _almacen is not None:
+            _almacen.guardar(serie, serie_, tipo='serie', frecuencia=frecuencia_nativa(serie, serie_))
+        _obtener(serie, lambda: _solo_lectura(serie_))
+
+def refrescar(series:list):
+    """
+    Descargar nuevamente las series y reemplazarlas en el almacen local.
+
+    Parameters
+    ----------
+    series : list
+        codigos de las series a actualizar.
+
+    """
+    descargadas = _descargar(list(dict.fromkeys(series)))
+    faltantes = [s for s in series if s not in descargadas]
+    if faltantes:
+        # reintentar una a una para reportar el error de la API
+        descargadas.update({s: limpiar_serie(_macro(s)) for s in faltantes})
+    for serie, serie_ in descargadas.items():
+        if _almacen is not None:
+            _almacen.guardar(serie, serie_, tipo='serie', frecuencia=frecuencia_nativa(serie, serie_))
+        olvidar(serie)
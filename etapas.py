@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Celdas de calculo de macro.py declaradas con sus series.
+
+Cada celda corresponde a una celda '#%%' del script y entrega las tablas
+que luego se grafican. Al ejecutarse a traves de `grafo`, solo se
+recalculan las celdas cuyas series, codigo o celdas de entrada cambiaron.
+
+`SALIDAS` indica, para cada grupo de graficos de macro.py, las secciones
+'#%%' que lo dibujan y las celdas (y por lo tanto las series) que
+necesita; `exportaciones.py run macro --only tot` solo descarga y
+calcula eso.
+
+@author: lauta
+"""
+
+import atexit
+
+import pandas as pd
+
+from datos import serie_macro, precargar
+from tendencia import filtro_hp
+from ventanas import AlmacenVentanas
+from calculos import acumular, porcion, pareto, ajuste_lineal
+from celdas import Grafo
+from frecuencias import panel
+from regresiones import regresiones, regresiones_moviles
+from correlaciones import correlaciones_moviles
+
+
+_almacen_ttm = None
+
+def cleaner(serie:str, rolling_:bool=True, window:int=12, operacion_:str='sum'):
+    """
+    Solicitar datos a la API del Banco central por medio del cliente
+    bcch. Adicionamente se hacen operaciones para limpiar los datos.
+
+    Parameters
+    ----------
+    serie : str
+        codigo de la serie.
+    rolling_ : bool, optional
+        Seguimiento anual?. The default is True.
+    window : int
+        Numero de periodos para el calculo
+    operacion_ : str, optional
+        Operación para hacer el re-muestreo. The default is None.
+
+    Returns
+    -------
+    serie_ : pd.DataFrame
+        Datos historicos para la serie solicitada.
+
+    """
+    global _almacen_ttm
+    if not rolling_:
+        return serie_macro(serie)
+    # Ventanas TTM de ejecuciones anteriores, solo se acumulan los meses nuevos
+    if _almacen_ttm is None:
+        _almacen_ttm = AlmacenVentanas.cargar()
+        # se guarda una sola vez, al terminar la ejecución
+        atexit.register(_almacen_ttm.guardar)
+    return acumular(serie_macro(serie), rolling_=rolling_, window=window, operacion_=operacion_,
+                    almacen=_almacen_ttm, clave=serie)
+
+def _unir(series:list, columnas:list):
+    """Unir las series sobre las fechas de la primera y nombrar sus columnas."""
+    tabla = series[0]
+    for i, serie_ in enumerate(series[1:], start=1):
+        tabla = tabla.join(serie_, rsuffix=f'_{i}')
+    tabla.columns = columnas
+    return tabla
+
+# las series de las celdas pedidas se descargan juntas, en forma concurrente
+grafo = Grafo('macro', cleaner, precargar=precargar)
+
+#%% Exportaciones de los principales productos chilenos
+
+@grafo.celda(series={
+    # Exportaciones de bienes FOB (millones de dólares)
+    'bienes': ('F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M', {'rolling_': False}),
+    # Servicios, exportaciones (millones de dólares)
+    'servicios': ('F068.B2.FLU.Z.0.C.N.Z.T.Z.Z.6.0.T', {'window': 4}),
+    })
+def comercio(bienes, servicios):
+    # bienes mensuales sumados por trimestre, servicios (ya TTM) al cierre del trimestre
+    comercio_ = panel({'bienes': bienes, 'servicios': servicios}, pd.offsets.QuarterEnd(), {'bienes': 'sum'})
+    comercio_['bienes'] = comercio_['bienes'].rolling(window=4).sum()
+    comercio_ = comercio_.ffill()
+    comercio_['total_exportaciones'] = comercio_['bienes'] + comercio_['servicios']
+    return porcion(comercio_, 'total_exportaciones')
+
+@grafo.celda(series={
+    'total': 'F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M',
+    'mineras': 'F068.B1.FLU.A.0.C.N.Z.Z.Z.Z.6.0.M',
+    'agro': 'F068.B1.FLU.B.0.C.N.Z.Z.Z.Z.6.0.M',
+    'industriales': 'F068.B1.FLU.C.0.C.N.Z.Z.Z.Z.6.0.M',
+    })
+def exportaciones(total, mineras, agro, industriales):
+    tabla = _unir([total, mineras, agro, industriales], ['total_fob', 'Minería', 'Agropecuario', 'Industriales'])
+    return {
+        'tabla': tabla,
+        # porcentajes de cada serie por cada mes
+        'porcion': porcion(tabla, 'total_fob'),
+        'pareto': pareto(tabla.iloc[-1, 1:]),
+        }
+
+#%% Categoria: Mineria
+
+@grafo.celda(series={
+    'mineras': 'F068.B1.FLU.A.0.C.N.Z.Z.Z.Z.6.0.M',
+    'cobre': 'F068.B1.FLU.A1.0.C.N.Z.Z.Z.Z.6.0.M',
+    'catodos': 'F068.B1.FLU.A2.0.C.N.Z.Z.Z.Z.6.0.M',
+    'concentrado': 'F068.B1.FLU.A3.0.C.N.Z.Z.Z.Z.6.0.M',
+    'hierro': 'F068.B1.FLU.A4.0.C.N.Z.Z.Z.Z.6.0.M',
+    'plata': 'F068.B1.FLU.A5.0.C.N.Z.Z.Z.Z.6.0.M',
+    'oro': 'F068.B1.FLU.A6.0.C.N.Z.Z.Z.Z.6.0.M',
+    'molibdeno': 'F068.B1.FLU.A7.0.C.N.Z.Z.Z.Z.6.0.M',
+    'litio': 'F068.B1.FLU.A8.0.C.N.Z.Z.Z.Z.6.0.M',
+    'sal': 'F068.B1.FLU.A9.0.C.N.Z.Z.Z.Z.6.0.M',
+    })
+def mineria(mineras, cobre, catodos, concentrado, hierro, plata, oro, molibdeno, litio, sal):
+    tabla = _unir(
+        [mineras, cobre, hierro, plata, oro, molibdeno, litio, sal],
+        ['total_mineras_fob', 'Cobre', 'Hierro', 'Plata', 'Oro', 'Molibdeno', 'Litio', 'Sal']
+        )
+    # Mineras de cobre
+    mineras_cobre = _unir([mineras, catodos, concentrado], ['mineras_fob', 'catodos', 'concentrados'])
+    return {
+        'tabla': tabla,
+        'porcion': porcion(tabla, 'total_mineras_fob'),
+        'pareto': pareto(tabla.iloc[-1, 1:]),
+        'cobre': porcion(mineras_cobre, 'mineras_fob'),
+        }
+
+#%% Categoria: Agropecuario-silvícola y pesquero
+
+@grafo.celda(series={
+    'agro': 'F068.B1.FLU.B.0.C.N.Z.Z.Z.Z.6.0.M',
+    'fruticolas': 'F068.B1.FLU.B1.0.C.N.Z.Z.Z.Z.6.0.M',
+    'semillas': 'F068.B1.FLU.B2.0.C.N.Z.Z.Z.Z.6.0.M', # es lo mismo que otros
+    'silvicola': 'F068.B1.FLU.B3.0.C.N.Z.Z.Z.Z.6.0.M',
+    'pesca': 'F068.B1.FLU.B4.0.C.N.Z.Z.Z.Z.6.0.M',
+    })
+def agropecuario(agro, fruticolas, semillas, silvicola, pesca):
+    tabla = _unir(
+        [agro, fruticolas, semillas, silvicola, pesca],
+        ['total_agro_fob', 'Frutícola', 'Semillas', 'Silvicola', 'Pesca']
+        )
+    return {
+        'tabla': tabla,
+        'porcion': porcion(tabla, 'total_agro_fob'),
+        'pareto': pareto(tabla.iloc[-1, 1:]),
+        }
+
+@grafo.celda(series={
+    'uvas': 'F068.B1.FLU.B11.0.C.N.Z.Z.Z.Z.6.0.M',
+    'manzanas': 'F068.B1.FLU.B12.0.C.N.Z.Z.Z.Z.6.0.M',
+    'peras': 'F068.B1.FLU.B13.0.C.N.Z.Z.Z.Z.6.0.M',
+    'arandanos': 'F068.B1.FLU.B14.0.C.N.Z.Z.Z.Z.6.0.M',
+    'kiwis': 'F068.B1.FLU.B15.0.C.N.Z.Z.Z.Z.6.0.M',
+    'ciruelas': 'F068.B1.FLU.B16.0.C.N.Z.Z.Z.Z.6.0.M',
+    'cerezas': 'F068.B1.FLU.B17.0.C.N.Z.Z.Z.Z.6.0.M',
+    'paltas': 'F068.B1.FLU.B18.0.C.N.Z.Z.Z.Z.6.0.M',
+    }, entradas=['agropecuario'])
+def fruticola(uvas, manzanas, peras, arandanos, kiwis, ciruelas, cerezas, paltas, agropecuario):
+    tabla = _unir(
+        [uvas, manzanas, peras, arandanos, kiwis, ciruelas, cerezas, paltas],
+        ['Uvas', 'Manzanas', 'Peras', 'Arandanos', 'Kiwis', 'Ciruelas', 'Cerezas', 'Paltas']
+        )
+    return {
+        'tabla': tabla,
+        'pareto': pareto(tabla.iloc[-1, :]),
+        # porcion de cada fruta en el sector fruticola, último dato
+        'porcion': tabla.divide(agropecuario['tabla']['Frutícola'], axis=0).iloc[-1, :].sort_values(ascending=True) * 100,
+        }
+
+#%% Categoria: Industriales
+
+@grafo.celda(series={
+    'industriales': 'F068.B1.FLU.C.0.C.N.Z.Z.Z.Z.6.0.M',
+    'alimentos': 'F068.B1.FLU.C1.0.C.N.Z.Z.Z.Z.6.0.M',
+    'bebidas': 'F068.B1.FLU.C2.0.C.N.Z.Z.Z.Z.6.0.M',
+    'forestal': 'F068.B1.FLU.C3.0.C.N.Z.Z.Z.Z.6.0.M',
+    'celulosa': 'F068.B1.FLU.C4.0.C.N.Z.Z.Z.Z.6.0.M',
+    'quimicos': 'F068.B1.FLU.C5.0.C.N.Z.Z.Z.Z.6.0.M',
+    'metalica': 'F068.B1.FLU.C6.0.C.N.Z.Z.Z.Z.6.0.M',
+    'maquinaria': 'F068.B1.FLU.C7.0.C.N.Z.Z.Z.Z.6.0.M',
+    'otros': 'F068.B1.FLU.C9.0.C.N.Z.Z.Z.Z.6.0.M',
+    })
+def industriales(industriales, alimentos, bebidas, forestal, celulosa, quimicos, metalica, maquinaria, otros):
+    tabla = _unir(
+        [industriales, alimentos, bebidas, forestal, celulosa, quimicos, metalica, maquinaria, otros],
+        ['total_industrial_fob', 'Alimentos', 'Bebidas\ny tabaco', 'Forestal y\nmuebles de\nmadera',
+         'Celulosa, papel\ny otros', 'Productos\nquímicos', 'Industria metálica\nbasica',
+         'Maquinaria y\nequipos', 'Otros']
+        )
+    return {
+        'tabla': tabla,
+        'porcion': porcion(tabla, 'total_industrial_fob'),
+        'pareto': pareto(tabla.iloc[-1, 1:]),
+        }
+
+@grafo.celda(series={
+    'alimentos': 'F068.B1.FLU.C1.0.C.N.Z.Z.Z.Z.6.0.M',
+    'harina_pescado': 'F068.B1.FLU.C11.0.C.N.Z.Z.Z.Z.6.0.M',
+    'aceite_pescado': 'F068.B1.FLU.C1E.0.C.N.Z.Z.Z.Z.6.0.M',
+    'salmon': 'F068.B1.FLU.C13.0.C.N.Z.Z.Z.Z.6.0.M',
+    'trucha': 'F068.B1.FLU.C14.0.C.N.Z.Z.Z.Z.6.0.M',
+    'merluza': 'F068.B1.FLU.C15.0.C.N.Z.Z.Z.Z.6.0.M',
+    'conservas_pescado': 'F068.B1.FLU.C16.0.C.N.Z.Z.Z.Z.6.0.M',
+    'moluscos': 'F068.B1.FLU.C17.0.C.N.Z.Z.Z.Z.6.0.M',
+    'fruta_desh': 'F068.B1.FLU.C18.0.C.N.Z.Z.Z.Z.6.0.M',
+    'fruta_cong': 'F068.B1.FLU.C19.0.C.N.Z.Z.Z.Z.6.0.M',
+    'fruta_jugo': 'F068.B1.FLU.C1A.0.C.N.Z.Z.Z.Z.6.0.M',
+    'fruta_conserva': 'F068.B1.FLU.C1B.0.C.N.Z.Z.Z.Z.6.0.M',
+    'carne_ave': 'F068.B1.FLU.C1C.0.C.N.Z.Z.Z.Z.6.0.M',
+    'carne_cerdo': 'F068.B1.FLU.C1D.0.C.N.Z.Z.Z.Z.6.0.M',
+    })
+def alimentos(alimentos, harina_pescado, aceite_pescado, salmon, trucha, merluza, conservas_pescado,
+              moluscos, fruta_desh, fruta_cong, fruta_jugo, fruta_conserva, carne_ave, carne_cerdo):
+    tabla = _unir(
+        [alimentos, harina_pescado, aceite_pescado, salmon, trucha, merluza, conservas_pescado,
+         moluscos, fruta_desh, fruta_cong, fruta_jugo, fruta_conserva, carne_ave, carne_cerdo],
+        ['total_fob_alimentos', 'Harina de\npescado', 'Aceite de\npescado',
+         'Salmón', 'Trucha', 'Merluza', 'Conservas\nde pescado',
+         'Moluscos y\ncrustáceos', 'Fruta\ndeshidratada',
+         'Fruta\ncongelada', 'Jugo fruta', 'Fruta\nconserva',
+         'Carne\nde ave', 'Carne\nde cerdo']
+        )
+    return {
+        'tabla': tabla,
+        'porcion': porcion(tabla, 'total_fob_alimentos'),
+        'pareto': pareto(tabla.iloc[-1, 1:]),
+        }
+
+#%% Pareto de todos los subsectores de las exportaciones
+
+@grafo.celda(entradas=['mineria', 'agropecuario', 'industriales'])
+def subsectores(mineria, agropecuario, industriales):
+    tabla = mineria['tabla'].iloc[:, 1:].join(agropecuario['tabla'].iloc[:, 1:]).join(industriales['tabla'].iloc[:, 1:])
+    tabla.columns = ['Cobre', 'Hierro', 'Plata', 'Oro', 'Molibdeno',
+                     'Litio', 'Sal', 'Frutícola', 'Semillas',
+                     'Silvicola', 'Pesca', 'Alimentos', 'Bebidas',
+                     'Forestal', 'Celulosa',
+                     'Químicos','Ind metálica',
+                     'Maquinaria', 'Otros Industriales']
+    return {
+        'tabla': tabla,
+        'pareto': pareto(tabla.iloc[-1, :]),
+        'pareto_sin_cobre': pareto(tabla.iloc[-1, 1:]),
+        }
+
+#%% Terminos de Comercio
+
+@grafo.celda(series={
+    # Exportaciones de bienes (FOB)
+    'exportaciones': 'F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M',
+    # Importaciones de bienes FOB (millones de dólares)
+    'importaciones': 'F068.B1.FLU.Z.0.D.N.0.T.Z.Z.6.0.M',
+    'dolar': ('F073.TCO.PRE.Z.D', {'rolling_': False}),
+    })
+def terminos_de_comercio(exportaciones, importaciones, dolar):
+    # todo al cierre de cada mes, el dolar diario con su mediana mensual
+    mensual = panel({'exportaciones': exportaciones, 'importaciones': importaciones, 'dolar': dolar},
+                    pd.offsets.MonthEnd(), {'dolar': 'median'})
+    tot = ((mensual['exportaciones'] / mensual['importaciones']) * 100).to_frame('value').dropna()
+    dolar = mensual[['dolar']].reindex(tot.index)
+    ciclo, tendencia_ = filtro_hp(tot, 1600*3**4)
+
+    # Relación entre el dolar y el TOT, solo los meses con ambos datos
+    pares = dolar.join(tot).dropna()
+    x = pares['dolar'].values
+    y = pares['value'].values
+    # calculando la regresion (x=dolar, y=tot) y su R2
+    modelo, r_2 = ajuste_lineal(x, y)
+    return {
+        'tot': tot,
+        'dolar': dolar,
+        'ciclo': ciclo,
+        'tendencia': tendencia_,
+        'x': x,
+        'y': y,
+        'modelo': modelo,
+        'r_2': r_2,
+        }
+
+#%% Relaciones entre subsectores y factores de mercado
+
+@grafo.celda(series={
+    'dolar': ('F073.TCO.PRE.Z.D', {'rolling_': False}),
+    'ipsa': ('F013.IBC.IND.N.7.LAC.CL.CLP.BLO.D', {'rolling_': False}),
+    # precio del cobre refinado BML (dólares por libra)
+    'cobre': ('F019.PPB.PRE.100.D', {'rolling_': False}),
+    }, entradas=['subsectores', 'terminos_de_comercio'])
+def relaciones(dolar, ipsa, cobre, subsectores, terminos_de_comercio):
+    factores = {'USDCLP': dolar, 'IPSA': ipsa, 'Precio cobre': cobre, 'TOT': terminos_de_comercio['tot']}
+    tabla = subsectores['tabla']
+    # factores y subsectores al cierre de cada mes, los diarios con su mediana mensual
+    mensual = panel({**factores, **{c: tabla[[c]] for c in tabla.columns}}, pd.offsets.MonthEnd(), operacion='median')
+    X, Y = mensual[list(factores)], mensual[tabla.columns]
+    # todas las parejas (subsector, factor) de una vez, y en ventanas de 3 años
+    return {
+        'ranking': regresiones(X, Y),
+        'moviles': regresiones_moviles(X, Y, 36),
+        # co-movimiento de las variaciones mensuales, subsectores y factores juntos
+        'correlaciones': correlaciones_moviles(mensual.pct_change(fill_method=None), 36, min_obs=24),
+        }
+
+#%% Salidas de macro.py: secciones '#%%' que las grafican y celdas que necesitan
+
+SALIDAS = {
+    'exportaciones': {
+        'secciones': ['Exportaciones de los principales productos chilenos'],
+        'celdas': ['comercio', 'exportaciones'],
+        },
+    'mineria': {
+        'secciones': ['Categoria: Mineria'],
+        'celdas': ['mineria'],
+        },
+    'agropecuario': {
+        'secciones': ['Categoria: Agropecuario-silvícola y pesquero', 'Grafico de torta para el sector fruticola'],
+        'celdas': ['agropecuario', 'fruticola'],
+        },
+    'industriales': {
+        'secciones': ['Categoria: Industriales'],
+        'celdas': ['industriales', 'alimentos'],
+        },
+    'subsectores': {
+        'secciones': ['Pareto de todos los subsectores de las exportaciones'],
+        'celdas': ['subsectores'],
+        },
+    'tot': {
+        'secciones': ['Terminos de Comercio'],
+        'celdas': ['terminos_de_comercio'],
+        },
+    'relaciones': {
+        'secciones': ['Relaciones entre subsectores y factores de mercado'],
+        'celdas': ['relaciones'],
+        },
+    }
+
+def salidas(nombres:list=None):
+    """
+    Secciones de macro.py y celdas necesarias para las salidas `nombres`.
+
+    Parameters
+    ----------
+    nombres : list, optional
+        Salidas solicitadas (llaves de SALIDAS). The default is None (todas).
+
+    Returns
+    -------
+    tuple
+        (secciones, celdas)
+
+    """
+    nombres = list(SALIDAS) if nombres is None else list(nombres)
+    desconocidas = [n for n in nombres if n not in SALIDAS]
+    if desconocidas:
+        raise ValueError(f"Salidas desconocidas {desconocidas}, las validas son {list(SALIDAS)}")
+    secciones = [s for n in nombres for s in SALIDAS[n]['secciones']]
+    celdas = grafo.orden([c for n in nombres for c in SALIDAS[n]['celdas']])
+    return secciones, celdas
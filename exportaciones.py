@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada de linea de comandos.
+
+    python exportaciones.py run macro|screener|valuation|all [--jobs N] [--only tot,mineria] [--fecha YYYY-MM-DD]
+    python exportaciones.py script macro.py [--seccion 'Terminos de Comercio']
+
+`run` ejecuta las etapas solicitadas y sus dependencias; las etapas
+independientes corren en paralelo. Primero se actualizan las series del
+Banco Central en el almacen columnar local y luego cada script las lee
+desde ahí (memoria mapeada) en su propio proceso; el panel de precios y
+los estados financieros también se comparten por el almacen. Los
+graficos de los scripts se guardan como PNG en 'graficos/<script>' del
+directorio de cache en vez de mostrarse. Las etapas simultaneas comparten los estados del
+cache (ventanas.pkl, precios.pkl): cada una los guarda dentro de un
+bloqueo de archivo, combinando lo que ya escribieron las demás.
+
+Con `--only` macro.py ejecuta solo las secciones '#%%' de las salidas
+pedidas (ver `etapas.SALIDAS`) y se descargan solo las series que éstas
+necesitan.
+
+Con `--fecha` la ejecución se fija a esa fecha: todos los datos se leen
+de las instantáneas guardadas hasta ese dia (instantaneas.py), sin red, y
+los resultados quedan en 'al/<fecha>' del directorio de cache.
+
+@author: lauta
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+from clientes import directorio_cache
+from planificador import Planificador
+
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+
+# Series del Banco Central que ocupan el screener y el valorizador
+SERIES_VALORIZACION = [
+    'F019.TBG.TAS.10.D', # tasa bonos del tesoro EEUU a 10 años
+    'F089.IPC.V12.14.M', # expectativas de inflación
+    'F019.SPS.PBP.91.D', # spread soberano
+    'F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T', # PIB
+    'F013.IBC.IND.N.7.LAC.CL.CLP.BLO.D', # IPSA
+    ]
+
+OBJETIVOS = {
+    'macro': ['macro'],
+    'screener': ['screener'],
+    'valuation': ['valuation'],
+    'all': ['macro', 'screener', 'valuation'],
+    }
+
+def _codigo_secciones(fuente:str, secciones:list):
+    """
+    Codigo del script con solo el encabezado y las secciones '#%%' pedidas.
+
+    Las lineas omitidas quedan en blanco para conservar la numeración en
+    los mensajes de error.
+    """
+    lineas, incluir, encontradas = [], True, set()
+    for linea in fuente.splitlines():
+        if linea.startswith('#%%'):
+            titulo = linea[3:].strip()
+            incluir = titulo in secciones
+            if incluir:
+                encontradas.add(titulo)
+        lineas.append(linea if incluir else '')
+    faltantes = [s for s in secciones if s not in encontradas]
+    if faltantes:
+        raise ValueError(f"El script no tiene las secciones {faltantes}")
+    return '\n'.join(lineas) + '\n'
+
+def ejecutar_script(ruta:str, secciones:list=None, carpeta_graficos:str=None):
+    """
+    Ejecutar un script guardando sus graficos.
+
+    Parameters
+    ----------
+    ruta : str
+        Script a ejecutar.
+    secciones : list, optional
+        Titulos de las secciones '#%%' a ejecutar, ademas del encabezado.
+        The default is None (todo el script).
+    carpeta_graficos : str, optional
+        Donde se guardan los graficos. The default is
+        'graficos/<script>' en el directorio de cache.
+
+    """
+    import runpy
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    carpeta_graficos = carpeta_graficos or os.path.join(directorio_cache(), 'graficos', nombre)
+    os.makedirs(carpeta_graficos, exist_ok=True)
+    contador = [0]
+
+    def guardar(*args, **kwargs):
+        for numero in plt.get_fignums():
+            contador[0] += 1
+            plt.figure(numero).savefig(os.path.join(carpeta_graficos, f'{contador[0]:02d}.png'), bbox_inches='tight')
+        plt.close('all')
+
+    plt.show = guardar
+    if secciones is None:
+        runpy.run_path(ruta, run_name='__main__')
+    else:
+        with open(ruta, encoding='utf-8') as archivo:
+            codigo = compile(_codigo_secciones(archivo.read(), secciones), ruta, 'exec')
+        exec(codigo, {'__name__': '__main__', '__file__': ruta})
+    guardar()
+
+def _script(archivo:str, secciones:list=None):
+    """Etapa que ejecuta un script (o algunas de sus secciones) en un proceso aparte."""
+    def correr():
+        entorno = dict(os.environ, EXPORTACIONES_ALMACEN='1', MPLBACKEND='Agg')
+        comando = [sys.executable, os.path.join(CARPETA, 'exportaciones.py'), 'script', archivo]
+        for seccion in secciones or []:
+            comando += ['--seccion', seccion]
+        subprocess.run(comando, cwd=CARPETA, env=entorno, check=True)
+    return correr
+
+def _series(codigos:list):
+    """Etapa que actualiza series del Banco Central en el almacen local."""
+    def correr():
+        from datos import refrescar
+        refrescar(codigos)
+    return correr
+
+def planificador(solo:list=None):
+    """
+    Etapas de una actualización completa y sus dependencias.
+
+    Parameters
+    ----------
+    solo : list, optional
+        Salidas de macro.py a generar (llaves de etapas.SALIDAS). The
+        default is None (todas).
+
+    """
+    from etapas import grafo, salidas
+
+    if solo is None:
+        secciones, codigos_macro = None, grafo.series()
+    else:
+        secciones, celdas = salidas(solo)
+        codigos_macro = grafo.series(celdas)
+
+    plan = Planificador()
+    plan.etapa('series_macro', _series(codigos_macro))
+    plan.etapa('series_valorizacion', _series(SERIES_VALORIZACION))
+    plan.etapa('macro', _script('macro.py', secciones), ['series_macro'])
+    plan.etapa('screener', _script('acciones_exportadoras.py'), ['series_valorizacion'])
+    plan.etapa('valuation', _script('valorizador_empresas_ciclicas.py'), ['series_valorizacion'])
+    return plan
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(prog='exportaciones', description=__doc__.split('\n\n')[0])
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    run = comandos.add_parser('run', help='ejecutar etapas y sus dependencias')
+    run.add_argument('objetivo', choices=sorted(OBJETIVOS))
+    run.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                     help='numero maximo de etapas simultaneas')
+    run.add_argument('--only', type=lambda texto: [s.strip() for s in texto.split(',') if s.strip()],
+                     help='salidas de macro.py separadas por coma (tot, mineria, ...)')
+    run.add_argument('--fecha', help='repetir la ejecución con los datos vigentes a esa fecha (YYYY-MM-DD)')
+
+    script = comandos.add_parser('script', help='ejecutar un script guardando sus graficos')
+    script.add_argument('ruta')
+    script.add_argument('--seccion', action='append', dest='secciones',
+                        help="titulo de una sección '#%%%%' a ejecutar (se puede repetir)")
+
+    argumentos = parser.parse_args(argumentos)
+
+    if argumentos.comando == 'script':
+        ejecutar_script(argumentos.ruta, argumentos.secciones)
+        return 0
+
+    if argumentos.fecha:
+        # lo heredan los procesos de cada script
+        os.environ['EXPORTACIONES_FECHA'] = argumentos.fecha
+
+    # las etapas de series escriben en el almacen que luego leen los scripts
+    from almacen import AlmacenColumnar
+    from datos import usar_almacen
+    usar_almacen(AlmacenColumnar())
+
+    estados = planificador(argumentos.only).ejecutar(OBJETIVOS[argumentos.objetivo], jobs=argumentos.jobs)
+    return 0 if all(estado == 'ok' for estado in estados.values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Alineación de series diarias, mensuales y trimestrales a una frecuencia
+común.
+
+`panel` recibe varias series (codigos del Banco Central o DataFrames ya
+calculados), agrupa las que tienen la misma frecuencia nativa y la misma
+operación de agregación, y hace un solo `resample` por grupo. Todas las
+fechas quedan al cierre del periodo (igual que `.to_period('M')
+.to_timestamp('M')`), de modo que las series quedan alineadas sin
+`filter(items=...)`. Las series remuestreadas se guardan en memoria y se
+reutilizan mientras la serie no cambie: las del Banco Central por su
+codigo y los DataFrames (p.ej. los que reciben las celdas de etapas.py)
+por un hash de sus fechas y valores.
+
+La frecuencia nativa se lee del catalogo del almacen columnar o, si no
+está, del codigo de la serie.
+
+@author: lauta
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from datos import serie_macro, almacen_actual
+from calculos import frecuencia_nativa
+
+
+_NIVELES = {'D': 0, 'B': 0, 'W': 1, 'M': 2, 'Q': 3, 'A': 4, 'Y': 4}
+# alias de cierre de periodo que las versiones recientes de pandas ya no aceptan
+_DESFASES = {'M': pd.offsets.MonthEnd(), 'Q': pd.offsets.QuarterEnd(), 'A': pd.offsets.YearEnd(),
+             'Y': pd.offsets.YearEnd()}
+
+_candado = threading.Lock()
+_remuestreadas = {}
+# DataFrames por contenido: las versiones anteriores no se vuelven a pedir
+_por_contenido = OrderedDict()
+_MAX_CONTENIDO = 256
+
+def _huella(serie_:pd.Series):
+    """Hash de las fechas y valores de una serie."""
+    filas = pd.util.hash_pandas_object(serie_, index=True).to_numpy()
+    return hashlib.sha1(filas.tobytes()).hexdigest()
+
+def _nivel(frecuencia):
+    """Orden de una frecuencia ('M', 'QE-DEC', MonthEnd(), ...) de la más fina a la más gruesa."""
+    if not isinstance(frecuencia, str):
+        frecuencia = frecuencia.name
+    return _NIVELES[frecuencia.upper().lstrip('0123456789')[0]]
+
+def frecuencia(codigo:str):
+    """
+    Frecuencia nativa de una serie del Banco Central ('D', 'M', 'Q' o 'A').
+    """
+    almacen = almacen_actual()
+    if almacen is not None:
+        registrada = almacen.frecuencia(codigo)
+        if registrada is not None:
+            return registrada
+    return frecuencia_nativa(codigo)
+
+def _remuestrear(tabla:pd.DataFrame, nativa:str, destino:str, operacion:str):
+    """Un solo resample para todas las columnas de un grupo."""
+    nivel = _nivel(destino) if nativa is None else _nivel(nativa)
+    if nivel < _nivel(destino):
+        remuestreo = tabla.resample(destino)
+        if operacion == 'sum':
+            # un periodo sin datos queda NaN, no 0
+            return remuestreo.sum(min_count=1)
+        return getattr(remuestreo, operacion)()
+    # misma frecuencia: solo llevar las fechas al cierre del periodo
+    remuestreada = tabla.resample(destino).last()
+    # frecuencia más gruesa que el destino: repetir el ultimo dato conocido
+    return remuestreada.ffill() if nivel > _nivel(destino) else remuestreada
+
+def panel(series, frecuencia_, operaciones:dict=None, operacion:str='mean', how:str='outer'):
+    """
+    Tabla con las series alineadas a la frecuencia `frecuencia_`.
+
+    Parameters
+    ----------
+    series : dict | list
+        nombre -> codigo BCCh o DataFrame de una columna. Una lista de
+        codigos ocupa los codigos como nombres.
+    frecuencia_ : pd.DateOffset | str
+        Frecuencia de destino (pd.offsets.MonthEnd(), QuarterEnd(), ...).
+        Los alias 'M', 'Q' y 'A' se leen como esos desfases.
+    operaciones : dict, optional
+        nombre -> operación de agregación ('mean', 'median', 'sum',
+        'last', ...) para las series de mayor frecuencia que el destino.
+        The default is None.
+    operacion : str, optional
+        Operación para las series que no están en `operaciones`. The
+        default is 'mean'.
+    how : str, optional
+        'outer' conserva todas las fechas, 'inner' solo las comunes. The
+        default is 'outer'.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una columna por serie, indexada al cierre de cada periodo.
+
+    """
+    if not isinstance(series, dict):
+        series = {codigo: codigo for codigo in series}
+    operaciones = operaciones or {}
+    frecuencia_ = _DESFASES.get(frecuencia_, frecuencia_)
+
+    columnas, grupos = {}, {}
+    for nombre, serie in series.items():
+        operacion_ = operaciones.get(nombre, operacion)
+        if isinstance(serie, str):
+            datos = serie_macro(serie)
+            llave = (serie, frecuencia_, operacion_)
+            with _candado:
+                guardada = _remuestreadas.get(llave)
+            # la serie memorizada en datos sigue siendo la misma?
+            if guardada is not None and np.may_share_memory(guardada[0], datos.to_numpy()):
+                columnas[nombre] = guardada[1]
+                continue
+            nativa = frecuencia(serie)
+        else:
+            datos = serie
+            llave = (_huella(serie.iloc[:, 0]), frecuencia_, operacion_)
+            with _candado:
+                guardada = _por_contenido.get(llave)
+                if guardada is not None:
+                    _por_contenido.move_to_end(llave)
+            if guardada is not None:
+                columnas[nombre] = guardada
+                continue
+            nativa = frecuencia_nativa(None, serie)
+        grupos.setdefault((nativa, operacion_), []).append((nombre, datos, llave))
+
+    for (nativa, operacion_), miembros in grupos.items():
+        tabla = pd.concat([d.iloc[:, 0].rename(n) for n, d, _ in miembros], axis=1)
+        remuestreada = _remuestrear(tabla, nativa, frecuencia_, operacion_)
+        for nombre, datos, llave in miembros:
+            columnas[nombre] = remuestreada[nombre].dropna()
+            with _candado:
+                if isinstance(series[nombre], str):
+                    _remuestreadas[llave] = (datos.to_numpy(), columnas[nombre])
+                else:
+                    _por_contenido[llave] = columnas[nombre]
+                    if len(_por_contenido) > _MAX_CONTENIDO:
+                        _por_contenido.popitem(last=False)
+
+    return pd.concat([columnas[nombre].rename(nombre) for nombre in series], axis=1, join=how)
+
+def serie_frecuencia(codigo:str, frecuencia_, operacion:str='mean'):
+    """
+    Serie del Banco Central en la frecuencia `frecuencia_` (memorizada).
+
+    Returns
+    -------
+    pd.DataFrame
+        Columna 'value' indexada al cierre de cada periodo.
+
+    """
+    return panel({'value': codigo}, frecuencia_, operacion=operacion)
+
+def olvidar():
+    """
+    Borrar las series remuestreadas guardadas en memoria.
+    """
+    with _candado:
+        _remuestreadas.clear()
+        _por_contenido.clear()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Instantáneas inmutables de todo lo que se descarga de las APIs.
+
+Cada respuesta (series del Banco Central, fundamentales, precios, paginas
+bulk de EOD, series de FRED) se divide en trozos que se guardan
+comprimidos en 'objetos/', con el hash de su contenido como nombre: las
+tablas con fechas por año, las demás tablas y las listas largas cada
+`OBSERVACIONES` filas, y los diccionarios por llave. Así una serie a la
+que se agregó un dia solo guarda de nuevo el trozo de su ultimo año, y un
+trozo que no cambió entre ejecuciones se guarda una sola vez. Por cada
+solicitud hay un indice ('indices/') con la fecha de cada captura y la
+lista de trozos que le corresponde, de modo que se puede pedir la
+respuesta vigente a cualquier fecha.
+
+Con EXPORTACIONES_FECHA=YYYY-MM-DD (o `exportaciones.py run ... --fecha`)
+`capturar` y los clientes responden solo desde las instantáneas vigentes a
+esa fecha, sin tocar la red; una solicitud que no se hizo hasta esa fecha
+levanta `SinInstantanea`. EXPORTACIONES_INSTANTANEAS=0 deja de guardarlas.
+
+@author: lauta
+"""
+
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from clientes import directorio_base, fecha_consulta
+
+
+# filas de cada trozo de las tablas sin fechas y de las listas
+OBSERVACIONES = 1000
+
+
+def _trozo(tabla, inicio:int, fin:int):
+    """
+    Filas `inicio:fin` de `tabla` como copia y sin frecuencia en el indice,
+    para que el mismo trozo tenga la misma huella en cada captura.
+    """
+    trozo = tabla.iloc[inicio:fin].copy()
+    if isinstance(trozo.index, pd.DatetimeIndex):
+        trozo.index = pd.DatetimeIndex(trozo.index, freq=None)
+    return trozo
+
+
+class SinInstantanea(LookupError):
+    """La solicitud no tiene una instantánea vigente a la fecha de consulta."""
+
+
+class Instantaneas:
+    """
+    Almacen de objetos direccionados por contenido con un indice por fecha.
+
+    Parameters
+    ----------
+    ruta : str, optional
+        Carpeta del almacen. The default is 'instantaneas' en el directorio
+        de cache base (compartido por todas las fechas de consulta).
+
+    """
+
+    def __init__(self, ruta:str=None):
+        self.ruta = ruta or os.path.join(directorio_base(), 'instantaneas')
+        os.makedirs(os.path.join(self.ruta, 'objetos'), exist_ok=True)
+        os.makedirs(os.path.join(self.ruta, 'indices'), exist_ok=True)
+        self._candado = threading.Lock()
+
+    def _objeto(self, huella:str):
+        return os.path.join(self.ruta, 'objetos', huella[:2], huella + '.z')
+
+    def _indice(self, clave:str):
+        return os.path.join(self.ruta, 'indices', hashlib.sha1(clave.encode('utf-8')).hexdigest() + '.jsonl')
+
+    def _registros(self, clave:str):
+        try:
+            with open(self._indice(clave), encoding='utf-8') as archivo:
+                return [json.loads(linea) for linea in archivo if linea.strip()]
+        except FileNotFoundError:
+            return []
+
+    def historial(self, clave:str):
+        """
+        Capturas de `clave`: lista de (fecha, huella) de la más antigua a la más reciente.
+        """
+        return [(pd.Timestamp(r['fecha']), r['objeto']) for r in self._registros(clave)]
+
+    def _guardar_objeto(self, contenido):
+        """Guardar un trozo (si no existe ya) y entregar su huella."""
+        datos = pickle.dumps(contenido, protocol=pickle.HIGHEST_PROTOCOL)
+        huella = hashlib.sha256(datos).hexdigest()
+        objeto = self._objeto(huella)
+        if not os.path.exists(objeto):
+            os.makedirs(os.path.dirname(objeto), exist_ok=True)
+            temporal = f'{objeto}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporal, 'wb') as archivo:
+                archivo.write(zlib.compress(datos, 6))
+            os.replace(temporal, objeto)
+        return huella
+
+    def _leer_objeto(self, huella:str):
+        with open(self._objeto(huella), 'rb') as archivo:
+            return pickle.loads(zlib.decompress(archivo.read()))
+
+    def _partir(self, contenido, nivel:int=0):
+        """
+        Guardar `contenido` en trozos y describir cómo rearmarlo.
+
+        Las tablas se cortan por año (o cada OBSERVACIONES filas) y las
+        listas largas cada OBSERVACIONES elementos. Los diccionarios y
+        tuplas se recorren en el primer nivel, o más abajo si contienen
+        tablas o listas; lo demás queda en un solo trozo.
+        """
+        if isinstance(contenido, (pd.DataFrame, pd.Series)) and len(contenido):
+            if isinstance(contenido.index, pd.DatetimeIndex):
+                anual = contenido.index.year
+                cortes = (np.flatnonzero(anual[1:] != anual[:-1]) + 1).tolist()
+            else:
+                cortes = list(range(OBSERVACIONES, len(contenido), OBSERVACIONES))
+            limites = [0] + cortes + [len(contenido)]
+            return {'tabla': [self._guardar_objeto(_trozo(contenido, i, j)) for i, j in zip(limites[:-1], limites[1:])]}
+        if type(contenido) is list and len(contenido) > OBSERVACIONES:
+            return {'lista': [self._guardar_objeto(contenido[i:i + OBSERVACIONES])
+                              for i in range(0, len(contenido), OBSERVACIONES)]}
+        if type(contenido) in (dict, tuple):
+            valores = list(contenido.values()) if type(contenido) is dict else list(contenido)
+            divisible = any(isinstance(v, (pd.DataFrame, pd.Series, list)) for v in valores)
+            if nivel == 0 or divisible:
+                if type(contenido) is tuple:
+                    return {'tupla': [self._partir(v, nivel + 1) for v in contenido]}
+                if all(isinstance(llave, str) for llave in contenido):
+                    return {'dict': [[llave, self._partir(v, nivel + 1)] for llave, v in contenido.items()]}
+        return {'objeto': self._guardar_objeto(contenido)}
+
+    def _rearmar(self, trozos:dict):
+        """Inverso de `_partir`."""
+        tipo, partes = next(iter(trozos.items()))
+        if tipo == 'objeto':
+            return self._leer_objeto(partes)
+        if tipo == 'tabla':
+            return pd.concat([self._leer_objeto(huella) for huella in partes])
+        if tipo == 'lista':
+            return [elemento for huella in partes for elemento in self._leer_objeto(huella)]
+        if tipo == 'tupla':
+            return tuple(self._rearmar(parte) for parte in partes)
+        return {llave: self._rearmar(parte) for llave, parte in partes}
+
+    def guardar(self, clave:str, contenido, fecha=None):
+        """
+        Guardar `contenido` como la respuesta de `clave` a la fecha `fecha`.
+
+        Parameters
+        ----------
+        clave : str
+            Identificador de la solicitud ('bcch/F073.TCO.PRE.Z.D', ...).
+        contenido : object
+            Respuesta de la API (cualquier objeto serializable con pickle).
+        fecha : pd.Timestamp, optional
+            Momento de la captura. The default is None (ahora).
+
+        Returns
+        -------
+        str
+            Huella (sha256) de la lista de trozos del contenido.
+
+        """
+        trozos = self._partir(contenido)
+        huella = hashlib.sha256(json.dumps(trozos).encode('utf-8')).hexdigest()
+
+        with self._candado:
+            historial = self.historial(clave)
+            # sin cambios desde la ultima captura: el indice ya la cubre
+            if not historial or historial[-1][1] != huella:
+                fecha = pd.Timestamp.now() if fecha is None else pd.Timestamp(fecha)
+                registro = json.dumps({'fecha': fecha.isoformat(), 'objeto': huella, 'trozos': trozos, 'clave': clave})
+                # una sola escritura en modo append, segura entre procesos
+                with open(self._indice(clave), 'a', encoding='utf-8') as archivo:
+                    archivo.write(registro + '\n')
+        return huella
+
+    def leer(self, clave:str, al=None):
+        """
+        Respuesta de `clave` vigente al final del dia `al`.
+
+        Parameters
+        ----------
+        clave : str
+            Identificador de la solicitud.
+        al : str | pd.Timestamp, optional
+            Fecha de consulta. The default is None (la ultima captura).
+
+        Returns
+        -------
+        object
+
+        """
+        registros = self._registros(clave)
+        if al is not None:
+            limite = pd.Timestamp(al).normalize() + pd.Timedelta(days=1)
+            fechas = [pd.Timestamp(r['fecha']) for r in registros]
+            registros = registros[:bisect_right(fechas, limite - pd.Timedelta(microseconds=1))]
+        if not registros:
+            raise SinInstantanea(f"No hay instantánea de {clave} al {al}")
+        # las capturas anteriores a los trozos guardaban la respuesta en un solo objeto
+        return self._rearmar(registros[-1].get('trozos', {'objeto': registros[-1]['objeto']}))
+
+    def claves(self):
+        """
+        Claves con al menos una captura.
+        """
+        claves = []
+        for nombre in os.listdir(os.path.join(self.ruta, 'indices')):
+            with open(os.path.join(self.ruta, 'indices', nombre), encoding='utf-8') as archivo:
+                primera = archivo.readline()
+            if primera.strip():
+                claves.append(json.loads(primera)['clave'])
+        return sorted(claves)
+
+
+@lru_cache(maxsize=None)
+def instantaneas():
+    """
+    Almacen de instantáneas del proceso (None si EXPORTACIONES_INSTANTANEAS=0).
+    """
+    if os.environ.get('EXPORTACIONES_INSTANTANEAS', '1') == '0':
+        return None
+    return Instantaneas()
+
+def registrar(clave:str, contenido):
+    """
+    Guardar una respuesta recién descargada (si las instantáneas están activas).
+    """
+    almacen = instantaneas()
+    if almacen is not None and fecha_consulta() is None:
+        almacen.guardar(clave, contenido)
+    return contenido
+
+def capturar(clave:str, solicitar):
+    """
+    Respuesta de `solicitar()`, guardada como instantánea de `clave`.
+
+    Con una fecha de consulta fijada no se llama a `solicitar`: se entrega
+    la instantánea vigente a esa fecha.
+
+    Parameters
+    ----------
+    clave : str
+        Identificador de la solicitud.
+    solicitar : callable
+        Solicitud a la API, sin argumentos.
+
+    """
+    fecha = fecha_consulta()
+    if fecha is not None:
+        almacen = instantaneas() or Instantaneas()
+        return almacen.leer(clave, fecha)
+    return registrar(clave, solicitar())
+
+def clave_llamada(prefijo:str, metodo:str, args:tuple, kwargs:dict):
+    """'eod/get_prices_eod/SQM-B.SN/from=2024-01-02' para una llamada a un cliente."""
+    partes = [prefijo, metodo] + [str(a) for a in args] + [f'{k}={kwargs[k]}' for k in sorted(kwargs)]
+    return '/'.join(partes)
+
+
+class ClienteCapturado:
+    """
+    Envuelve un cliente de API para que cada llamada pase por `capturar`.
+
+    Parameters
+    ----------
+    cliente : object
+        Cliente real (EodHistoricalData, fredpy). None cuando la ejecución
+        está fijada a una fecha y solo se responde desde las instantáneas.
+    prefijo : str
+        Prefijo de las claves ('eod', 'fred').
+
+    """
+
+    def __init__(self, cliente, prefijo:str):
+        self._cliente = cliente
+        self._prefijo = prefijo
+
+    def __getattr__(self, nombre:str):
+        atributo = getattr(self._cliente, nombre) if self._cliente is not None else None
+        if self._cliente is not None and not callable(atributo):
+            return atributo
+
+        def llamar(*args, **kwargs):
+            return capturar(clave_llamada(self._prefijo, nombre, args, kwargs), lambda: atributo(*args, **kwargs))
+        return llamar
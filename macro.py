@@ -5,77 +5,18 @@ Created on Mon Jul 25 11:28:38 2022
 @author: lauta
 """
 
-import os
+from etapas import grafo
 
-from bcch import BancoCentralDeChile
-
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.ticker import PercentFormatter
 
-# Por seguridad, es mejor guardar las contraseñas y usuarios en las variables de entorno
-bcch_user = os.environ['BCCH_USER']
-bcch_pwd = os.environ['BCCH_PWD']
-
-# Creación de la instancia
-client = BancoCentralDeChile(bcch_user, bcch_pwd)
-
-def cleaner(serie:str, rolling_:bool=True, window:int=12, operacion_:str='sum'):
-    """
-    Solicitar datos a la API del Banco central por medio del cliente
-    bcch. Adicionamente se hacen operaciones para limpiar los datos.
-
-    Parameters
-    ----------
-    serie : str
-        codigo de la serie.
-    rolling_ : bool, optional
-        Seguimiento anual?. The default is True.
-    window : int
-        Numero de periodos para el calculo
-    operacion_ : str, optional
-        Operación para hacer el re-muestreo. The default is None.
-
-    Returns
-    -------
-    serie_ : TYPE
-        Datos historicos para la serie solicitada.
-
-    """
-    serie_ = pd.DataFrame(client.get_macro(serie=serie))
-    serie_['value'] = pd.to_numeric(serie_['value'], errors='coerce')
-    serie_['indexDateString'] = pd.to_datetime(serie_['indexDateString'], format='%d-%m-%Y')
-    serie_.set_index('indexDateString', inplace=True)
-    del serie_['statusCode']
-    
-    # casos posibles
-    try:
-        if (rolling_) & (operacion_ == 'sum'):
-            serie_ = serie_.rolling(window=window).sum()
-            return serie_
-        
-        elif (rolling_) & (operacion_ == 'mean'):
-            serie_ = serie_.rolling(window=window).mean()
-            return serie_
-        else:
-            return serie_
-    except:
-        print("Los unicos valores validos para la operacion son 'sum' y 'mean'")
-
 #%% Exportaciones de los principales productos chilenos
 
-# Exportaciones de bienes FOB (millones de dólares)
-exportaciones_bienes = cleaner('F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M', rolling_=False).resample('Q').sum().rolling(window=4).sum()
-# Servicios, exportaciones (millones de dólares)
-exportaciones_servicios = cleaner('F068.B2.FLU.Z.0.C.N.Z.T.Z.Z.6.0.T', window=4).to_period('Q').to_timestamp('Q')
-
-comercio = exportaciones_bienes.join(exportaciones_servicios, rsuffix='_1')
-comercio.columns = ['bienes', 'servicios']
-comercio.fillna(method='ffill', inplace=True)
-comercio['total_exportaciones'] = comercio['bienes'] + comercio['servicios']
-comercio = comercio.divide(comercio['total_exportaciones'], axis=0) * 100
+# Solo se recalculan las celdas cuyas series o codigo cambiaron (ver etapas.py)
+resultados = grafo.ejecutar(['comercio', 'exportaciones'])
+comercio = resultados['comercio']
 
 fig, ax = plt.subplots(figsize=(10, 5))
 
@@ -105,32 +46,9 @@ ax.text(0.15, -0.12,
 plt.show()
 
 
-# Solicitar los datos
-exportaciones = cleaner('F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M')
-exp_mineras = cleaner('F068.B1.FLU.A.0.C.N.Z.Z.Z.Z.6.0.M')
-exp_agro = cleaner('F068.B1.FLU.B.0.C.N.Z.Z.Z.Z.6.0.M')
-exp_ind = cleaner('F068.B1.FLU.C.0.C.N.Z.Z.Z.Z.6.0.M')
-
-# Unir todo
-exportaciones = exportaciones.join(exp_mineras, rsuffix='_min').join(exp_agro, rsuffix='_agro').join(exp_ind, rsuffix='_ind')
-# cambiar los nombres
-exportaciones.columns = ['total_fob', 'Minería', 'Agropecuario', 'Industriales']
-
-# Crear porcentajes de cada serie por cada mes
-exportaciones_porcion = exportaciones.divide(exportaciones['total_fob'], axis=0) * 100
-
-# Grafico pareto exportaciones totales
-pareto_exportaciones = pd.DataFrame(
-    data=exportaciones.iloc[-1, 1:].values,
-    columns=['count'],
-    index=exportaciones.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_exportaciones = pareto_exportaciones.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_exportaciones['cumperc'] = pareto_exportaciones['count'].cumsum() / pareto_exportaciones['count'].sum() * 100
+exportaciones = resultados['exportaciones']['tabla']
+exportaciones_porcion = resultados['exportaciones']['porcion']
+pareto_exportaciones = resultados['exportaciones']['pareto']
 
 # Crear el grafico
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -192,34 +110,10 @@ plt.show()
 
 #%% Categoria: Mineria
 
-cobre = cleaner('F068.B1.FLU.A1.0.C.N.Z.Z.Z.Z.6.0.M')
-catodos = cleaner('F068.B1.FLU.A2.0.C.N.Z.Z.Z.Z.6.0.M')
-concentrado = cleaner('F068.B1.FLU.A3.0.C.N.Z.Z.Z.Z.6.0.M')
-hierro = cleaner('F068.B1.FLU.A4.0.C.N.Z.Z.Z.Z.6.0.M')
-plata = cleaner('F068.B1.FLU.A5.0.C.N.Z.Z.Z.Z.6.0.M')
-oro = cleaner('F068.B1.FLU.A6.0.C.N.Z.Z.Z.Z.6.0.M')
-molibdeno = cleaner('F068.B1.FLU.A7.0.C.N.Z.Z.Z.Z.6.0.M')
-litio = cleaner('F068.B1.FLU.A8.0.C.N.Z.Z.Z.Z.6.0.M')
-sal = cleaner('F068.B1.FLU.A9.0.C.N.Z.Z.Z.Z.6.0.M')
-
-mineras = exp_mineras.join(cobre, rsuffix='_1').join(hierro, rsuffix='_2').join(plata, rsuffix='_3').join(oro, rsuffix='_4').join(molibdeno, rsuffix='_5').join(litio, rsuffix='_6').join(sal, rsuffix='_7')
-mineras.columns = ['total_mineras_fob', 'Cobre', 'Hierro', 'Plata', 'Oro', 'Molibdeno', 'Litio', 'Sal']
-
-# Crear porcentajes de cada serie por cada mes
-mineras_porcion = mineras.divide(mineras['total_mineras_fob'], axis=0) * 100
-
-# Grafico pareto mineria
-pareto_mineria = pd.DataFrame(
-    data=mineras.iloc[-1, 1:].values,
-    columns=['count'],
-    index=mineras.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_mineria = pareto_mineria.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_mineria['cumperc'] = pareto_mineria['count'].cumsum() / pareto_mineria['count'].sum() * 100
+resultados = grafo.ejecutar(['mineria'])
+mineras = resultados['mineria']['tabla']
+mineras_porcion = resultados['mineria']['porcion']
+pareto_mineria = resultados['mineria']['pareto']
 
 # Crear el grafico
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -282,9 +176,7 @@ ax.text(0.15, -0.12,
 plt.show()
 
 #Mineras de cobre
-mineras_cobre = exp_mineras.join(catodos, lsuffix='_fob', rsuffix='_1').join(concentrado, rsuffix='_2')
-mineras_cobre.columns = ['mineras_fob', 'catodos', 'concentrados']
-mineras_cobre = mineras_cobre.divide(mineras_cobre['mineras_fob'], axis=0) * 100
+mineras_cobre = resultados['mineria']['cobre']
 
 fig, ax = plt.subplots(figsize=(10, 5))
 
@@ -315,27 +207,10 @@ plt.show()
 
 #%% Categoria: Agropecuario-silvícola y pesquero
 
-fruticolas = cleaner('F068.B1.FLU.B1.0.C.N.Z.Z.Z.Z.6.0.M')
-semillas = cleaner('F068.B1.FLU.B2.0.C.N.Z.Z.Z.Z.6.0.M') # es lo mismo que otros
-silvicola = cleaner('F068.B1.FLU.B3.0.C.N.Z.Z.Z.Z.6.0.M')
-pesca = cleaner('F068.B1.FLU.B4.0.C.N.Z.Z.Z.Z.6.0.M')
-
-agropecuario = exp_agro.join(fruticolas, rsuffix='_1').join(semillas, rsuffix='_2').join(silvicola, rsuffix='_3').join(pesca, rsuffix='_4')
-agropecuario.columns = ['total_agro_fob', 'Frutícola', 'Semillas', 'Silvicola', 'Pesca']
-agropecuario_proporcion = agropecuario.divide(agropecuario['total_agro_fob'], axis=0) * 100
-
-# Grafico pareto agropecuario
-pareto_agropecuario = pd.DataFrame(
-    data=agropecuario.iloc[-1, 1:].values,
-    columns=['count'],
-    index=agropecuario.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_agropecuario = pareto_agropecuario.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_agropecuario['cumperc'] = pareto_agropecuario['count'].cumsum() / pareto_agropecuario['count'].sum() * 100
+resultados = grafo.ejecutar(['agropecuario', 'fruticola'])
+agropecuario = resultados['agropecuario']['tabla']
+agropecuario_proporcion = resultados['agropecuario']['porcion']
+pareto_agropecuario = resultados['agropecuario']['pareto']
 
 # Crear el grafico
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -394,31 +269,8 @@ ax.text(0.15, -0.12,
 
 plt.show()
 
-# Desgloce del sector fruticola
-uvas = cleaner('F068.B1.FLU.B11.0.C.N.Z.Z.Z.Z.6.0.M')
-manzanas = cleaner('F068.B1.FLU.B12.0.C.N.Z.Z.Z.Z.6.0.M')
-peras = cleaner('F068.B1.FLU.B13.0.C.N.Z.Z.Z.Z.6.0.M')
-arandanos = cleaner('F068.B1.FLU.B14.0.C.N.Z.Z.Z.Z.6.0.M')
-kiwis = cleaner('F068.B1.FLU.B15.0.C.N.Z.Z.Z.Z.6.0.M')
-ciruelas = cleaner('F068.B1.FLU.B16.0.C.N.Z.Z.Z.Z.6.0.M')
-cerezas = cleaner('F068.B1.FLU.B17.0.C.N.Z.Z.Z.Z.6.0.M')
-paltas = cleaner('F068.B1.FLU.B18.0.C.N.Z.Z.Z.Z.6.0.M')
-
-sector_fruticola = uvas.join(manzanas, rsuffix='_1').join(peras, rsuffix='_2').join(arandanos, rsuffix='_3').join(kiwis, rsuffix='_4').join(ciruelas, rsuffix='_5').join(cerezas, rsuffix='_6').join(paltas, rsuffix='_7')
-sector_fruticola.columns = ['Uvas', 'Manzanas', 'Peras', 'Arandanos', 'Kiwis', 'Ciruelas', 'Cerezas', 'Paltas'] 
-
-# Grafico pareto agropecuario fruticola
-sector_fruticola = pd.DataFrame(
-    data=sector_fruticola.iloc[-1, :].values,
-    columns=['count'],
-    index=sector_fruticola.columns
-    )
-
-# ordenarlas de manera descendente
-sector_fruticola = sector_fruticola.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-sector_fruticola['cumperc'] = sector_fruticola['count'].cumsum() / sector_fruticola['count'].sum() * 100
+# Desgloce del sector fruticola, pareto agropecuario fruticola
+sector_fruticola = resultados['fruticola']['pareto']
 
 # Crear el grafico
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -469,10 +321,7 @@ wedges, *_ = ax1.pie(overall_ratios, autopct='%0.1f%%', startangle=angle,
                      labels=labels, explode=explode)
 
 # bar chart parameters
-sector_fruticola = uvas.join(manzanas, rsuffix='_1').join(peras, rsuffix='_2').join(arandanos, rsuffix='_3').join(kiwis, rsuffix='_4').join(ciruelas, rsuffix='_5').join(cerezas, rsuffix='_6').join(paltas, rsuffix='_7')
-sector_fruticola.columns = ['Uvas', 'Manzanas', 'Peras', 'Arandanos', 'Kiwis', 'Ciruelas', 'Cerezas', 'Paltas'] 
-
-sector_fruticola_porcion = sector_fruticola.divide(agropecuario['Frutícola'], axis=0).iloc[-1, :].sort_values(ascending=True) * 100
+sector_fruticola_porcion = resultados['fruticola']['porcion']
 
 age_ratios = sector_fruticola_porcion.to_list()
 age_labels = sector_fruticola_porcion.index.to_list()
@@ -527,31 +376,10 @@ plt.show()
 
 #%% Categoria: Industriales
 
-alimentos = cleaner('F068.B1.FLU.C1.0.C.N.Z.Z.Z.Z.6.0.M')
-bebidas = cleaner('F068.B1.FLU.C2.0.C.N.Z.Z.Z.Z.6.0.M')
-forestal = cleaner('F068.B1.FLU.C3.0.C.N.Z.Z.Z.Z.6.0.M')
-celulosa = cleaner('F068.B1.FLU.C4.0.C.N.Z.Z.Z.Z.6.0.M')
-quimicos = cleaner('F068.B1.FLU.C5.0.C.N.Z.Z.Z.Z.6.0.M')
-metalica = cleaner('F068.B1.FLU.C6.0.C.N.Z.Z.Z.Z.6.0.M')
-maquinaria = cleaner('F068.B1.FLU.C7.0.C.N.Z.Z.Z.Z.6.0.M')
-otros = cleaner('F068.B1.FLU.C9.0.C.N.Z.Z.Z.Z.6.0.M')
-
-industriales = exp_ind.join(alimentos, rsuffix='_1').join(bebidas, rsuffix='_2').join(forestal, rsuffix='_3').join(celulosa, rsuffix='_4').join(quimicos, rsuffix='_5').join(metalica, rsuffix='_6').join(maquinaria, rsuffix='_7').join(otros, rsuffix='_8')
-industriales.columns = ['total_industrial_fob', 'Alimentos', 'Bebidas\ny tabaco', 'Forestal y\nmuebles de\nmadera', 'Celulosa, papel\ny otros', 'Productos\nquímicos', 'Industria metálica\nbasica', 'Maquinaria y\nequipos', 'Otros']
-industriales_proporcion = industriales.divide(industriales['total_industrial_fob'], axis=0) * 100
-
-# Grafico pareto industriales
-pareto_industriales = pd.DataFrame(
-    data=industriales.iloc[-1, 1:].values,
-    columns=['count'],
-    index=industriales.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_industriales = pareto_industriales.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_industriales['cumperc'] = pareto_industriales['count'].cumsum() / pareto_industriales['count'].sum() * 100
+resultados = grafo.ejecutar(['industriales', 'alimentos'])
+industriales = resultados['industriales']['tabla']
+industriales_proporcion = resultados['industriales']['porcion']
+pareto_industriales = resultados['industriales']['pareto']
 
 # Crear el grafico
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -620,41 +448,9 @@ ax.text(0.15, -0.12,
 plt.show()
 
 # Desglose categoria alimentos
-harina_pescado = cleaner('F068.B1.FLU.C11.0.C.N.Z.Z.Z.Z.6.0.M')
-aceite_pescado = cleaner('F068.B1.FLU.C1E.0.C.N.Z.Z.Z.Z.6.0.M')
-salmon = cleaner('F068.B1.FLU.C13.0.C.N.Z.Z.Z.Z.6.0.M')
-trucha = cleaner('F068.B1.FLU.C14.0.C.N.Z.Z.Z.Z.6.0.M')
-merluza = cleaner('F068.B1.FLU.C15.0.C.N.Z.Z.Z.Z.6.0.M')
-conservas_pescado = cleaner('F068.B1.FLU.C16.0.C.N.Z.Z.Z.Z.6.0.M')
-moluscos = cleaner('F068.B1.FLU.C17.0.C.N.Z.Z.Z.Z.6.0.M')
-fruta_desh = cleaner('F068.B1.FLU.C18.0.C.N.Z.Z.Z.Z.6.0.M')
-fruta_cong = cleaner('F068.B1.FLU.C19.0.C.N.Z.Z.Z.Z.6.0.M')
-fruta_jugo = cleaner('F068.B1.FLU.C1A.0.C.N.Z.Z.Z.Z.6.0.M')
-fruta_conserva = cleaner('F068.B1.FLU.C1B.0.C.N.Z.Z.Z.Z.6.0.M')
-carne_ave = cleaner('F068.B1.FLU.C1C.0.C.N.Z.Z.Z.Z.6.0.M')
-carne_cerdo = cleaner('F068.B1.FLU.C1D.0.C.N.Z.Z.Z.Z.6.0.M')
-
-alimentos_industriales = alimentos.join(harina_pescado, rsuffix='_1').join(aceite_pescado, rsuffix='_2').join(salmon, rsuffix='_3').join(trucha, rsuffix='_4').join(merluza, rsuffix='_5').join(conservas_pescado, rsuffix='_6').join(moluscos, rsuffix='_7').join(fruta_desh, rsuffix='_8').join(fruta_cong, rsuffix='_9').join(fruta_jugo, rsuffix='_10').join(fruta_conserva, rsuffix='_11').join(carne_ave, rsuffix='_12').join(carne_cerdo, rsuffix='_13')
-alimentos_industriales.columns = ['total_fob_alimentos', 'Harina de\npescado', 'Aceite de\npescado',
-                                  'Salmón', 'Trucha', 'Merluza', 'Conservas\nde pescado',
-                                  'Moluscos y\ncrustáceos', 'Fruta\ndeshidratada',
-                                  'Fruta\ncongelada', 'Jugo fruta', 'Fruta\nconserva',
-                                  'Carne\nde ave', 'Carne\nde cerdo']
-
-alimentos_industriales_porcion = alimentos_industriales.divide(alimentos_industriales['total_fob_alimentos'], axis=0) * 100
-
-# Grafico pareto industriales-ALIMENTOS
-pareto_alimentos = pd.DataFrame(
-    data=alimentos_industriales.iloc[-1, 1:].values,
-    columns=['count'],
-    index=alimentos_industriales.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_alimentos = pareto_alimentos.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_alimentos['cumperc'] = pareto_alimentos['count'].cumsum() / pareto_alimentos['count'].sum() * 100
+alimentos_industriales = resultados['alimentos']['tabla']
+alimentos_industriales_porcion = resultados['alimentos']['porcion']
+pareto_alimentos = resultados['alimentos']['pareto']
 
 # Crear el grafico de Pareto
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -731,27 +527,12 @@ plt.show()
 
 #%% Pareto de todos los subsectores de las exportaciones
 
-subsectores_exportaciones = mineras.iloc[:, 1:].join(agropecuario.iloc[:, 1:]).join(industriales.iloc[:, 1:])
-subsectores_exportaciones.columns = ['Cobre', 'Hierro', 'Plata', 'Oro', 'Molibdeno', 
-                                     'Litio', 'Sal', 'Frutícola', 'Semillas', 
-                                     'Silvicola', 'Pesca', 'Alimentos', 'Bebidas', 
-                                     'Forestal', 'Celulosa', 
-                                     'Químicos','Ind metálica', 
-                                     'Maquinaria', 'Otros Industriales']
+resultados = grafo.ejecutar(['subsectores'])
+subsectores_exportaciones = resultados['subsectores']['tabla']
 
 # Pareto con el cobre
 # Grafico pareto de los subsectores exportadores
-pareto_subsectores_exportaciones = pd.DataFrame(
-    data=subsectores_exportaciones.iloc[-1, :].values,
-    columns=['count'],
-    index=subsectores_exportaciones.columns[:]
-    )
-
-# ordenarlas de manera descendente
-pareto_subsectores_exportaciones = pareto_subsectores_exportaciones.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_subsectores_exportaciones['cumperc'] = pareto_subsectores_exportaciones['count'].cumsum() / pareto_subsectores_exportaciones['count'].sum() * 100
+pareto_subsectores_exportaciones = resultados['subsectores']['pareto']
 
 # Crear el grafico de Pareto
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -786,17 +567,7 @@ plt.show()
 # PAreto sin el cobre
 
 # Grafico pareto de los subsectores exportadores
-pareto_subsectores_exportaciones = pd.DataFrame(
-    data=subsectores_exportaciones.iloc[-1, 1:].values,
-    columns=['count'],
-    index=subsectores_exportaciones.columns[1:]
-    )
-
-# ordenarlas de manera descendente
-pareto_subsectores_exportaciones = pareto_subsectores_exportaciones.sort_values(by='count', ascending=False)
-
-# añadir una columna del porcentaje acumulado
-pareto_subsectores_exportaciones['cumperc'] = pareto_subsectores_exportaciones['count'].cumsum() / pareto_subsectores_exportaciones['count'].sum() * 100
+pareto_subsectores_exportaciones = resultados['subsectores']['pareto_sin_cobre']
 
 # Crear el grafico de Pareto
 fig, ax = plt.subplots(figsize=(10, 5))
@@ -831,55 +602,15 @@ plt.show()
 #%% Terminos de Comercio
 from matplotlib.dates import datestr2num
 
-def cleaner_dolar(serie:str, resam:str=None, operations:list=None):
-    """
-    Limpiar la serie proveniente del la APIy dejarla lista para ocupar
-
-    Parameters
-    ----------
-    serie : str
-        id de la serie macro a solicitar.
-    resam : str
-        frecuencia para el resampling.
-    operation : list
-        operación(es) para agregar los datos resampliandos.
-
-    Returns
-    -------
-    pandas DataFrame
-        serie lista para ocupar.
-
-    """
-    serie_ = pd.DataFrame(client.get_macro(serie=serie))
-    serie_['value'] = pd.to_numeric(serie_['value'], errors='coerce')
-    serie_['indexDateString'] = pd.to_datetime(serie_['indexDateString'], format='%d-%m-%Y')
-    serie_.set_index('indexDateString', inplace=True)
-    del serie_['statusCode']
-    
-    if resam is not None:
-        if operations is not None:
-            serie_ = serie_.resample(resam).agg(operations)
-            # renombrar las columnas
-            serie_.columns = ['_'.join(x) for x in serie_.columns]
-            return serie_
-        else:
-            print('Ocupar ')
-    else:
-        return serie_
-
-# Exportaciones de bienes (FOB) -> F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M
-# Importaciones de bienes FOB (millones de dólares) -> F068.B1.FLU.Z.0.D.N.0.T.Z.Z.6.0.M
-exportaciones = cleaner('F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M').to_period('M').to_timestamp('M')
-importaciones = cleaner('F068.B1.FLU.Z.0.D.N.0.T.Z.Z.6.0.M').to_period('M').to_timestamp('M')
-dolar = cleaner_dolar('F073.TCO.PRE.Z.D').resample('M').median().to_period('M').to_timestamp('M')
-
-tot = (exportaciones / importaciones) * 100
+resultados = grafo.ejecutar(['terminos_de_comercio'])
+tot = resultados['terminos_de_comercio']['tot']
+dolar = resultados['terminos_de_comercio']['dolar']
 
 fig, ax = plt.subplots(figsize=(10, 5))
 ax2 = ax.twinx()
 
 ax.plot(tot, color='tab:blue')
-ax2.plot(dolar.filter(items=tot.index, axis=0), color='tab:green')
+ax2.plot(dolar, color='tab:green')
 ax.grid(True, linestyle='--')
 fig.suptitle('Terminos de comercio en Chile (TOT) y su relación con el dólar (mediana mensual)', fontweight='bold')
 plt.title('TOT = Exportaciones / Importaciones, seguimiento anual (TTM)')
@@ -919,8 +650,7 @@ plt.show()
 
 fig, ax = plt.subplots(figsize=(10, 5))
 
-import statsmodels.api as sm
-cycle, trend = sm.tsa.filters.hpfilter(tot.dropna(), 1600*3**4)
+trend = resultados['terminos_de_comercio']['tendencia']
 
 ax.plot(tot, color='tab:blue')
 ax.plot(trend, color='tab:orange')
@@ -961,17 +691,14 @@ ax.text(0.2, -0.12,
 plt.show()
 
 # Relación entre el dolar y el TOT
-index_to_follow = tot.dropna().index
-tot = tot.dropna().values.flatten()
-dolar = dolar.filter(items=index_to_follow, axis=0).values.flatten()
+dolar = resultados['terminos_de_comercio']['x']
+tot = resultados['terminos_de_comercio']['y']
 
 fig, ax = plt.subplots(figsize=(10, 5))
 
-# calculando la regresion (x=desempleo, y=inflacion)
-modelo = np.poly1d(np.polyfit(dolar, tot, 1))
-# Calculando el R2
-from sklearn.metrics import r2_score
-r_2 = r2_score(tot, modelo(dolar))
+# regresion (x=dolar, y=tot) y su R2
+modelo = resultados['terminos_de_comercio']['modelo']
+r_2 = resultados['terminos_de_comercio']['r_2']
 
 ax.scatter(dolar, tot, color='tab:blue')
 ax.plot(dolar, modelo(dolar), color='tab:orange')
@@ -998,4 +725,54 @@ ax.text(0.2, -0.17,
          color='black',
          bbox=dict(facecolor='tab:gray', alpha=0.5))
 
-plt.show()
\ No newline at end of file
+plt.show()
+#%% Relaciones entre subsectores y factores de mercado
+
+resultados = grafo.ejecutar(['relaciones'])
+ranking = resultados['relaciones']['ranking']
+r_2_moviles = resultados['relaciones']['moviles']['r_2']
+
+print(ranking.head(15).to_string(index=False))
+
+# las 5 parejas con mayor R2 en todo el periodo, en ventanas de 3 años
+mejores = list(ranking[['x', 'y']].head(5).itertuples(index=False, name=None))
+
+fig, ax = plt.subplots(figsize=(10, 5))
+
+ax.plot(r_2_moviles[mejores])
+ax.grid(True, linestyle='--')
+fig.suptitle('Subsectores exportadores más relacionados con los factores de mercado', fontweight='bold')
+plt.title('R2 de la regresión en ventanas moviles de 36 meses')
+ax.legend([f'{y.replace(chr(10), " ")} vs {x}' for x, y in mejores])
+ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
+ax.set_ylabel(r"$R^{2}$")
+
+# Graph source
+ax.text(0.2, -0.12,  
+         "Fuente: Banco Central de Chile   Gráfico: Lautaro Parada", 
+         horizontalalignment='center',
+         verticalalignment='center', 
+         transform=ax.transAxes, 
+         fontsize=8, 
+         color='black',
+         bbox=dict(facecolor='tab:gray', alpha=0.5))
+
+plt.show()
+
+# Correlación de las variaciones mensuales de cada subsector con los factores, ultimos 3 años
+correlaciones = resultados['relaciones']['correlaciones']
+factores = ['USDCLP', 'IPSA', 'Precio cobre', 'TOT']
+ultima = correlaciones.en().loc[[s for s in correlaciones.series if s not in factores], factores]
+
+fig, ax = plt.subplots(figsize=(6, 10))
+
+imagen = ax.imshow(ultima.values, cmap='RdBu', vmin=-1, vmax=1, aspect='auto')
+ax.set_xticks(range(len(factores)))
+ax.set_xticklabels(factores)
+ax.set_yticks(range(len(ultima.index)))
+ax.set_yticklabels([s.replace('\n', ' ') for s in ultima.index])
+fig.colorbar(imagen, ax=ax)
+fig.suptitle('Correlación de los subsectores con los factores de mercado', fontweight='bold')
+plt.title('Variaciones mensuales, ultimos 36 meses')
+
+plt.show()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Conversión de estados financieros y valorizaciones a una sola moneda.
+
+Muchas empresas chilenas reportan sus estados en dolares. `TablaCambios`
+arma, desde los precios 'XXXCLP.FOREX' del panel local de precios, una
+tabla fecha x moneda con el tipo de cambio hacia la moneda de destino
+(mediana movil de 20 dias, como el valorizador) y convierte tablas
+completas: a cada fila le corresponde el tipo de cambio vigente en su
+fecha y en su moneda, con una busqueda por moneda y no por fila.
+`a_cotizacion` lleva cada fila a la moneda en que transa su ticker, para
+compararla con su propio precio.
+
+@author: lauta
+"""
+
+import numpy as np
+import pandas as pd
+
+from precios import PanelPrecios
+
+
+def par(origen:str, destino:str):
+    """Ticker de EOD del tipo de cambio: ('USD', 'CLP') -> 'USDCLP.FOREX'."""
+    return f"{origen}{destino}.FOREX"
+
+def moneda_estados(datos:dict):
+    """
+    Moneda de cada trimestre de un estado financiero de EOD.
+
+    Parameters
+    ----------
+    datos : dict
+        Respuesta de `get_fundamental_equity` para un estado financiero
+        trimestral.
+
+    Returns
+    -------
+    pd.Series
+        'currency_symbol' indexado por la fecha del estado.
+
+    """
+    crudos = pd.DataFrame(datos).T
+    if crudos.empty or 'currency_symbol' not in crudos:
+        return pd.Series(dtype=object)
+    return pd.Series(crudos['currency_symbol'].to_numpy(), index=pd.to_datetime(crudos['date'])).sort_index()
+
+class TablaCambios:
+    """
+    Tipos de cambio diarios de varias monedas hacia `destino`.
+
+    Parameters
+    ----------
+    panel_precios : PanelPrecios, optional
+        Panel con los tickers 'XXX<destino>.FOREX'. The default is None (el
+        del cache).
+    destino : str, optional
+        Moneda a la que se convierte. The default is 'CLP'.
+    monedas : list, optional
+        Monedas de origen que deben estar en la tabla; las que no están en
+        el panel se siembran con su historia. The default is ('USD',).
+    dias : int, optional
+        Ventana de la mediana movil de cada tipo de cambio. The default is
+        20.
+
+    """
+
+    def __init__(self, panel_precios:PanelPrecios=None, destino:str='CLP', monedas:list=('USD',), dias:int=20):
+        self.destino = destino
+        panel_precios = panel_precios or PanelPrecios.cargar()
+        faltantes = [par(m, destino) for m in monedas if m != destino and par(m, destino) not in panel_precios.tickers]
+        if faltantes:
+            panel_precios.sembrar(faltantes)
+        sufijo = par('', destino)
+        pares = {t: t[:-len(sufijo)] for t in panel_precios.tickers if t.endswith(sufijo) and len(t) > len(sufijo)}
+        cierres = panel_precios.precios(list(pares), 'close').rename(columns=pares)
+        # cada moneda con sus propios dias de transacción
+        self.tasas = cierres.apply(lambda serie: serie.dropna().rolling(dias, min_periods=1).median())
+
+    @property
+    def monedas(self):
+        return [self.destino] + list(self.tasas.columns)
+
+    def al(self, fechas, monedas):
+        """
+        Tipo de cambio vigente a cada fecha para cada moneda.
+
+        Parameters
+        ----------
+        fechas : array-like
+            Fechas de cada fila.
+        monedas : array-like
+            Moneda de cada fila. Las filas sin moneda se consideran en la
+            moneda de destino.
+
+        Returns
+        -------
+        np.ndarray
+            Unidades de `destino` por unidad de la moneda de cada fila (NaN
+            si no hay tipo de cambio a esa fecha).
+
+        """
+        fechas = pd.DatetimeIndex(fechas)
+        monedas = pd.Series(monedas, dtype=object).fillna(self.destino).to_numpy()
+        tasas = np.full(len(fechas), np.nan)
+        tasas[monedas == self.destino] = 1.0
+        for moneda in set(monedas) - {self.destino}:
+            if moneda not in self.tasas:
+                continue
+            serie = self.tasas[moneda].dropna()
+            filas = monedas == moneda
+            posicion = serie.index.searchsorted(fechas[filas], side='right') - 1
+            tasas[filas] = np.where(posicion >= 0, serie.to_numpy()[posicion.clip(0)], np.nan)
+        return tasas
+
+    def tasa(self, moneda:str, fecha=None):
+        """
+        Tipo de cambio de `moneda` a la fecha `fecha` (por defecto el ultimo).
+        """
+        fecha = self.tasas.index.max() if fecha is None else fecha
+        return float(self.al([fecha], [moneda])[0])
+
+    def convertir(self, tabla:pd.DataFrame, columnas:list, fecha:str=None, moneda:str='moneda'):
+        """
+        Llevar las `columnas` de toda la tabla a la moneda de destino.
+
+        Parameters
+        ----------
+        tabla : pd.DataFrame
+            Una fila por empresa (o por empresa y fecha).
+        columnas : list
+            Columnas en unidades monetarias.
+        fecha : str, optional
+            Columna o nivel del indice con la fecha de cada fila. The
+            default is None (el ultimo tipo de cambio para todas).
+        moneda : str, optional
+            Columna con la moneda de cada fila. The default is 'moneda'.
+
+        Returns
+        -------
+        pd.DataFrame
+            Copia de `tabla` con las columnas convertidas (`moneda` sigue
+            indicando la moneda original de cada fila).
+
+        """
+        if fecha is None:
+            fechas = np.repeat(self.tasas.index.max(), len(tabla))
+        elif fecha in tabla:
+            fechas = pd.to_datetime(tabla[fecha])
+        else:
+            fechas = pd.to_datetime(tabla.index.get_level_values(fecha))
+        tasas = self.al(fechas, tabla[moneda])
+        tabla = tabla.copy()
+        tabla[columnas] = tabla[columnas].apply(pd.to_numeric, errors='coerce').mul(tasas, axis=0)
+        return tabla
+
+def a_cotizacion(tabla:pd.DataFrame, columnas:list, panel_precios:PanelPrecios=None, fecha:str=None,
+                 moneda:str='moneda', cotizacion:str='cotizacion'):
+    """
+    Llevar las `columnas` de cada fila a la moneda en que transa su ticker.
+
+    Parameters
+    ----------
+    tabla : pd.DataFrame
+        Una fila por empresa (o por empresa y fecha).
+    columnas : list
+        Columnas en unidades monetarias.
+    panel_precios : PanelPrecios, optional
+        Panel con los tipos de cambio. The default is None (el del cache).
+    fecha : str, optional
+        Columna o nivel del indice con la fecha de cada fila. The default
+        is None (el ultimo tipo de cambio para todas).
+    moneda : str, optional
+        Columna con la moneda de cada fila. The default is 'moneda'.
+    cotizacion : str, optional
+        Columna con la moneda en que transa el ticker de cada fila. The
+        default is 'cotizacion'.
+
+    Returns
+    -------
+    pd.DataFrame
+        Copia de `tabla` con las columnas convertidas; las filas sin moneda
+        de cotización quedan en NaN.
+
+    """
+    panel_precios = panel_precios or PanelPrecios.cargar()
+    tabla = tabla.copy()
+    tabla[columnas] = tabla[columnas].apply(pd.to_numeric, errors='coerce')
+    destinos = tabla[cotizacion]
+    # una tabla de cambios por moneda de cotización (CLP, USD, ...)
+    for destino in destinos.dropna().unique():
+        filas = (destinos == destino).to_numpy()
+        cambios = TablaCambios(panel_precios, destino, monedas=tabla.loc[filas, moneda].dropna().unique())
+        tabla.loc[filas, columnas] = cambios.convertir(tabla.loc[filas], columnas, fecha, moneda)[columnas]
+    tabla.loc[destinos.isna().to_numpy(), columnas] = np.nan
+    return tabla
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Historia trimestral de los multiplos de cada sector.
+
+El valorizador compara los multiplos de una empresa con los de su sector
+hoy (bulk fundamentals). Este modulo reconstruye, al cierre de cada
+trimestre, el PE, PB, PS, EV/EBITDA y ROE de cada empresa con los estados
+publicados a esa fecha (valor_historico.fundamentales_historicos) y su
+precio de ese dia, y los resume por (sector, trimestre): mediana, cuartiles
+y dispersión. Así se puede ver si un sector está barato frente a su propia
+historia. Todo se calcula sobre la tabla completa, sin recorrer fechas ni
+sectores, y queda guardado en el cache.
+
+    python multiplos_sectoriales.py --exchange SN --desde 2012-01-01
+
+@author: lauta
+"""
+
+import os
+import pickle
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, directorio_cache, temporal
+from precios import PanelPrecios
+from monedas import a_cotizacion, par
+from valor_historico import _INGRESOS, _BALANCE, fundamentales_historicos, vigentes
+
+
+MULTIPLOS = ['pe', 'pb', 'ps', 'ev_ebitda', 'roe']
+# multiplos sin sentido con utilidades, EBITDA o patrimonio negativos
+_POSITIVOS = {'pe': 'netIncome', 'ev_ebitda': 'ebitda', 'pb': 'totalStockholderEquity'}
+
+def sectores(tickers:list, hilos:int=8):
+    """
+    Sector de cada ticker segun EOD.
+
+    Returns
+    -------
+    pd.Series
+        ticker -> sector.
+
+    """
+    client = cliente_eod()
+
+    def solicitar(ticker):
+        try:
+            return client.get_fundamental_equity(ticker, filter_='General::Sector')
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        return pd.Series(list(ejecutor.map(solicitar, tickers)), index=list(tickers), dtype=object).dropna()
+
+def multiplos_empresas(estados:pd.DataFrame, cierres:pd.DataFrame, fechas:pd.DatetimeIndex):
+    """
+    Multiplos de cada empresa al cierre de cada una de las `fechas`.
+
+    Parameters
+    ----------
+    estados : pd.DataFrame
+        Resultado de `fundamentales_historicos`, en la moneda de los
+        precios.
+    cierres : pd.DataFrame
+        Precios de cierre fecha x ticker.
+    fechas : pd.DatetimeIndex
+        Fechas a evaluar (cierres de trimestre).
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por (ticker, fecha_valor) con 'capitalizacion' y una
+        columna por multiplo.
+
+    """
+    tabla = vigentes(estados, fechas)
+    # el ultimo cierre conocido a cada fecha, en formato largo para unirlo a la tabla
+    precio = cierres.reindex(cierres.index.union(fechas)).ffill().reindex(fechas).stack().rename('precio')
+    precio.index.names = ['fecha_valor', 'ticker']
+    tabla = tabla.join(precio, on=['fecha_valor', 'ticker'])
+
+    tabla['capitalizacion'] = tabla['precio'] * tabla['acciones']
+    tabla['ebitda'] = tabla['netIncome'] + tabla['depreciationAndAmortization'] +\
+        tabla['interestExpense'] + tabla['incomeTaxExpense']
+    valor_empresa = tabla['capitalizacion'] + tabla['shortTermDebt'] + tabla['longTermDebt'] - tabla['cashAndEquivalents']
+    tabla['pe'] = tabla['capitalizacion'] / tabla['netIncome']
+    tabla['pb'] = tabla['capitalizacion'] / tabla['totalStockholderEquity']
+    tabla['ps'] = tabla['capitalizacion'] / tabla['totalRevenue']
+    tabla['ev_ebitda'] = valor_empresa / tabla['ebitda']
+    tabla['roe'] = tabla['netIncome'] / tabla['totalStockholderEquity']
+    for multiplo, base in _POSITIVOS.items():
+        tabla[multiplo] = tabla[multiplo].where(tabla[base] > 0)
+    tabla = tabla.replace([np.inf, -np.inf], np.nan)
+    return tabla.set_index(['ticker', 'fecha_valor'])[['capitalizacion'] + MULTIPLOS].sort_index()
+
+def resumir(multiplos:pd.DataFrame, sectores_:pd.Series):
+    """
+    Mediana, cuartiles y dispersión de cada multiplo por (sector, trimestre).
+
+    Parameters
+    ----------
+    multiplos : pd.DataFrame
+        Resultado de `multiplos_empresas`.
+    sectores_ : pd.Series
+        ticker -> sector.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexada por (sector, fecha_valor), con columnas (multiplo,
+        estadistico): 'mediana', 'q1', 'q3', 'dispersion' (rango
+        intercuartil sobre la mediana) y 'n'.
+
+    """
+    tabla = multiplos[MULTIPLOS].join(sectores_.rename('sector'), on='ticker').dropna(subset=['sector'])
+    grupos = tabla.groupby(['sector', tabla.index.get_level_values('fecha_valor')])
+    q1, mediana, q3 = (grupos[MULTIPLOS].quantile(q) for q in (0.25, 0.5, 0.75))
+    resumen = pd.concat({
+        'mediana': mediana,
+        'q1': q1,
+        'q3': q3,
+        'dispersion': (q3 - q1) / mediana.abs(),
+        'n': grupos[MULTIPLOS].count(),
+        }, axis=1).swaplevel(axis=1).sort_index(axis=1)
+    resumen.index.names = ['sector', 'fecha_valor']
+    return resumen.replace([np.inf, -np.inf], np.nan)
+
+def frente_a_historia(resumen:pd.DataFrame, sector:str, multiplo:str='pe', fecha=None):
+    """
+    Mediana del sector a una fecha frente a la historia de esa mediana.
+
+    Parameters
+    ----------
+    resumen : pd.DataFrame
+        Resultado de `resumir`.
+    sector : str
+        Sector a evaluar.
+    multiplo : str, optional
+        Uno de MULTIPLOS. The default is 'pe'.
+    fecha : pd.Timestamp, optional
+        Trimestre a evaluar. The default is None (el ultimo).
+
+    Returns
+    -------
+    dict
+        actual, mediana_historica, percentil (de la mediana actual dentro
+        de su historia, hasta esa fecha) y distancia (actual /
+        mediana_historica - 1).
+
+    """
+    historia = resumen.loc[sector, (multiplo, 'mediana')].dropna()
+    if fecha is not None:
+        historia = historia.loc[:fecha]
+    if historia.empty:
+        return {'actual': np.nan, 'mediana_historica': np.nan, 'percentil': np.nan, 'distancia': np.nan}
+    actual, mediana = historia.iloc[-1], historia.median()
+    return {
+        'actual': actual,
+        'mediana_historica': mediana,
+        'percentil': (historia <= actual).mean() * 100,
+        'distancia': actual / mediana - 1,
+        }
+
+def ruta_resumen():
+    return os.path.join(directorio_cache(), 'multiplos_sectoriales.pkl')
+
+def cargar(ruta:str=None):
+    """
+    Resumen calculado en una ejecución anterior (None si no existe).
+    """
+    ruta = ruta or ruta_resumen()
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'rb') as archivo:
+        return pickle.load(archivo)
+
+def calcular(tickers:list, desde:str='2012-01-01', hasta=None, panel_precios:PanelPrecios=None,
+             sectores_:pd.Series=None, guardar:bool=True):
+    """
+    Resumen sectorial de los multiplos de `tickers` al cierre de cada trimestre.
+
+    Parameters
+    ----------
+    tickers : list
+        Codigos junto a su exchange.
+    desde : str, optional
+        Primer trimestre. The default is '2012-01-01'.
+    hasta : str, optional
+        Ultimo trimestre. The default is None (hoy).
+    panel_precios : PanelPrecios, optional
+        The default is None (el del cache).
+    sectores_ : pd.Series, optional
+        ticker -> sector. The default is None (se solicita a EOD).
+    guardar : bool, optional
+        Guardar el resultado en el cache. The default is True.
+
+    Returns
+    -------
+    pd.DataFrame
+        Resultado de `resumir`.
+
+    """
+    fechas = pd.date_range(desde, hasta or pd.Timestamp.today(), freq=pd.offsets.QuarterEnd())
+    panel_precios = panel_precios or PanelPrecios.cargar()
+    panel_precios.actualizar(tickers=list(tickers) + [par('USD', 'CLP')])
+    panel_precios.guardar()
+    con_precios = [t for t in tickers if t in panel_precios.tickers]
+
+    # cada empresa en la moneda de sus precios
+    estados = fundamentales_historicos(con_precios)
+    estados = a_cotizacion(estados, _INGRESOS + _BALANCE, panel_precios, fecha='fecha')
+    multiplos = multiplos_empresas(estados, panel_precios.precios(con_precios, 'close'), fechas)
+    resumen = resumir(multiplos, sectores(con_precios) if sectores_ is None else sectores_)
+
+    if guardar:
+        temporal_ = temporal(ruta_resumen())
+        with open(temporal_, 'wb') as archivo:
+            pickle.dump(resumen, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal_, ruta_resumen())
+    return resumen
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Historia trimestral de los multiplos de cada sector')
+    parser.add_argument('tickers', nargs='*', help='codigos junto a su exchange (SQM-B.SN ...)')
+    parser.add_argument('--exchange', help='todas las acciones del exchange (SN ...)')
+    parser.add_argument('--desde', default='2012-01-01')
+    parser.add_argument('--hasta', default=None)
+    argumentos = parser.parse_args(argumentos)
+
+    tickers = list(argumentos.tickers)
+    if argumentos.exchange:
+        simbolos = pd.DataFrame(cliente_eod().get_exchange_symbols(exchange=argumentos.exchange))
+        simbolos = simbolos[simbolos['Type'] == 'Common Stock'] if 'Type' in simbolos else simbolos
+        tickers += [f"{codigo}.{argumentos.exchange}" for codigo in simbolos['Code']]
+    if not tickers:
+        parser.error('indique tickers o --exchange')
+
+    resumen = calcular(tickers, argumentos.desde, argumentos.hasta)
+    for sector in resumen.index.get_level_values('sector').unique():
+        posicion = frente_a_historia(resumen, sector, 'pe')
+        print(f"{sector}: PE mediano {round(posicion['actual'], 1)} (percentil {round(posicion['percentil'])} de su historia)")
+    print(f"Resultados en {ruta_resumen()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Indice de la distribución de multiplos de los pares, por sector y para
+todo el mercado.
+
+`IndicePares` guarda, para cada multiplo (PE, PE forward, PB, PS,
+EV/EBITDA, yield, PEG, margen operacional y ROE) y para cada sector y el
+mercado completo, un arreglo ordenado con los valores de las empresas.
+El percentil de una empresa, su distancia a la mediana y su banda (bajo o
+sobre la mediana del grupo) salen de una busqueda binaria en ese arreglo,
+sin volver a armar listas ni a calcular medianas en cada consulta.
+
+@author: lauta
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from clientes import directorio_cache, temporal
+
+
+# multiplo -> (sección, campo) en los fundamentales de EOD
+MULTIPLOS = {
+    'pe': ('Valuation', 'TrailingPE'),
+    'forward_pe': ('Valuation', 'ForwardPE'),
+    'pb': ('Valuation', 'PriceBookMRQ'),
+    'ps': ('Valuation', 'PriceSalesTTM'),
+    'ev_ebitda': ('Valuation', 'EnterpriseValueEbitda'),
+    'yield': ('Highlights', 'DividendYield'),
+    'peg': ('Highlights', 'PEGRatio'),
+    'op_margin': ('Highlights', 'OperatingMarginTTM'),
+    'roe': ('Highlights', 'ReturnOnEquityTTM'),
+    }
+
+MERCADO = '__mercado__'
+
+def tabla_fundamentales(fundamentales:dict, moneda:str=None):
+    """
+    Multiplos de cada empresa de una respuesta de bulk fundamentals.
+
+    Parameters
+    ----------
+    fundamentales : dict
+        ticker -> fundamentales de EOD (General, Highlights, Valuation).
+    moneda : str, optional
+        Solo las empresas con este CurrencyCode. The default is None
+        (todas).
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexada por ticker, con la columna 'sector' y una por multiplo.
+
+    """
+    filas = {}
+    for ticker, datos in fundamentales.items():
+        general = datos.get('General', {})
+        if moneda is not None and general.get('CurrencyCode') != moneda:
+            continue
+        fila = {'sector': general.get('Sector')}
+        for multiplo, (seccion, campo) in MULTIPLOS.items():
+            fila[multiplo] = (datos.get(seccion) or {}).get(campo)
+        filas[ticker] = fila
+    tabla = pd.DataFrame.from_dict(filas, orient='index')
+    columnas = [m for m in MULTIPLOS if m in tabla]
+    tabla[columnas] = tabla[columnas].apply(pd.to_numeric, errors='coerce')
+    return tabla
+
+class IndicePares:
+    """
+    Arreglos ordenados de cada multiplo por sector y para el mercado.
+
+    Parameters
+    ----------
+    tabla : pd.DataFrame
+        Indexada por ticker, con 'sector' y una columna por multiplo (ver
+        `tabla_fundamentales`).
+
+    """
+
+    def __init__(self, tabla:pd.DataFrame):
+        self.tabla = tabla
+        self.multiplos = [m for m in MULTIPLOS if m in tabla]
+        self.ordenados = {}
+        grupos = [(MERCADO, tabla)] + list(tabla.groupby('sector'))
+        for grupo, miembros in grupos:
+            for multiplo in self.multiplos:
+                valores = miembros[multiplo].to_numpy(dtype=float)
+                self.ordenados[grupo, multiplo] = np.sort(valores[np.isfinite(valores)])
+
+    @classmethod
+    def desde_bulk(cls, fundamentales:dict, moneda:str=None):
+        """
+        Indice desde una respuesta de bulk fundamentals de EOD.
+        """
+        return cls(tabla_fundamentales(fundamentales, moneda))
+
+    @classmethod
+    def cargar(cls, ruta:str=None):
+        """
+        Recuperar el indice guardado (None si no existe).
+        """
+        ruta = ruta or os.path.join(directorio_cache(), 'pares.pkl')
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, 'rb') as archivo:
+            return pickle.load(archivo)
+
+    def guardar(self, ruta:str=None):
+        """
+        Guardar el indice en disco.
+        """
+        ruta = ruta or os.path.join(directorio_cache(), 'pares.pkl')
+        temporal_ = temporal(ruta)
+        with open(temporal_, 'wb') as archivo:
+            pickle.dump(self, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal_, ruta)
+
+    def valores(self, multiplo:str, sector:str=None):
+        """
+        Valores ordenados del multiplo en el sector (o en el mercado si es None).
+        """
+        return self.ordenados.get((MERCADO if sector is None else sector, multiplo), np.array([]))
+
+    def mediana(self, multiplo:str, sector:str=None):
+        valores = self.valores(multiplo, sector)
+        if len(valores) == 0:
+            return np.nan
+        mitad = len(valores) // 2
+        return valores[mitad] if len(valores) % 2 else (valores[mitad - 1] + valores[mitad]) / 2
+
+    def minimo(self, multiplo:str, sector:str=None):
+        valores = self.valores(multiplo, sector)
+        return valores[0] if len(valores) else np.nan
+
+    def maximo(self, multiplo:str, sector:str=None):
+        valores = self.valores(multiplo, sector)
+        return valores[-1] if len(valores) else np.nan
+
+    def percentil(self, multiplo:str, valor, sector:str=None):
+        """
+        Porcentaje de los pares con un multiplo menor o igual a `valor`
+        (escalar o arreglo).
+        """
+        valores = self.valores(multiplo, sector)
+        valor = np.asarray(valor, dtype=float)
+        if len(valores) == 0:
+            return np.full(valor.shape, np.nan)[()]
+        percentil = np.searchsorted(valores, valor, side='right') / len(valores) * 100
+        return np.where(np.isfinite(valor), percentil, np.nan)[()]
+
+    def posicion(self, multiplo:str, valor:float, sector:str=None, tolerancia:float=0.01):
+        """
+        Ubicación de `valor` frente a sus pares.
+
+        Parameters
+        ----------
+        multiplo : str
+            Llave de MULTIPLOS.
+        valor : float
+            Multiplo de la empresa.
+        sector : str, optional
+            Sector de los pares. The default is None (todo el mercado).
+        tolerancia : float, optional
+            Banda alrededor de la mediana que se considera en linea. The
+            default is 0.01 (±1%, igual que los graficos del valorizador).
+
+        Returns
+        -------
+        dict
+            percentil, mediana, distancia a la mediana (valor / mediana - 1)
+            y banda ('bajo la mediana', 'en linea' o 'sobre la mediana').
+
+        """
+        valor = float(valor)
+        mediana = self.mediana(multiplo, sector)
+        if valor < mediana * (1 - tolerancia):
+            banda = 'bajo la mediana'
+        elif valor > mediana * (1 + tolerancia):
+            banda = 'sobre la mediana'
+        else:
+            banda = 'en linea' if np.isfinite(valor) and np.isfinite(mediana) else None
+        return {
+            'percentil': float(self.percentil(multiplo, valor, sector)),
+            'mediana': mediana,
+            'distancia_mediana': valor / mediana - 1 if mediana else np.nan,
+            'banda': banda,
+            }
+
+    def consultar(self, tickers:list=None, sector:bool=True):
+        """
+        Percentil de cada multiplo para muchas empresas a la vez.
+
+        Parameters
+        ----------
+        tickers : list, optional
+            Empresas del indice a consultar. The default is None (todas).
+        sector : bool, optional
+            Comparar con el sector de cada empresa o, si es False, con el
+            mercado. The default is True.
+
+        Returns
+        -------
+        pd.DataFrame
+            Indexada por ticker, un percentil por multiplo.
+
+        """
+        tabla = self.tabla if tickers is None else self.tabla.reindex(tickers)
+        resultado = pd.DataFrame(index=tabla.index, columns=self.multiplos, dtype=float)
+        grupos = tabla.groupby('sector') if sector else [(None, tabla)]
+        # una busqueda vectorizada por grupo y multiplo, no por empresa
+        for grupo, miembros in grupos:
+            for multiplo in self.multiplos:
+                resultado.loc[miembros.index, multiplo] = self.percentil(multiplo, miembros[multiplo].to_numpy(dtype=float), grupo)
+        return resultado
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Crecimiento de las utilidades y ratio PEG de muchas empresas a la vez.
+
+Igual que el indicador del valorizador, el crecimiento es el promedio de
+los ultimos 4 cambios porcentuales de la utilidad neta TTM (sin los
+trimestres con utilidad cero) y el PEG es PE / (crecimiento * 100). Aquí se
+calcula para todas las columnas de una tabla fecha x ticker en una sola
+pasada, y cada PEG se clasifica en las categorias del indicador con
+`np.digitize`:
+
+    0 NO APLICA  utilidades o crecimiento negativos (o sin datos)
+    1 BAJO       PEG < 0.5
+    2 MEDIO      0.5 <= PEG < 1
+    3 ALTO       1 <= PEG < 1.5
+    4 EXTREMO    PEG >= 1.5
+
+Con una utilidad previa negativa el cambio se mide sobre su valor
+absoluto, así pasar de perdidas a menores perdidas cuenta como
+crecimiento y no al revés.
+
+    python peg.py --exchange SN
+
+@author: lauta
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, directorio_cache
+
+
+LIMITES = [0.5, 1, 1.5]
+CATEGORIAS = ['NO APLICA', 'BAJO', 'MEDIO', 'ALTO', 'EXTREMO']
+
+def crecimiento_utilidades(utilidades:pd.DataFrame, periodos:int=4):
+    """
+    Crecimiento promedio de los ultimos `periodos` trimestres de cada ticker.
+
+    Parameters
+    ----------
+    utilidades : pd.DataFrame
+        Utilidad neta TTM fecha x ticker.
+    periodos : int, optional
+        Cambios trimestrales a promediar. The default is 4 (un año).
+
+    Returns
+    -------
+    pd.Series
+        ticker -> crecimiento (fracción).
+
+    """
+    # formato largo sin los trimestres con utilidad cero ni sin datos
+    largo = utilidades.replace(0, np.nan).stack().dropna().sort_index(level=[1, 0])
+    largo.index.names = ['fecha', 'ticker']
+    por_ticker = largo.groupby(level='ticker')
+    anterior = por_ticker.shift(1)
+    cambios = (largo - anterior) / anterior.abs()
+    promedio = cambios.groupby(level='ticker').rolling(periodos, min_periods=periodos).mean().droplevel(0)
+    # el promedio del ultimo trimestre, aunque sea NaN (sin `periodos` cambios)
+    ultimo = promedio.groupby(level='ticker').tail(1).droplevel('fecha')
+    return ultimo.reindex(utilidades.columns)
+
+def clasificar(peg_):
+    """
+    Categoria del indicador de cada PEG (0 a 4, ver CATEGORIAS).
+    """
+    peg_ = np.asarray(peg_, dtype=float)
+    categorias = np.digitize(peg_, LIMITES) + 1
+    # PEG negativo (PE o crecimiento negativos) o sin datos: no aplica
+    return np.where(np.isnan(peg_) | (peg_ <= 0), 0, categorias)
+
+def peg(utilidades:pd.DataFrame, pe:pd.Series, periodos:int=4):
+    """
+    Crecimiento, PEG y categoria de cada ticker, ordenados de menor a mayor PEG.
+
+    Parameters
+    ----------
+    utilidades : pd.DataFrame
+        Utilidad neta TTM fecha x ticker.
+    pe : pd.Series
+        ticker -> PE actual.
+    periodos : int, optional
+        Cambios trimestrales a promediar. The default is 4.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por ticker con 'pe', 'crecimiento', 'peg', 'categoria' y
+        'etiqueta'. Los que no aplican quedan al final.
+
+    """
+    tabla = pd.DataFrame({'pe': pd.to_numeric(pe, errors='coerce'),
+                          'crecimiento': crecimiento_utilidades(utilidades, periodos)})
+    validos = (tabla['pe'] > 0) & (tabla['crecimiento'] > 0)
+    tabla['peg'] = (tabla['pe'] / (tabla['crecimiento'] * 100)).where(validos)
+    tabla['categoria'] = clasificar(tabla['peg'])
+    tabla['etiqueta'] = np.asarray(CATEGORIAS)[tabla['categoria']]
+    return tabla.sort_values('peg', na_position='last')
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Ranking por PEG de todas las acciones de un exchange')
+    parser.add_argument('tickers', nargs='*', help='codigos junto a su exchange (SQM-B.SN ...)')
+    parser.add_argument('--exchange', help='todas las acciones del exchange (SN ...)')
+    parser.add_argument('--salida', default=None, help="CSV de salida (por defecto 'peg.csv' del cache)")
+    argumentos = parser.parse_args(argumentos)
+
+    from precios import PanelPrecios
+    from monedas import a_cotizacion, par
+    from valor_historico import _INGRESOS, _BALANCE, fundamentales_historicos
+    from multiplos_sectoriales import multiplos_empresas
+
+    tickers = list(argumentos.tickers)
+    if argumentos.exchange:
+        simbolos = pd.DataFrame(cliente_eod().get_exchange_symbols(exchange=argumentos.exchange))
+        simbolos = simbolos[simbolos['Type'] == 'Common Stock'] if 'Type' in simbolos else simbolos
+        tickers += [f"{codigo}.{argumentos.exchange}" for codigo in simbolos['Code']]
+    if not tickers:
+        parser.error('indique tickers o --exchange')
+
+    panel_precios = PanelPrecios.cargar().actualizar(tickers=tickers + [par('USD', 'CLP')])
+    panel_precios.guardar()
+    con_precios = [t for t in tickers if t in panel_precios.tickers]
+    estados = fundamentales_historicos(con_precios)
+    estados = a_cotizacion(estados, _INGRESOS + _BALANCE, panel_precios, fecha='fecha')
+    # PE de hoy con el ultimo estado publicado y el ultimo cierre
+    ultimo_cierre = panel_precios.precios(con_precios, 'close').index.max()
+    pe = multiplos_empresas(estados, panel_precios.precios(con_precios, 'close'), pd.DatetimeIndex([ultimo_cierre]))['pe']
+
+    tabla = peg(estados.pivot_table(index='fecha', columns='ticker', values='netIncome'), pe.droplevel('fecha_valor'))
+    salida = argumentos.salida or os.path.join(directorio_cache(), 'peg.csv')
+    tabla.to_csv(salida)
+    print(tabla.head(20))
+    print(tabla['etiqueta'].value_counts())
+    print(f"Resultados en {salida}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Planificador de etapas con dependencias.
+
+Cada etapa se ejecuta apenas terminan las etapas de las que depende, de
+modo que las etapas independientes corren en paralelo (hasta `jobs` a la
+vez) y una actualización completa demora lo que su cadena de
+dependencias más larga. Si una etapa falla, las que dependen de ella no
+se ejecutan y el resto sigue su curso.
+
+@author: lauta
+"""
+
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Etapa:
+    """
+    Paso del proceso y las etapas que deben terminar antes.
+
+    Parameters
+    ----------
+    nombre : str
+        Nombre de la etapa.
+    funcion : callable
+        Se llama sin argumentos; una excepción marca la etapa como fallida.
+    dependencias : list, optional
+        Nombres de las etapas previas. The default is None.
+
+    """
+
+    def __init__(self, nombre:str, funcion, dependencias:list=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.dependencias = list(dependencias or [])
+
+class Planificador:
+    """
+    Conjunto de etapas y su ejecución concurrente.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+
+    def etapa(self, nombre:str, funcion, dependencias:list=None):
+        """
+        Registrar una etapa. Sus dependencias deben estar registradas antes.
+        """
+        for dependencia in dependencias or []:
+            if dependencia not in self.etapas:
+                raise ValueError(f"La etapa '{nombre}' depende de '{dependencia}', que no está registrada")
+        self.etapas[nombre] = Etapa(nombre, funcion, dependencias)
+
+    def requeridas(self, objetivos:list=None):
+        """
+        Etapas necesarias para completar `objetivos`, cada una despues de sus dependencias.
+        """
+        objetivos = list(self.etapas) if objetivos is None else list(objetivos)
+        orden_, vistas = [], set()
+
+        def visitar(nombre):
+            if nombre in vistas:
+                return
+            if nombre not in self.etapas:
+                raise KeyError(f"No existe la etapa '{nombre}'")
+            vistas.add(nombre)
+            for dependencia in self.etapas[nombre].dependencias:
+                visitar(dependencia)
+            orden_.append(nombre)
+
+        for nombre in objetivos:
+            visitar(nombre)
+        return orden_
+
+    def ejecutar(self, objetivos:list=None, jobs:int=1, informar=print):
+        """
+        Ejecutar las etapas necesarias para `objetivos`.
+
+        Parameters
+        ----------
+        objetivos : list, optional
+            Etapas solicitadas (y sus dependencias). The default is None (todas).
+        jobs : int, optional
+            Numero maximo de etapas simultaneas. The default is 1.
+        informar : callable, optional
+            Recibe los mensajes de avance. The default is print.
+
+        Returns
+        -------
+        dict
+            nombre de la etapa -> 'ok', 'error' u 'omitida'.
+
+        """
+        pendientes = self.requeridas(objetivos)
+        estados, en_curso = {}, {}
+
+        def correr(etapa):
+            inicio = time.perf_counter()
+            etapa.funcion()
+            return time.perf_counter() - inicio
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as ejecutor:
+            while pendientes or en_curso:
+                # lanzar todo lo que ya tiene sus dependencias listas
+                for nombre in list(pendientes):
+                    dependencias = self.etapas[nombre].dependencias
+                    if any(estados.get(d) in ('error', 'omitida') for d in dependencias):
+                        pendientes.remove(nombre)
+                        estados[nombre] = 'omitida'
+                        informar(f'[{nombre}] omitida, falló una etapa previa')
+                    elif all(estados.get(d) == 'ok' for d in dependencias):
+                        pendientes.remove(nombre)
+                        en_curso[ejecutor.submit(correr, self.etapas[nombre])] = nombre
+                        informar(f'[{nombre}] iniciada')
+
+                if not en_curso:
+                    continue
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    nombre = en_curso.pop(futuro)
+                    try:
+                        duracion = futuro.result()
+                    except Exception:
+                        estados[nombre] = 'error'
+                        informar(f'[{nombre}] error\n{traceback.format_exc()}')
+                    else:
+                        estados[nombre] = 'ok'
+                        informar(f'[{nombre}] lista en {duracion:.1f} s')
+        return estados
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Tabla local de precios diarios fecha x ticker que se actualiza con una
+sola solicitud por exchange y por dia.
+
+`PanelPrecios` descarga la historia de cada ticker una sola vez. Luego
+`actualizar` pide a EOD el cierre de los dias faltantes con la API bulk
+(`get_bulk_markets`), una solicitud por exchange y por dia para todos los
+tickers, y agrega esas filas. Los tickers con un dividendo o un split ese
+dia vuelven a descargar su historia, porque EOD reajusta todo su
+'adjusted_close'. Los precios actuales y los retornos quedan como lecturas
+locales.
+
+Con el almacen columnar en uso (ver datos.usar_almacen) el panel se guarda
+también como las tablas 'precios/close', 'precios/adjusted_close' y
+'precios/revisadas', y se carga desde ahí con memoria mapeada: los
+procesos que corren en paralelo comparten una sola copia de los precios.
+
+Cada vez que se guarda, el estado del panel queda además como instantánea
+('panel/precios', ver instantaneas.py). Una ejecución fijada a una fecha
+carga el panel vigente a esa fecha y no solicita nada a la API.
+
+@author: lauta
+"""
+
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, directorio_cache, hoy, fecha_consulta, temporal, candado_archivo
+from instantaneas import Instantaneas, SinInstantanea, instantaneas, registrar
+from calculos import normalizar_precios
+from datos import almacen_actual
+
+
+CAMPOS = ['close', 'adjusted_close']
+CLAVE = 'panel/precios'
+TABLAS = {campo: f'precios/{campo}' for campo in CAMPOS}
+REVISADAS = 'precios/revisadas'
+
+def _separar(ticker:str):
+    """'SQM-B.SN' -> ('SQM-B', 'SN')"""
+    codigo, _, exchange = ticker.rpartition('.')
+    return codigo, exchange
+
+def historias(tickers:list, desde:str=None, hilos:int=8):
+    """
+    Precios historicos de `tickers`, con todas las llamadas a EOD en paralelo.
+
+    Parameters
+    ----------
+    tickers : list
+        Codigos junto a su exchange ('SQM-B.SN', 'SPIPSA.INDX', ...).
+    desde : str, optional
+        Primera fecha 'YYYY-MM-DD'. The default is None (toda la historia).
+    hilos : int, optional
+        Solicitudes simultaneas a EOD. The default is 8.
+
+    Returns
+    -------
+    dict
+        campo ('close', 'adjusted_close') -> DataFrame fecha x ticker. Los
+        tickers sin datos quedan fuera.
+
+    """
+    client = cliente_eod()
+    parametros = {} if desde is None else {'from': desde}
+
+    def solicitar(ticker):
+        try:
+            precios = normalizar_precios(client.get_prices_eod(ticker, **parametros))
+            return ticker, precios[CAMPOS]
+        except SinInstantanea:
+            # en una ejecución fijada la falta de datos no se puede ocultar
+            raise
+        except Exception:
+            print(f"No se pudieron obtener los precios de {ticker}")
+            return ticker, None
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        resultados = [(t, p) for t, p in ejecutor.map(solicitar, tickers) if p is not None and not p.empty]
+    return {
+        campo: pd.concat([p[campo].rename(t) for t, p in resultados], axis=1).sort_index() if resultados else pd.DataFrame()
+        for campo in CAMPOS
+        }
+
+class PanelPrecios:
+    """
+    Precios diarios fecha x ticker persistidos entre ejecuciones.
+
+    Parameters
+    ----------
+    ruta : str, optional
+        Archivo donde se guarda el panel. The default is 'precios.pkl' en
+        el directorio de cache.
+    max_dias : int, optional
+        Dias habiles faltantes hasta los que se ocupa la API bulk; con más
+        se pide a cada ticker su historia desde la ultima fecha. The
+        default is 5.
+
+    """
+
+    def __init__(self, ruta:str=None, max_dias:int=5):
+        self.ruta = ruta or os.path.join(directorio_cache(), 'precios.pkl')
+        self.max_dias = max_dias
+        self.campos = {campo: pd.DataFrame() for campo in CAMPOS}
+        # ultimo dia ya solicitado por exchange (incluye feriados sin datos)
+        self.revisadas = {}
+        # tickers descargados por este proceso desde que se cargó el panel
+        self._tocados = set()
+
+    @classmethod
+    def cargar(cls, ruta:str=None, max_dias:int=5):
+        """
+        Recuperar el panel guardado (o uno vacio si no existe).
+
+        Con una fecha de consulta fijada se carga la instantánea del panel
+        vigente a esa fecha (sin filas posteriores), o se levanta
+        `SinInstantanea` si no hay ninguna.
+        """
+        panel = cls(ruta, max_dias)
+        fecha = fecha_consulta()
+        if fecha is not None:
+            campos, revisadas = (instantaneas() or Instantaneas()).leer(CLAVE, fecha)
+            panel.campos = {campo: tabla.loc[:fecha] for campo, tabla in campos.items()}
+            panel.revisadas = {exchange: min(dia, fecha) for exchange, dia in revisadas.items()}
+        else:
+            guardado = panel._leer()
+            if guardado is not None:
+                panel.campos, panel.revisadas = guardado
+        return panel
+
+    def _leer(self):
+        """
+        (campos, revisadas) guardados, desde el almacen columnar si está en
+        uso y no es más antiguo que el archivo del panel; None si no hay.
+        """
+        almacen = almacen_actual()
+        if almacen is not None and all(almacen.contiene(n) for n in list(TABLAS.values()) + [REVISADAS]):
+            escrita = almacen.escrita(REVISADAS)
+            # un proceso sin almacen pudo guardar despues solo el archivo
+            if not os.path.exists(self.ruta) or (escrita is not None and
+                                                 escrita >= pd.Timestamp.fromtimestamp(os.path.getmtime(self.ruta))):
+                dias = almacen.leer(REVISADAS)
+                campos = {campo: almacen.leer(nombre) for campo, nombre in TABLAS.items()}
+                return campos, dict(zip(dias['exchange'], dias.index))
+        if os.path.exists(self.ruta):
+            with open(self.ruta, 'rb') as archivo:
+                return pickle.load(archivo)
+        return None
+
+    def _combinar(self, campos:dict, revisadas:dict):
+        """
+        Unir el panel guardado por otro proceso: en los tickers descargados
+        aquí mandan los precios propios, en el resto los del disco.
+        """
+        for campo in CAMPOS:
+            propios, ajenos = self.campos[campo], campos[campo]
+            tocados = [t for t in propios.columns if t in self._tocados]
+            resto = [t for t in propios.columns if t not in self._tocados]
+            tabla = pd.concat([propios[tocados].combine_first(ajenos.reindex(columns=tocados)),
+                               ajenos.drop(columns=tocados, errors='ignore').combine_first(propios[resto])], axis=1)
+            self.campos[campo] = tabla.sort_index()
+        for exchange, dia in revisadas.items():
+            self.revisadas[exchange] = max(dia, self.revisadas.get(exchange, dia))
+
+    def guardar(self):
+        """
+        Guardar el panel en disco y como instantánea del dia.
+
+        Otras etapas pueden estar guardando el mismo panel: dentro de un
+        bloqueo se vuelve a leer el archivo, se combina con este y se
+        reemplaza.
+        """
+        with candado_archivo(self.ruta):
+            guardado = self._leer()
+            if guardado is not None:
+                self._combinar(*guardado)
+            temporal_ = temporal(self.ruta)
+            with open(temporal_, 'wb') as archivo:
+                pickle.dump((self.campos, self.revisadas), archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal_, self.ruta)
+            almacen = almacen_actual()
+            if almacen is not None:
+                for campo, nombre in TABLAS.items():
+                    almacen.guardar(nombre, self.campos[campo], tipo='precios', frecuencia='D')
+                # despues de las tablas: su fecha indica que el almacen está al dia
+                dias = pd.DataFrame({'exchange': list(self.revisadas)}, index=pd.DatetimeIndex(list(self.revisadas.values())))
+                almacen.guardar(REVISADAS, dias, tipo='precios')
+        self._tocados = set()
+        registrar(CLAVE, (self.campos, self.revisadas))
+
+    @property
+    def tickers(self):
+        return list(self.campos['close'].columns)
+
+    def _incorporar(self, nuevos:dict, reemplazar:bool=False):
+        """Agregar (o reemplazar) columnas y filas de `nuevos` en cada campo."""
+        for campo in CAMPOS:
+            tabla, nueva = self.campos[campo], nuevos[campo]
+            if nueva.empty:
+                continue
+            self._tocados.update(nueva.columns)
+            if reemplazar:
+                tabla = tabla.drop(columns=[c for c in nueva.columns if c in tabla.columns])
+                tabla = pd.concat([tabla, nueva], axis=1)
+            else:
+                tabla = nueva.combine_first(tabla)
+            self.campos[campo] = tabla.sort_index()
+
+    def sembrar(self, tickers:list):
+        """
+        Descargar la historia completa de los `tickers` que aun no están en el panel.
+        """
+        faltantes = [t for t in dict.fromkeys(tickers) if t not in self.campos['close'].columns]
+        if faltantes:
+            self._incorporar(historias(faltantes), reemplazar=True)
+
+    def _bulk(self, exchange:str, codigos:list, dia:pd.Timestamp):
+        """Cierres de un dia de todos los `codigos` del exchange y los que tuvieron eventos."""
+        client = cliente_eod()
+        parametros = {'date': dia.strftime('%Y-%m-%d'), 'symbols': ','.join(codigos)}
+        filas = pd.DataFrame(client.get_bulk_markets(exchange, **parametros))
+        eventos = set()
+        for tipo in ('splits', 'dividends'):
+            registros = pd.DataFrame(client.get_bulk_markets(exchange, type=tipo, **parametros))
+            if not registros.empty:
+                eventos |= set(registros['code'])
+        return filas, eventos
+
+    def actualizar(self, hasta=None, tickers:list=None):
+        """
+        Llevar el panel hasta la fecha `hasta`.
+
+        Parameters
+        ----------
+        hasta : str | pd.Timestamp, optional
+            Ultimo dia a solicitar. The default is None (hoy, o la fecha
+            de consulta fijada).
+        tickers : list, optional
+            Tickers que deben estar en el panel; los nuevos se siembran con
+            su historia. The default is None.
+
+        Returns
+        -------
+        PanelPrecios
+            El mismo panel, para encadenar lecturas.
+
+        """
+        if tickers:
+            self.sembrar(tickers)
+        if fecha_consulta() is not None:
+            # el panel ya es el vigente a la fecha fijada
+            return self
+        hasta = hoy() if hasta is None else pd.Timestamp(hasta)
+
+        por_exchange = {}
+        for ticker in self.tickers:
+            codigo, exchange = _separar(ticker)
+            por_exchange.setdefault(exchange, {})[codigo] = ticker
+
+        for exchange, tickers_ in por_exchange.items():
+            cierres = self.campos['close'][list(tickers_.values())]
+            guardada = cierres.dropna(how='all').index.max()
+            ultima = max(guardada, self.revisadas.get(exchange, guardada))
+            dias = pd.bdate_range(ultima + pd.Timedelta(days=1), hasta)
+            if len(dias) == 0:
+                continue
+            if len(dias) > self.max_dias:
+                # muchos dias: la historia reciente de cada ticker, desde el ultimo dia guardado
+                recientes = historias(list(tickers_.values()), desde=guardada.strftime('%Y-%m-%d'))
+                ajustados = self.precios(campo='adjusted_close').reindex(index=[guardada], columns=recientes['adjusted_close'].columns)
+                nuevos = recientes['adjusted_close'].reindex(index=[guardada])
+                # si el ultimo dia guardado cambió hubo dividendos o splits en el intertanto
+                revisados = [t for t in nuevos.columns if not np.isclose(nuevos.at[guardada, t], ajustados.at[guardada, t], equal_nan=True)]
+                self._incorporar(recientes)
+                if revisados:
+                    self._incorporar(historias(revisados), reemplazar=True)
+                # con algun ticker sin respuesta se vuelve a pedir en la proxima ejecución
+                if set(recientes['close'].columns) >= set(tickers_.values()):
+                    self.revisadas[exchange] = dias[-1]
+                continue
+
+            for dia in dias:
+                filas, eventos = self._bulk(exchange, list(tickers_), dia)
+                if not filas.empty:
+                    filas = filas[filas['code'].isin(tickers_)]
+                    fecha = pd.to_datetime(filas['date']).max()
+                    self._incorporar({
+                        campo: pd.DataFrame([filas.set_index('code')[campo].rename(tickers_).to_dict()], index=[fecha])
+                        for campo in CAMPOS
+                        })
+                # el ultimo dia puede no estar publicado aun: se vuelve a pedir
+                if not filas.empty or dia < hasta:
+                    self.revisadas[exchange] = dia
+                # dividendos y splits cambian el adjusted_close de toda la historia
+                ajustados = [tickers_[c] for c in eventos if c in tickers_]
+                if ajustados:
+                    self._incorporar(historias(ajustados), reemplazar=True)
+        return self
+
+    def precios(self, tickers:list=None, campo:str='adjusted_close'):
+        """
+        Tabla fecha x ticker de `campo` ('close' o 'adjusted_close').
+
+        Si el panel se cargó del almacen columnar los datos son de solo
+        lectura; `copy()` si se van a modificar.
+        """
+        tabla = self.campos[campo]
+        return tabla if tickers is None else tabla[list(tickers)]
+
+    def ultimo(self, ticker:str, campo:str='close'):
+        """
+        Ultimo precio conocido de `ticker`.
+        """
+        return float(self.campos[campo][ticker].dropna().iloc[-1])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Regresiones lineales simples para muchas parejas de series a la vez.
+
+`regresiones` ajusta y = a + b·x para cada combinación de una columna de
+X con una de Y mediante sumas de productos (unas pocas multiplicaciones
+de matrices), sin un `np.polyfit` por pareja. Cada pareja ocupa solo las
+fechas en que ambas series tienen datos. `regresiones_moviles` entrega lo
+mismo para cada ventana movil, con sumas acumuladas en el tiempo.
+
+@author: lauta
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _alinear(X:pd.DataFrame, Y:pd.DataFrame):
+    """Fechas comunes a ambas tablas (una sola vez para todas las parejas)."""
+    X, Y = X.align(Y, join='inner', axis=0)
+    return X.to_numpy(dtype=float), Y.to_numpy(dtype=float), X.index
+
+def _estadisticos(n, sx, sy, sxx, syy, sxy):
+    """Pendiente, intercepto y R2 desde las sumas de cada pareja."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx**2 / n
+        var_y = syy - sy**2 / n
+        pendiente = cov / var_x
+        intercepto = (sy - pendiente * sx) / n
+        r_2 = cov**2 / (var_x * var_y)
+    return pendiente, intercepto, r_2
+
+def regresiones(X:pd.DataFrame, Y:pd.DataFrame, min_obs:int=12):
+    """
+    Regresión de cada columna de Y contra cada columna de X.
+
+    Parameters
+    ----------
+    X : pd.DataFrame
+        Variables explicativas, una por columna, indexadas por fecha.
+    Y : pd.DataFrame
+        Variables explicadas, una por columna.
+    min_obs : int, optional
+        Minimo de fechas con ambos datos para reportar una pareja. The
+        default is 12.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por pareja (x, y) con pendiente, intercepto, r_2 y
+        numero de observaciones, ordenada de mayor a menor R2.
+
+    """
+    x, y, _ = _alinear(X, Y)
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    # centrar cada serie reduce la perdida de precision en las sumas
+    x0 = np.where(mx, x0 - np.nanmean(x, axis=0), 0.0)
+    y0 = np.where(my, y0 - np.nanmean(y, axis=0), 0.0)
+    mx, my = mx.astype(float), my.astype(float)
+
+    n = mx.T @ my
+    sx, sy = x0.T @ my, mx.T @ y0
+    sxx, syy = (x0**2).T @ my, mx.T @ (y0**2)
+    sxy = x0.T @ y0
+    pendiente, intercepto, r_2 = _estadisticos(n, sx, sy, sxx, syy, sxy)
+    # volver el intercepto a la escala original
+    intercepto = intercepto + np.nanmean(y, axis=0)[None, :] - pendiente * np.nanmean(x, axis=0)[:, None]
+
+    tabla = pd.DataFrame({
+        'x': np.repeat(X.columns.to_numpy(), len(Y.columns)),
+        'y': np.tile(Y.columns.to_numpy(), len(X.columns)),
+        'pendiente': pendiente.ravel(),
+        'intercepto': intercepto.ravel(),
+        'r_2': r_2.ravel(),
+        'n': n.ravel().astype(int),
+        })
+    tabla = tabla[(tabla['n'] >= min_obs) & tabla['r_2'].notna()]
+    return tabla.sort_values('r_2', ascending=False).reset_index(drop=True)
+
+def regresiones_moviles(X:pd.DataFrame, Y:pd.DataFrame, window:int, min_obs:int=None):
+    """
+    Regresión de cada columna de Y contra cada columna de X en ventanas moviles.
+
+    Parameters
+    ----------
+    X, Y : pd.DataFrame
+        Igual que en `regresiones`.
+    window : int
+        Numero de fechas de cada ventana.
+    min_obs : int, optional
+        Minimo de fechas con ambos datos dentro de la ventana. The default
+        is None (la ventana completa).
+
+    Returns
+    -------
+    dict
+        'pendiente', 'intercepto' y 'r_2': DataFrames indexados por fecha
+        con columnas (x, y).
+
+    """
+    min_obs = window if min_obs is None else min_obs
+    x, y, fechas = _alinear(X, Y)
+    medias_x, medias_y = np.nanmean(x, axis=0), np.nanmean(y, axis=0)
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0 = np.where(mx, x - medias_x, 0.0)
+    y0 = np.where(my, y - medias_y, 0.0)
+    mx, my = mx.astype(float), my.astype(float)
+
+    def movil(a, b):
+        # suma en la ventana de a_t * b_t para cada pareja: fecha x columnas de X x columnas de Y
+        acumulada = np.cumsum(a[:, :, None] * b[:, None, :], axis=0)
+        suma = acumulada.copy()
+        suma[window:] -= acumulada[:-window]
+        return suma
+
+    n = movil(mx, my)
+    pendiente, intercepto, r_2 = _estadisticos(
+        n, movil(x0, my), movil(mx, y0), movil(x0**2, my), movil(mx, y0**2), movil(x0, y0)
+        )
+    intercepto = intercepto + medias_y[None, None, :] - pendiente * medias_x[None, :, None]
+    invalidas = n < min_obs
+    invalidas[:window - 1] = True
+
+    columnas = pd.MultiIndex.from_product([X.columns, Y.columns], names=['x', 'y'])
+    resultado = {}
+    for nombre, valores in (('pendiente', pendiente), ('intercepto', intercepto), ('r_2', r_2)):
+        valores = np.where(invalidas, np.nan, valores)
+        resultado[nombre] = pd.DataFrame(valores.reshape(len(fechas), -1), index=fechas, columns=columnas)
+    return resultado
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio local de valorización que mantiene los datos en memoria.
+
+Un solo proceso guarda las series macro, los estados financieros, los
+precios y el ultimo screener, los actualiza cada cierto tiempo y responde
+consultas por HTTP (o por un socket Unix) en milisegundos, sin volver a
+importar nada ni a solicitar a las APIs en cada consulta:
+
+    python servicio.py --puerto 8081
+    curl "http://127.0.0.1:8081/valor?ticker=SQM-B.SN&ticker=CMPC.SN"
+    curl "http://127.0.0.1:8081/pares?ticker=SQM-B.SN"
+    curl "http://127.0.0.1:8081/cribado?exchange=SN&sector=Basic%20Materials"
+
+El valor por acción es el de los Pasos 1 a 5 del valorizador, calculado
+con `valor_historico.valorizar` a la fecha de hoy. Todas las solicitudes
+comparten los mismos datos: lo que falta se descarga una sola vez aunque
+lo pidan varios clientes a la vez.
+
+Requiere aiohttp.
+
+@author: lauta
+"""
+
+import asyncio
+import argparse
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, hoy
+from datos import refrescar
+from precios import PanelPrecios
+from monedas import a_cotizacion, par
+from pares import IndicePares
+from cribado import cribar
+from calculos import porcentaje_accion
+from bcch_asincrono import _aiohttp
+from valor_historico import INDICE_EOD, INDICE_BCCH, TASA_10_US, EXPECTATIVA_IPC, SPREAD_SOBERANO, PIB,\
+    _INGRESOS, _BALANCE, _estados, factores_mercado, betas_historicos, valorizar
+
+
+SERIES = [INDICE_BCCH, TASA_10_US, EXPECTATIVA_IPC, SPREAD_SOBERANO, PIB]
+
+def _web():
+    _aiohttp()
+    from aiohttp import web
+    return web
+
+def _json(valor):
+    """Valores de numpy y pandas como tipos de JSON (NaN -> None)."""
+    if isinstance(valor, dict):
+        return {str(k): _json(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_json(v) for v in valor]
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime('%Y-%m-%d')
+    if isinstance(valor, (float, np.floating)):
+        return None if np.isnan(valor) else float(valor)
+    if isinstance(valor, np.integer):
+        return int(valor)
+    return valor
+
+
+class Datos:
+    """
+    Insumos de la valorización en memoria, compartidos por todas las consultas.
+
+    Parameters
+    ----------
+    panel_precios : PanelPrecios, optional
+        The default is None (el del cache).
+    tasa_impuestos : float, optional
+        The default is 0.27.
+    vigencia : pd.Timedelta, optional
+        Tiempo que se conservan los estados financieros y los indices de
+        pares antes de volver a solicitarlos. The default is 1 dia.
+
+    """
+
+    def __init__(self, panel_precios:PanelPrecios=None, tasa_impuestos:float=0.27,
+                 vigencia:pd.Timedelta=pd.Timedelta(days=1)):
+        self.panel = panel_precios or PanelPrecios.cargar()
+        self.tasa_impuestos = tasa_impuestos
+        self.vigencia = vigencia
+        self.fecha = None
+        self.factores = None
+        self.actualizado = None
+        # clave -> (momento, Future), con una sola solicitud en vuelo por clave
+        self._memoria = {}
+        self._candado = threading.Lock()
+        # el panel de precios se modifica al sembrar tickers nuevos
+        self._candado_panel = threading.Lock()
+
+    def _obtener(self, clave, solicitar, vigencia:pd.Timedelta=None):
+        """Resultado memorizado de `solicitar()` mientras esté vigente."""
+        ahora = pd.Timestamp.now()
+        with self._candado:
+            guardado = self._memoria.get(clave)
+            propio = guardado is None or (vigencia is not None and ahora - guardado[0] > vigencia)
+            if propio:
+                futuro = Future()
+                self._memoria[clave] = (ahora, futuro)
+            else:
+                futuro = guardado[1]
+
+        if propio:
+            try:
+                futuro.set_result(solicitar())
+            except BaseException as error:
+                with self._candado:
+                    self._memoria.pop(clave, None)
+                futuro.set_exception(error)
+        return futuro.result()
+
+    def actualizar(self):
+        """
+        Series macro, precios y tipos de cambio al dia (todo lo que usan las
+        consultas, menos los estados financieros).
+        """
+        refrescar(SERIES)
+        with self._candado_panel:
+            self.panel.actualizar(tickers=[INDICE_EOD, par('USD', 'CLP')])
+            self.panel.guardar()
+        self.fecha = hoy()
+        self.factores = factores_mercado(pd.DatetimeIndex([self.fecha]))
+        with self._candado:
+            # los betas y valores dependen de los precios recién actualizados
+            self._memoria = {k: v for k, v in self._memoria.items() if k[0] in ('estados', 'pares', 'cribado')}
+        self.actualizado = pd.Timestamp.now()
+        return self
+
+    def _precios(self, ticker:str):
+        with self._candado_panel:
+            if ticker not in self.panel.tickers:
+                self.panel.sembrar([ticker])
+            return self.panel.precios([ticker, INDICE_EOD])
+
+    def estados(self, ticker:str):
+        """Estados TTM del ticker en la moneda en que transa."""
+        def solicitar():
+            estados_ = _estados(ticker)
+            with self._candado_panel:
+                return a_cotizacion(estados_, _INGRESOS + _BALANCE, self.panel, fecha='fecha')
+        return self._obtener(('estados', ticker), solicitar, self.vigencia)
+
+    def valor(self, ticker:str):
+        """
+        Valor por acción del ticker frente a su ultimo precio.
+
+        Returns
+        -------
+        dict
+            ticker, fecha, valor_por_accion, precio, descuento y el mensaje
+            del valorizador.
+
+        """
+        def solicitar():
+            precios = self._precios(ticker)
+            betas_ = betas_historicos(precios, self.factores.index)
+            tabla = valorizar(self.estados(ticker), self.factores, betas_, self.tasa_impuestos)
+            fila = tabla.xs(ticker, level='ticker').iloc[-1]
+            precio = float(precios[ticker].dropna().iloc[-1]) if ticker in self.panel.tickers else np.nan
+            valor = fila['valor_por_accion']
+            if valor > precio:
+                mensaje = f"{ticker} cotiza por DEBAJO de la estimación de valor ({porcentaje_accion(valor, precio)}%)"
+            else:
+                mensaje = f"{ticker} cotiza por SOBRE de la estimación de valor ({porcentaje_accion(precio, valor)}%)"
+            return {
+                'ticker': ticker,
+                'fecha': self.fecha,
+                'trimestre': fila['trimestre'],
+                'beta': fila['beta'],
+                'costo_capital': fila['costo_capital'],
+                'valor_por_accion': valor,
+                'precio': precio,
+                'descuento': valor / precio - 1,
+                'mensaje': mensaje,
+                }
+        return self._obtener(('valor', ticker), solicitar)
+
+    def pares(self, exchange:str, moneda:str=None):
+        """Indice de multiplos del exchange (bulk fundamentals de EOD)."""
+        def solicitar():
+            fundamentales = {}
+            offset, limite = 0, 500
+            while True:
+                pagina = cliente_eod().get_fundamentals_bulk(exchange, offset=offset, limit=limite)
+                fundamentales.update({f"{d['General']['Code']}.{exchange}": d for d in pagina.values()})
+                if len(pagina) < limite:
+                    break
+                offset += limite
+            return IndicePares.desde_bulk(fundamentales, moneda)
+        return self._obtener(('pares', exchange, moneda), solicitar, self.vigencia)
+
+    def posicion(self, ticker:str, moneda:str=None):
+        """Percentil y banda de cada multiplo del ticker frente a su sector."""
+        _, _, exchange = ticker.rpartition('.')
+        pares = self.pares(exchange, moneda)
+        if ticker not in pares.tabla.index:
+            raise KeyError(f"{ticker} no está en los fundamentales de {exchange}")
+        fila = pares.tabla.loc[ticker]
+        return {
+            'ticker': ticker,
+            'sector': fila['sector'],
+            'multiplos': {m: pares.posicion(m, fila[m], fila['sector']) for m in pares.multiplos if pd.notna(fila[m])},
+            }
+
+    def cribado(self, exchanges:tuple, **parametros):
+        """Tabla del screener de `exchanges` (ver cribado.cribar)."""
+        return self._obtener(('cribado', exchanges), lambda: cribar(list(exchanges), **parametros), self.vigencia)
+
+
+def aplicacion(datos:Datos):
+    """
+    Aplicación aiohttp con las consultas /valor, /pares, /cribado y /estado.
+
+    Los calculos corren en el pool de hilos del event loop: las consultas
+    simultaneas no se bloquean entre si y leen los mismos datos.
+    """
+    web = _web()
+
+    async def en_hilo(funcion, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: funcion(*args, **kwargs))
+
+    async def responder(funcion, *args, **kwargs):
+        try:
+            return web.json_response(_json(await en_hilo(funcion, *args, **kwargs)))
+        except KeyError as error:
+            return web.json_response({'error': str(error)}, status=404)
+        except Exception as error:
+            return web.json_response({'error': f'{type(error).__name__}: {error}'}, status=500)
+
+    async def valor(solicitud):
+        tickers = solicitud.query.getall('ticker', [])
+        if not tickers:
+            return web.json_response({'error': 'falta ticker'}, status=400)
+        return await responder(lambda: [datos.valor(t) for t in tickers])
+
+    async def pares(solicitud):
+        ticker = solicitud.query.get('ticker')
+        if not ticker:
+            return web.json_response({'error': 'falta ticker'}, status=400)
+        return await responder(datos.posicion, ticker, solicitud.query.get('moneda'))
+
+    async def cribado(solicitud):
+        exchanges = tuple(solicitud.query.getall('exchange', ['SN']))
+
+        def tabla():
+            resultado = datos.cribado(exchanges)
+            for columna in ('sector', 'industria', 'moneda'):
+                if columna in solicitud.query and columna in resultado:
+                    resultado = resultado[resultado[columna] == solicitud.query[columna]]
+            return resultado.reset_index().to_dict(orient='records')
+        return await responder(tabla)
+
+    async def estado(solicitud):
+        return web.json_response(_json({
+            'fecha': datos.fecha,
+            'actualizado': str(datos.actualizado),
+            'memoria': [list(clave) for clave in list(datos._memoria)],
+            }))
+
+    app = web.Application()
+    app.router.add_get('/valor', valor)
+    app.router.add_get('/pares', pares)
+    app.router.add_get('/cribado', cribado)
+    app.router.add_get('/estado', estado)
+    return app
+
+async def _refrescar(datos:Datos, intervalo:float):
+    """Actualizar los datos cada `intervalo` segundos sin detener las consultas."""
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, datos.actualizar)
+        except Exception as error:
+            print(f"No se pudo actualizar: {error}")
+
+async def iniciar(datos:Datos, puerto:int=0, socket:str=None, intervalo:float=None):
+    """
+    Levantar el servicio (en 127.0.0.1 o en un socket Unix) dentro del event loop actual.
+
+    Returns
+    -------
+    tuple
+        (runner, direccion): `await runner.cleanup()` lo detiene.
+
+    """
+    web = _web()
+    app = aplicacion(datos)
+    if intervalo:
+        async def refresco(app):
+            tarea = asyncio.create_task(_refrescar(datos, intervalo))
+            yield
+            tarea.cancel()
+        app.cleanup_ctx.append(refresco)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    if socket:
+        sitio = web.UnixSite(runner, socket)
+        await sitio.start()
+        return runner, socket
+    sitio = web.TCPSite(runner, '127.0.0.1', puerto)
+    await sitio.start()
+    return runner, f'http://127.0.0.1:{sitio._server.sockets[0].getsockname()[1]}'
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Servicio local de valorización con los datos en memoria')
+    parser.add_argument('--puerto', type=int, default=8081)
+    parser.add_argument('--socket', default=None, help='atender en este socket Unix en vez de un puerto')
+    parser.add_argument('--intervalo', type=float, default=3600, help='segundos entre actualizaciones de los datos')
+    argumentos = parser.parse_args(argumentos)
+
+    datos = Datos().actualizar()
+
+    async def correr():
+        runner, direccion = await iniciar(datos, argumentos.puerto, argumentos.socket, argumentos.intervalo)
+        print(f"Atendiendo en {direccion}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    asyncio.run(correr())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita el endpoint GetSeries de la API del Banco
+Central con respuestas grabadas, para probar los clientes sin red ni
+credenciales.
+
+Grabar las respuestas reales (una vez, con BCCH_USER y BCCH_PWD):
+
+    python servidor_bcch.py --grabar F068.B1.FLU.Z.0.C.N.Z.Z.Z.Z.6.0.M F073.TCO.PRE.Z.D F019.TBG.TAS.10.D
+
+Servirlas y apuntar los clientes al servidor:
+
+    python servidor_bcch.py --puerto 8080
+    BCCH_URL=http://127.0.0.1:8080/SieteRestWS/SieteRestWS.ashx python macro.py
+
+Las respuestas se guardan como '<codigo>.json' en 'bcch_grabado' del
+directorio de cache (o en --carpeta). Una serie no grabada responde con
+un codigo de error, igual que la API ante un codigo invalido.
+
+Requiere aiohttp.
+
+@author: lauta
+"""
+
+import os
+import json
+import asyncio
+import argparse
+
+from clientes import directorio_cache
+from bcch_asincrono import _aiohttp
+
+
+RUTA = '/SieteRestWS/SieteRestWS.ashx'
+
+def _web():
+    _aiohttp()
+    from aiohttp import web
+    return web
+
+def carpeta_grabaciones():
+    return os.path.join(directorio_cache(), 'bcch_grabado')
+
+def aplicacion(carpeta:str=None, retardo:float=0.0):
+    """
+    Aplicación aiohttp que responde GetSeries desde los archivos grabados.
+
+    Parameters
+    ----------
+    carpeta : str, optional
+        Carpeta con los '<codigo>.json'. The default is carpeta_grabaciones().
+    retardo : float, optional
+        Segundos de espera por respuesta, para simular la latencia de la
+        API. The default is 0.0.
+
+    Returns
+    -------
+    aiohttp.web.Application
+
+    """
+    web = _web()
+    carpeta = carpeta or carpeta_grabaciones()
+
+    async def get_series(solicitud):
+        if retardo:
+            await asyncio.sleep(retardo)
+        parametros = solicitud.query
+        if parametros.get('function') != 'GetSeries':
+            return web.json_response({'Codigo': -5, 'Descripcion': 'Función no soportada por el servidor local'})
+        serie = parametros.get('timeseries', '')
+        archivo = os.path.join(carpeta, f'{serie}.json')
+        if not serie or os.path.basename(serie) != serie or not os.path.exists(archivo):
+            return web.json_response({
+                'Codigo': -50,
+                'Descripcion': f'Serie {serie} no grabada',
+                'Series': {'descripEsp': None, 'descripIng': None, 'seriesId': serie, 'Obs': None},
+                'SeriesInfos': [],
+                })
+        with open(archivo, encoding='utf-8') as fuente:
+            return web.Response(text=fuente.read(), content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get(RUTA, get_series)
+    return app
+
+async def iniciar(carpeta:str=None, puerto:int=0, retardo:float=0.0):
+    """
+    Levantar el servidor en 127.0.0.1 dentro del event loop actual.
+
+    Returns
+    -------
+    tuple
+        (runner, url): `await runner.cleanup()` lo detiene y `url` va en
+        ClienteBCChAsincrono(url=...) o en BCCH_URL.
+
+    """
+    web = _web()
+    runner = web.AppRunner(aplicacion(carpeta, retardo))
+    await runner.setup()
+    sitio = web.TCPSite(runner, '127.0.0.1', puerto)
+    await sitio.start()
+    puerto = sitio._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{puerto}{RUTA}'
+
+async def grabar(series:list, carpeta:str=None):
+    """
+    Descargar de la API real y guardar las respuestas completas de `series`.
+    """
+    from clientes import cliente_bcch_asincrono
+    carpeta = carpeta or carpeta_grabaciones()
+    os.makedirs(carpeta, exist_ok=True)
+    cliente = cliente_bcch_asincrono()
+    async with cliente.sesion() as sesion:
+        respuestas = await asyncio.gather(*(cliente.solicitar(sesion, s) for s in series))
+    for serie, respuesta in zip(series, respuestas):
+        with open(os.path.join(carpeta, f'{serie}.json'), 'w', encoding='utf-8') as destino:
+            json.dump(respuesta, destino, ensure_ascii=False)
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Servidor local de respuestas grabadas de la API del BCCh')
+    parser.add_argument('--carpeta', default=None, help='carpeta de las respuestas grabadas')
+    parser.add_argument('--puerto', type=int, default=8080)
+    parser.add_argument('--retardo', type=float, default=0.0, help='segundos de latencia simulada')
+    parser.add_argument('--grabar', nargs='+', metavar='CODIGO', help='grabar estas series desde la API real y salir')
+    argumentos = parser.parse_args(argumentos)
+
+    if argumentos.grabar:
+        asyncio.run(grabar(argumentos.grabar, argumentos.carpeta))
+        return
+    web = _web()
+    web.run_app(aplicacion(argumentos.carpeta, argumentos.retardo), host='127.0.0.1', port=argumentos.puerto)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Filtro de Hodrick-Prescott para series largas y para lotes de series.
+
+La tendencia resuelve (I + lamb * D'D) tau = y, donde D es el operador de
+segundas diferencias. La matriz es pentadiagonal, simetrica y definida
+positiva, por lo que se resuelve con un solver de bandas en O(n) y con
+todas las series de un lote como columnas del lado derecho.
+
+La versión unilateral (en tiempo real) es el filtro de Kalman del modelo
+y_t = tau_t + e_t, tau_t - 2*tau_{t-1} + tau_{t-2} = u_t con
+var(e) / var(u) = lamb. Su estimación en t es igual al ultimo dato del
+filtro bilateral aplicado a la muestra hasta t, pero se actualiza en O(1)
+con cada dato nuevo.
+
+@author: lauta
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _bandas_hp(n:int, lamb:float):
+    """
+    Matriz (I + lamb * D'D) en el formato de bandas superior de LAPACK.
+
+    Parameters
+    ----------
+    n : int
+        Numero de observaciones (al menos 3).
+    lamb : float
+        Parametro de suavizamiento.
+
+    Returns
+    -------
+    ab : np.ndarray
+        Arreglo de (3, n) para `scipy.linalg.solveh_banded`.
+
+    """
+    j = np.arange(n)
+    # cada fila de D tiene (1, -2, 1) en las columnas (r, r+1, r+2), r = 0..n-3
+    fila_valida = lambda r: (r >= 0) & (r <= n - 3)
+    diagonal = fila_valida(j - 2) * 1. + fila_valida(j - 1) * 4. + fila_valida(j) * 1.
+    primera = -2. * fila_valida(j[:-1]) - 2. * fila_valida(j[:-1] - 1)
+    segunda = 1. * fila_valida(j[:-2])
+
+    ab = np.zeros((3, n))
+    ab[2] = 1 + lamb * diagonal
+    ab[1, 1:] = lamb * primera
+    ab[0, 2:] = lamb * segunda
+    return ab
+
+def tendencia_hp(datos:np.ndarray, lamb:float=1600):
+    """
+    Tendencia de Hodrick-Prescott para una serie o un lote de series.
+
+    Parameters
+    ----------
+    datos : np.ndarray
+        Arreglo de (n,) o de (n, k) con una serie por columna, sin datos faltantes.
+    lamb : float, optional
+        Parametro de suavizamiento. The default is 1600 (trimestral).
+
+    Returns
+    -------
+    np.ndarray
+        Tendencia con la misma forma que `datos`.
+
+    """
+    from scipy.linalg import solveh_banded
+
+    datos = np.asarray(datos, dtype=float)
+    if not np.isfinite(datos).all():
+        raise ValueError('El filtro HP requiere series sin datos faltantes')
+    n = datos.shape[0]
+    # con menos de 3 datos no hay segundas diferencias que penalizar
+    if n < 3:
+        return datos.copy()
+    return solveh_banded(_bandas_hp(n, lamb), datos, check_finite=False)
+
+def _como_serie(serie):
+    """Una tabla de una sola columna como pd.Series."""
+    if isinstance(serie, pd.DataFrame) and serie.shape[1] == 1:
+        return serie.iloc[:, 0]
+    return serie
+
+def filtro_hp(serie, lamb:float=1600):
+    """
+    Filtro de Hodrick-Prescott (ciclo, tendencia), con la misma salida que
+    `sm.tsa.filters.hpfilter`.
+
+    Parameters
+    ----------
+    serie : pd.Series | pd.DataFrame | np.ndarray
+        Serie (o series en columnas) sin datos faltantes. Una tabla de una
+        sola columna se trata como serie, igual que statsmodels.
+    lamb : float, optional
+        Parametro de suavizamiento. The default is 1600 (trimestral).
+
+    Returns
+    -------
+    tuple
+        (ciclo, tendencia) de la serie, del mismo tipo que la entrada.
+
+    """
+    serie = _como_serie(serie)
+    if isinstance(serie, pd.DataFrame):
+        tendencia_ = pd.DataFrame(
+            tendencia_hp(serie.values, lamb), index=serie.index, columns=serie.columns
+            )
+    elif isinstance(serie, pd.Series):
+        nombre = serie.name if serie.name is not None else 'serie'
+        tendencia_ = pd.Series(
+            tendencia_hp(serie.values, lamb), index=serie.index, name=f'{nombre}_trend'
+            )
+    else:
+        tendencia_ = tendencia_hp(serie, lamb)
+
+    ciclo = serie - tendencia_
+    if isinstance(ciclo, pd.Series):
+        ciclo.name = f'{nombre}_cycle'
+    return ciclo, tendencia_
+
+class TendenciaHPUnilateral:
+    """
+    Filtro HP unilateral que se actualiza con cada dato nuevo.
+
+    Los datos se pueden agregar de a uno (`actualizar`) o en bloque
+    (`extender`); en ambos casos cada columna es una serie distinta y todas
+    comparten la misma frecuencia. La covarianza del filtro no depende de
+    los datos, por lo que es comun a todas las series del lote.
+
+    Parameters
+    ----------
+    lamb : float, optional
+        Parametro de suavizamiento. The default is 1600 (trimestral).
+
+    """
+
+    _F = np.array([[2., -1.], [1., 0.]])
+
+    def __init__(self, lamb:float=1600):
+        self.lamb = lamb
+        self.n = 0
+        # estado (tau_t, tau_{t-1}) por serie y covarianza en unidades de var(e)
+        self.estado = None
+        self.covarianza = None
+        self._anterior = None
+
+    @property
+    def tendencia(self):
+        """Ultima estimación de la tendencia (una por serie)."""
+        return None if self.estado is None else self.estado[:, 0].copy()
+
+    def actualizar(self, valores):
+        """
+        Incorporar un nuevo periodo.
+
+        Parameters
+        ----------
+        valores : float | np.ndarray
+            Dato nuevo de cada serie del lote.
+
+        Returns
+        -------
+        np.ndarray
+            Tendencia estimada para este periodo.
+
+        """
+        y = np.atleast_1d(np.asarray(valores, dtype=float))
+        if self.n == 0:
+            self._anterior = y
+            self.estado = np.column_stack([y, y])
+        elif self.n == 1:
+            # con dos datos y prior difuso el estado queda en (y_1, y_0) con varianza unitaria
+            self.estado = np.column_stack([y, self._anterior])
+            self.covarianza = np.eye(2)
+            self._anterior = None
+        else:
+            prediccion = self.estado @ self._F.T
+            p_ = self._F @ self.covarianza @ self._F.T
+            p_[0, 0] += 1 / self.lamb
+            ganancia = p_[:, 0] / (p_[0, 0] + 1)
+            self.estado = prediccion + np.outer(y - prediccion[:, 0], ganancia)
+            self.covarianza = p_ - np.outer(ganancia, p_[0, :])
+        self.n += 1
+        return self.tendencia
+
+    def extender(self, datos:np.ndarray):
+        """
+        Incorporar varios periodos seguidos.
+
+        Parameters
+        ----------
+        datos : np.ndarray
+            Arreglo de (m,) o de (m, k) con los periodos nuevos en las filas.
+
+        Returns
+        -------
+        np.ndarray
+            Tendencia unilateral para cada periodo nuevo, con la forma de `datos`.
+
+        """
+        datos = np.asarray(datos, dtype=float)
+        tendencias = np.empty((datos.shape[0], int(np.prod(datos.shape[1:]))))
+        for t in range(datos.shape[0]):
+            tendencias[t] = self.actualizar(datos[t])
+        return tendencias.reshape(datos.shape)
+
+def filtro_hp_unilateral(serie, lamb:float=1600):
+    """
+    Tendencia HP unilateral (solo ocupa información disponible en cada fecha).
+
+    Parameters
+    ----------
+    serie : pd.Series | pd.DataFrame | np.ndarray
+        Serie (o series en columnas) sin datos faltantes. Una tabla de una
+        sola columna se trata como serie.
+    lamb : float, optional
+        Parametro de suavizamiento. The default is 1600 (trimestral).
+
+    Returns
+    -------
+    tuple
+        (ciclo, tendencia) de la serie, del mismo tipo que la entrada.
+
+    """
+    serie = _como_serie(serie)
+    tendencia_ = TendenciaHPUnilateral(lamb).extender(np.asarray(serie, dtype=float))
+    if isinstance(serie, pd.DataFrame):
+        tendencia_ = pd.DataFrame(tendencia_, index=serie.index, columns=serie.columns)
+    elif isinstance(serie, pd.Series):
+        tendencia_ = pd.Series(tendencia_, index=serie.index, name=serie.name)
+    return serie - tendencia_, tendencia_
+
+if __name__ == '__main__':
+    # comprobación rapida con una serie trimestral en una tabla de una columna,
+    # como el PIB de acciones_exportadoras.py
+    indice = pd.date_range('2000-03-31', periods=80, freq=pd.offsets.QuarterEnd())
+    tabla = pd.DataFrame({'value': np.cumsum(np.random.default_rng(0).normal(size=80))}, index=indice)
+    ciclo, tendencia_ = filtro_hp(tabla, 1600)
+    assert isinstance(tendencia_, pd.Series) and tendencia_.name == 'value_trend'
+    assert np.allclose(tendencia_, filtro_hp(tabla['value'], 1600)[1])
+    assert np.allclose(ciclo + tendencia_, tabla['value'])
+    # el ultimo dato unilateral es el del filtro bilateral con toda la muestra
+    _, unilateral = filtro_hp_unilateral(tabla, 1600)
+    assert isinstance(unilateral, pd.Series) and np.isclose(unilateral.iloc[-1], tendencia_.iloc[-1])
+    print(f"filtro_hp: ok (tendencia final {tendencia_.iloc[-1]:.4f})")
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest del valor intrinseco de valorizador_empresas_ciclicas.py.
+
+Repite los Pasos 1 a 5 del valorizador en el cierre de cada trimestre y
+para muchas acciones a la vez, sobre una tabla (ticker, trimestre), con
+los datos que estaban disponibles en esa fecha:
+
+- los estados financieros desde su 'filing_date' (o 45 dias despues del
+  cierre si EOD no la informa),
+- las series del Banco Central y de FRED con un rezago de publicación,
+- el beta de las 104 semanas previas contra el IPSA (ajuste de Blume).
+
+Luego compara cada valor con el precio de ese dia y con los retornos de
+los trimestres siguientes. Todo se calcula con operaciones sobre la tabla
+completa (expanding por ticker y `merge_asof`), sin recorrer las fechas.
+Con el almacen columnar en uso los estados de cada ticker se guardan ahí
+('fundamentales/<ticker>') y los demás procesos del mismo dia los leen
+sin volver a pedirlos a EOD.
+
+    python valor_historico.py SQM-B.SN CMPC.SN --desde 2014-01-01
+    python valor_historico.py --exchange SN
+
+@author: lauta
+"""
+
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from clientes import cliente_eod, cliente_fred, directorio_cache, fecha_consulta, hoy
+from datos import serie_macro, almacen_actual
+from precios import PanelPrecios
+from monedas import a_cotizacion, par
+from betas import rendimientos, betas_moviles, blume
+from calculos import normalizar_fundamentales, tasa_libre_riesgo_local, costo_capital,\
+    valor_activos_operativos, valor_por_accion
+
+
+INDICE_EOD = 'SPIPSA.INDX'
+INDICE_BCCH = 'F013.IBC.IND.N.7.LAC.CL.CLP.BLO.D' # IPSA
+TASA_10_US = 'F019.TBG.TAS.10.D'
+EXPECTATIVA_IPC = 'F089.IPC.V12.14.M'
+SPREAD_SOBERANO = 'F019.SPS.PBP.91.D'
+PIB = 'F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T'
+
+# desde el inicio del periodo hasta que el dato se publica
+REZAGOS = {
+    'diario': pd.Timedelta(days=1),
+    'mensual': pd.DateOffset(months=2),
+    'trimestral': pd.DateOffset(months=5),
+    }
+
+_INGRESOS = ['totalRevenue', 'netIncome', 'depreciationAndAmortization', 'interestExpense',
+             'incomeTaxExpense', 'ebit']
+_BALANCE = ['shortTermDebt', 'longTermDebt', 'totalStockholderEquity', 'netReceivables',
+            'inventory', 'accountsPayable', 'propertyPlantAndEquipmentNet', 'goodWill',
+            'otherAssets', 'cashAndEquivalents', 'noncontrollingInterestInConsolidatedEntity']
+
+def _estados(ticker:str):
+    """Estados TTM de un ticker, con la fecha en que se publicó cada trimestre."""
+    client = cliente_eod()
+    ingresos = client.get_fundamental_equity(ticker, filter_='Financials::Income_Statement::quarterly')
+    balance = client.get_fundamental_equity(ticker, filter_='Financials::Balance_Sheet::quarterly')
+    # igual que el valorizador: ingresos TTM y balance como promedio de 4 trimestres
+    inc_ = normalizar_fundamentales(ingresos).reindex(columns=_INGRESOS).fillna(0)
+    bs_ = normalizar_fundamentales(balance).reindex(columns=_BALANCE).fillna(0) / 4
+    tabla = inc_.join(bs_, how='inner').dropna()
+
+    crudos = pd.DataFrame(ingresos).T
+    crudos.index = pd.to_datetime(crudos['date'])
+    crudos = crudos.reindex(tabla.index)
+    publicacion = pd.to_datetime(crudos['filing_date'], errors='coerce') if 'filing_date' in crudos else pd.NaT
+    tabla['disponible'] = pd.Series(publicacion, index=tabla.index).fillna(tabla.index.to_series() + pd.Timedelta(days=45))
+    tabla['moneda'] = crudos['currency_symbol'] if 'currency_symbol' in crudos else None
+    # moneda en que transa el ticker, la de sus precios
+    try:
+        tabla['cotizacion'] = client.get_fundamental_equity(ticker, filter_='General::CurrencyCode')
+    except Exception:
+        tabla['cotizacion'] = None
+
+    # acciones en circulación de cada trimestre, o las del balance si EOD no las informa
+    try:
+        acciones = pd.DataFrame(client.get_fundamental_equity(ticker, filter_='outstandingShares::quarterly')).T
+        acciones = acciones.set_index(pd.to_datetime(acciones['dateFormatted']))['shares'].astype(float).sort_index()
+        tabla['acciones'] = acciones.reindex(tabla.index, method='ffill')
+    except Exception:
+        tabla['acciones'] = np.nan
+    registradas = pd.DataFrame(balance).T
+    if 'commonStockSharesOutstanding' in registradas:
+        registradas.index = pd.to_datetime(registradas['date'])
+        tabla['acciones'] = tabla['acciones'].fillna(
+            pd.to_numeric(registradas['commonStockSharesOutstanding'], errors='coerce').reindex(tabla.index)
+            )
+    return tabla.rename_axis('fecha').reset_index().assign(ticker=ticker)
+
+def _estados_almacen(ticker:str):
+    """
+    Estados de `ticker` desde el almacen columnar si se guardaron hoy; si
+    no, desde EOD (y se guardan para los demás procesos).
+    """
+    almacen = almacen_actual()
+    if almacen is None or fecha_consulta() is not None:
+        return _estados(ticker)
+    nombre = f'fundamentales/{ticker}'
+    escrita = almacen.escrita(nombre)
+    if almacen.contiene(nombre) and escrita is not None and escrita.normalize() == hoy():
+        return almacen.leer(nombre).rename_axis('fecha').reset_index().assign(ticker=ticker)
+    tabla = _estados(ticker)
+    almacen.guardar(nombre, tabla.set_index('fecha').drop(columns='ticker'), tipo='fundamentales', frecuencia='Q')
+    return tabla
+
+def fundamentales_historicos(tickers:list, hilos:int=8):
+    """
+    Estados financieros trimestrales (TTM) de `tickers` en una sola tabla.
+
+    Parameters
+    ----------
+    tickers : list
+        Codigos junto a su exchange.
+    hilos : int, optional
+        Solicitudes simultaneas a EOD. The default is 8.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por (ticker, trimestre) con los campos de los Pasos 1 a 5,
+        'disponible', 'moneda' (de los estados), 'cotizacion' (de los
+        precios) y 'acciones'.
+
+    """
+    def solicitar(ticker):
+        try:
+            return _estados_almacen(ticker)
+        except Exception:
+            print(f"No se pudieron obtener los estados de {ticker}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        tablas = [t for t in ejecutor.map(solicitar, tickers) if t is not None and not t.empty]
+    if not tablas:
+        return pd.DataFrame(columns=['fecha', 'ticker'] + _INGRESOS + _BALANCE + ['disponible', 'moneda', 'cotizacion', 'acciones'])
+    return pd.concat(tablas, ignore_index=True)
+
+def _al(serie:pd.Series, fechas:pd.DatetimeIndex, rezago=pd.Timedelta(0)):
+    """Ultimo valor de `serie` publicado a cada una de las `fechas`."""
+    serie = serie.dropna().sort_index()
+    serie.index = serie.index + rezago
+    return serie.reindex(fechas, method='ffill')
+
+def factores_mercado(fechas:pd.DatetimeIndex):
+    """
+    Insumos de mercado del Paso 2 y del Paso 4 vigentes en cada fecha.
+
+    Returns
+    -------
+    pd.DataFrame
+        r_f, r_e, spread y crecimiento indexados por `fechas`.
+
+    """
+    diario, mensual, trimestral = REZAGOS['diario'], REZAGOS['mensual'], REZAGOS['trimestral']
+    # Bono de gobierno a 10 años de EE.UU. y spread soberano: media de 250 dias
+    r_f_us = _al(serie_macro(TASA_10_US)['value'].dropna().rolling(250).mean(), fechas, diario) / 100
+    spread = _al(serie_macro(SPREAD_SOBERANO)['value'].dropna().rolling(250).mean(), fechas, diario) / 10000
+    exp_inf_cl = _al(serie_macro(EXPECTATIVA_IPC)['value'], fechas, mensual) / 100
+    exp_inf_us = _al(cliente_fred().series('EXPINF1YR').data, fechas, mensual) / 100
+    # retornos mensuales anualizados del IPSA, con la historia conocida en cada fecha
+    ipsa = serie_macro(INDICE_BCCH)['value'].dropna().resample(pd.offsets.MonthEnd()).mean()
+    r_e = _al(ipsa.pct_change().expanding().mean() * 12, fechas, diario)
+    # crecimiento del PIB: mediana de 16 trimestres
+    crecimiento = _al(serie_macro(PIB)['value'].pct_change().rolling(16).median(), fechas, trimestral)
+
+    return pd.DataFrame({
+        'r_f': tasa_libre_riesgo_local(r_f_us, exp_inf_cl, exp_inf_us),
+        'r_e': r_e,
+        'spread': spread,
+        'crecimiento': crecimiento,
+        }, index=fechas)
+
+def betas_historicos(precios:pd.DataFrame, fechas:pd.DatetimeIndex, indice:str=INDICE_EOD, window:int=104):
+    """
+    Beta de Blume de cada ticker con las `window` semanas previas a cada fecha.
+
+    Returns
+    -------
+    pd.DataFrame
+        fechas x ticker.
+
+    """
+    moviles = betas_moviles(rendimientos(precios), indice, window, min_obs=window // 2)['beta']
+    return blume(moviles.reindex(fechas, method='ffill'))
+
+def vigentes(estados:pd.DataFrame, fechas:pd.DatetimeIndex):
+    """
+    El ultimo trimestre publicado a cada una de las `fechas`, para todos los tickers a la vez.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por (ticker, fecha_valor) con las columnas de `estados`.
+
+    """
+    estados = estados.assign(disponible=estados['disponible'].astype('datetime64[ns]'))
+    grilla = pd.MultiIndex.from_product([estados['ticker'].unique(), fechas], names=['ticker', 'fecha_valor'])
+    grilla = grilla.to_frame(index=False).astype({'fecha_valor': 'datetime64[ns]'}).sort_values('fecha_valor')
+    return pd.merge_asof(
+        grilla, estados.sort_values('disponible'),
+        left_on='fecha_valor', right_on='disponible', by='ticker', direction='backward'
+        ).dropna(subset=['disponible'])
+
+def valorizar(estados:pd.DataFrame, factores:pd.DataFrame, betas_:pd.DataFrame, tasa_impuestos:float=0.27):
+    """
+    Pasos 1 a 5 del valorizador para cada (ticker, fecha) de una vez.
+
+    Parameters
+    ----------
+    estados : pd.DataFrame
+        Resultado de `fundamentales_historicos`, en la moneda de los
+        precios (ver `monedas.a_cotizacion`).
+    factores : pd.DataFrame
+        Resultado de `factores_mercado`, indexado por las fechas a valorar.
+    betas_ : pd.DataFrame
+        Resultado de `betas_historicos` (fechas x ticker).
+    tasa_impuestos : float, optional
+        Tasa de impuestos corporativos. The default is 0.27.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por (ticker, fecha) con los insumos y el valor por acción.
+
+    """
+    estados = estados.sort_values(['ticker', 'fecha']).copy()
+    # Paso 1: margen EBITDA promedio de los trimestres conocidos hasta cada uno
+    ebitda = estados['netIncome'] + estados['depreciationAndAmortization'] +\
+        estados['interestExpense'] + estados['incomeTaxExpense']
+    estados['margen'] = (ebitda / estados['totalRevenue']).groupby(estados['ticker']).expanding().mean().droplevel(0)
+    # Paso 3: ROC promedio
+    nopat = estados['ebit'] * (1-tasa_impuestos)
+    capital = (estados['netReceivables'] + estados['inventory'] - estados['accountsPayable']) +\
+        estados['propertyPlantAndEquipmentNet'] + estados['goodWill'] + estados['otherAssets']
+    estados['roc'] = (nopat / capital).groupby(estados['ticker']).expanding().mean().droplevel(0)
+    estados['deuda'] = estados['shortTermDebt'] + estados['longTermDebt']
+    estados['de'] = estados['deuda'] / estados['totalStockholderEquity']
+
+    tabla = vigentes(estados, factores.index)
+    tabla = tabla.join(factores, on='fecha_valor')
+    beta = betas_.stack().rename('beta')
+    beta.index.names = ['fecha_valor', 'ticker']
+    tabla = tabla.join(beta, on=['fecha_valor', 'ticker'])
+
+    # Paso 2
+    tabla['costo_capital'] = costo_capital(tabla['r_f'], tabla['r_e'], tabla['beta'], tabla['de'],
+                                           tabla['spread'], tasa_impuestos)
+    # Paso 3
+    tabla['reinversion'] = tabla['crecimiento'] / tabla['roc']
+    # Paso 4
+    tabla['activos_operativos'] = valor_activos_operativos(
+        tabla['margen'], tabla['totalRevenue'], tabla['crecimiento'], tasa_impuestos,
+        tabla['reinversion'], tabla['costo_capital']
+        )
+    # Paso 5
+    tabla['valor_por_accion'] = valor_por_accion(
+        tabla['activos_operativos'], tabla['cashAndEquivalents'], tabla['otherAssets'], tabla['deuda'],
+        tabla['noncontrollingInterestInConsolidatedEntity'], tabla['acciones']
+        )
+    tabla = tabla.replace([np.inf, -np.inf], np.nan)
+    return tabla.rename(columns={'fecha': 'trimestre'}).set_index(['ticker', 'fecha_valor']).sort_index()
+
+def comparar(valores:pd.DataFrame, cierres:pd.DataFrame, ajustados:pd.DataFrame, horizontes:tuple=(1, 4)):
+    """
+    Valor intrinseco contra el precio de cada fecha y los retornos siguientes.
+
+    Parameters
+    ----------
+    valores : pd.DataFrame
+        Resultado de `valorizar`.
+    cierres, ajustados : pd.DataFrame
+        Precios de cierre y ajustados (fecha x ticker).
+    horizontes : tuple, optional
+        Trimestres hacia adelante para los retornos. The default is (1, 4).
+
+    Returns
+    -------
+    pd.DataFrame
+        valor_por_accion, precio, descuento (valor / precio - 1) y
+        'retorno_<h>t' para cada horizonte.
+
+    """
+    fechas = valores.index.get_level_values('fecha_valor').unique().sort_values()
+    precio = cierres.reindex(fechas, method='ffill')
+    ajustado = ajustados.reindex(fechas, method='ffill')
+    resultado = valores[['trimestre', 'valor_por_accion']].copy()
+    resultado['precio'] = precio.stack().rename_axis(['fecha_valor', 'ticker']).swaplevel().reindex(resultado.index)
+    resultado['descuento'] = resultado['valor_por_accion'] / resultado['precio'] - 1
+    for h in horizontes:
+        retorno = ajustado.shift(-h) / ajustado - 1
+        resultado[f'retorno_{h}t'] = retorno.stack().rename_axis(['fecha_valor', 'ticker']).swaplevel().reindex(resultado.index)
+    return resultado
+
+def efectividad(resultado:pd.DataFrame, horizonte:int=4):
+    """
+    Correlación de rangos (Spearman) entre el descuento y el retorno siguiente, por fecha.
+    """
+    columna = f'retorno_{horizonte}t'
+    datos = resultado[['descuento', columna]].dropna()
+    rangos = datos.groupby(level='fecha_valor').rank()
+    return rangos.groupby(level='fecha_valor').apply(lambda r: r['descuento'].corr(r[columna])).rename('ic')
+
+def backtest(tickers:list, desde:str='2014-01-01', hasta=None, tasa_impuestos:float=0.27, panel_precios:PanelPrecios=None):
+    """
+    Valor intrinseco de `tickers` al cierre de cada trimestre entre `desde` y `hasta`.
+
+    Parameters
+    ----------
+    tickers : list
+        Codigos junto a su exchange.
+    desde : str, optional
+        Primera fecha. The default is '2014-01-01'.
+    hasta : str, optional
+        Ultima fecha. The default is None (hoy).
+    tasa_impuestos : float, optional
+        Tasa de impuestos corporativos. The default is 0.27.
+    panel_precios : PanelPrecios, optional
+        Panel de precios a ocupar. The default is None (el del cache).
+
+    Returns
+    -------
+    pd.DataFrame
+        Resultado de `comparar`, indexado por (ticker, fecha_valor).
+
+    """
+    fechas = pd.date_range(desde, hasta or pd.Timestamp.today(), freq=pd.offsets.QuarterEnd())
+    panel_precios = panel_precios or PanelPrecios.cargar()
+    panel_precios.actualizar(tickers=list(tickers) + [INDICE_EOD, par('USD', 'CLP')])
+    panel_precios.guardar()
+    con_precios = [t for t in tickers if t in panel_precios.tickers]
+
+    # estados a la moneda de los precios de cada ticker, con el tipo de cambio de cada trimestre
+    estados = fundamentales_historicos(con_precios)
+    estados = a_cotizacion(estados, _INGRESOS + _BALANCE, panel_precios, fecha='fecha')
+    factores = factores_mercado(fechas)
+    betas_ = betas_historicos(panel_precios.precios(con_precios + [INDICE_EOD]), fechas)
+    valores = valorizar(estados, factores, betas_, tasa_impuestos)
+    return comparar(valores, panel_precios.precios(con_precios, 'close'), panel_precios.precios(con_precios))
+
+def main(argumentos:list=None):
+    parser = argparse.ArgumentParser(description='Backtest trimestral del valor intrinseco del valorizador')
+    parser.add_argument('tickers', nargs='*', help='codigos junto a su exchange (SQM-B.SN ...)')
+    parser.add_argument('--exchange', help='valorizar todas las acciones del exchange (SN ...)')
+    parser.add_argument('--desde', default='2014-01-01')
+    parser.add_argument('--hasta', default=None)
+    parser.add_argument('--salida', default=None, help="CSV de salida (por defecto 'valor_historico.csv' del cache)")
+    argumentos = parser.parse_args(argumentos)
+
+    tickers = list(argumentos.tickers)
+    if argumentos.exchange:
+        simbolos = pd.DataFrame(cliente_eod().get_exchange_symbols(exchange=argumentos.exchange))
+        simbolos = simbolos[simbolos['Type'] == 'Common Stock'] if 'Type' in simbolos else simbolos
+        tickers += [f"{codigo}.{argumentos.exchange}" for codigo in simbolos['Code']]
+    if not tickers:
+        parser.error('indique tickers o --exchange')
+
+    resultado = backtest(tickers, argumentos.desde, argumentos.hasta)
+    salida = argumentos.salida or os.path.join(directorio_cache(), 'valor_historico.csv')
+    resultado.to_csv(salida)
+    print(efectividad(resultado).describe())
+    print(f"Resultados en {salida}")
+
+if __name__ == '__main__':
+    main()
@@ -7,23 +7,35 @@ Created on Mon Nov 28 17:11:42 2022
 
 import os
 
-# Cargar mis claves para las APIs desde las variables de entorno.
-bcch_user = os.environ['BCCH_USER']
-bcch_pwd = os.environ['BCCH_PWD']
-api_key = os.environ['API_EOD']
-
-from bcch import BancoCentralDeChile
-from eod import EodHistoricalData
+# Cargar mi clave para la API de fundamentales masivos desde las variables de entorno.
+api_key = os.environ.get('API_EOD') # no se necesita al fijar una fecha de consulta
+
+from clientes import cliente_eod, cliente_fred
+from datos import serie_macro
+from frecuencias import serie_frecuencia
+from ventanas import AlmacenVentanas, MediaMovil
+from precios import PanelPrecios
+from instantaneas import capturar
+from betas import rendimientos, betas
+from pares import IndicePares
+from monedas import TablaCambios
+import multiplos_sectoriales
+from peg import peg
+from calculos import normalizar_fundamentales,\
+    porcentaje_accion, margen_ebitda, tasa_libre_riesgo_local, costo_capital, retorno_capital,\
+    valor_activos_operativos, valor_por_accion
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import warnings
 import requests
 warnings.filterwarnings('ignore')
 
 # Creación de las instancias
-client = EodHistoricalData(api_key)
-client_bcch = BancoCentralDeChile(bcch_user, bcch_pwd)
+client = cliente_eod()
+# Estados financieros TTM de ejecuciones anteriores
+almacen_ttm = AlmacenVentanas.cargar()
+# Precios diarios de ejecuciones anteriores (se actualizan con la API bulk)
+panel_precios = PanelPrecios.cargar()
 
 """
 Empresas a valorar en el articulo
@@ -37,6 +49,9 @@ Empresas a valorar en el articulo
 # Datos referenciales para todo el script
 stock = 'SQM-B.SN'
 indice_mercado = 'F013.IBC.IND.N.7.LAC.CL.CLP.BLO.D' # IPSA
+# beta estimado con los precios semanales contra el IPSA (2 años, ajuste de Blume)
+# en vez del Technicals::Beta de EOD
+beta_local = True
 tasa_impuestos = 0.27
 exchange = stock[stock.index('.'):][1:] # extraer el exchange de la accion
 
@@ -58,122 +73,30 @@ def fundamental_caller(stock_ticker:str, filter_:str, delete_extras:bool=True, r
     temp_ : pd.DataFrame
         Datos financieros fundamentales para la acción en una base TTM.
     """
-    # solcitar los datos
-    temp_ = pd.DataFrame(
-        client.get_fundamental_equity(
-            stock_ticker, 
-            filter_=filter_
-            )
-        ).T[::-1]
-    
-    # borrar la moneda de la accion
-    if delete_extras:
-        temp_.drop('currency_symbol', axis=1, inplace=True)
-        # borrar la fecha de subida del informe
-        temp_.drop('filing_date', axis=1, inplace=True)
-        
-    # hacer del index la fecha
-    temp_['date'] = pd.to_datetime(temp_['date'])
-    temp_.set_index('date', inplace=True)
-    
-    # Todos los datos a numerico
-    temp_ = temp_.apply(pd.to_numeric, errors='ignore')
-    
-    # calcular en base a TTM
-    temp_ = temp_.rolling(window=4, min_periods=4).sum()
-    
-    if resample_:
-        temp_ = temp_.resample('Y').sum()
-    
-    return temp_
-
-def price_normalizer(data:dict, columna_tiempo:str='date'):
-    """
-    Normalizar los datos de precios para el instrumento solicitado
-    Parameters
-    ----------
-    data : dict
-        Precios del instrumento en base OHLCV.
-    columna_tiempo : str, optional
-        Nombre de columna de tiempo. The default is 'date'.
-    Returns
-    -------
-    data : pd.Series
-        Datos normalizados.
-    """
-    data = pd.DataFrame(data)
-    # transformar a tiempo
-    data[columna_tiempo] = pd.to_datetime(data[columna_tiempo])
-    # incorporarlo como indice
-    data.set_index(columna_tiempo, inplace=True)
-    return data
-
-def valor_pte_flujos(flujos_proyectados:list, periodos:int, tasa_dcto:float):
-    """
-    Calculo del valor presente de una serie de datos
-    Parameters
-    ----------
-    flujos_proyectados : list
-        Flujos de caja libre proyectados para la accion.
-    periodos : int
-        Numero de años a proyectar el flujo de caja.
-    Returns
-    -------
-    TYPE float
-        Suma del valor presente de los flujos de caja proyectados.
-    """
-    ffc_proyectados = [ flujos_proyectados[i-1]/( (1+tasa_dcto)**i ) for i in range(1, periodos) ]
-    return sum(ffc_proyectados)
+    return normalizar_fundamentales(
+        client.get_fundamental_equity(stock_ticker, filter_=filter_),
+        delete_extras=delete_extras,
+        resample_=resample_,
+        almacen=almacen_ttm,
+        clave=f"{stock_ticker}|{filter_}"
+        )
 
-def porcentaje_accion(ref1, ref2):
-    return round(((ref1 - ref2) / ref2)*100, 2)
-
-def cleaner_macro_valorizacion(serie:str, resam:str=None, operations:list=None):
-    """
-    Limpiar la serie proveniente del la APIy dejarla lista para ocupar
-    Parameters
-    ----------
-    serie : str
-        id de la serie macro a solicitar.
-    resam : str
-        frecuencia para el resampling.
-    operation : list
-        operación(es) para agregar los datos resampliandos.
-    Returns
-    -------
-    pandas DataFrame
-        serie lista para ocupar.
-    """
-    serie_ = pd.DataFrame(client_bcch.get_macro(serie=serie))
-    serie_['value'] = pd.to_numeric(serie_['value'], errors='coerce')
-    serie_['indexDateString'] = pd.to_datetime(serie_['indexDateString'], format='%d-%m-%Y')
-    serie_.set_index('indexDateString', inplace=True)
-    del serie_['statusCode']
-    
-    if resam is not None:
-        if operations is not None:
-            serie_ = serie_.resample(resam).agg(operations)
-            # renombrar las columnas
-            serie_.columns = ['_'.join(x) for x in serie_.columns]
-            return serie_
-        else:
-            print('Ocupar ')
-    else:
-        return serie_
-    
 def bulk_fundamental(market:str, offset:int, api_token:str=api_key, limit:int=500, timeout_:int=300):
     params = {
         'api_token':api_token,
         'fmt':'json',
         'limit': limit,
         'offset': offset}
-    resp_ = requests.get(url=f"http://eodhistoricaldata.com/api/bulk-fundamentals/{market}",
-                         params=params,
-                         timeout=timeout_)
-    if resp_.status_code == 200:
-        return resp_.json()
-    else:
-        resp_.raise_for_status()
+    def solicitar():
+        resp_ = requests.get(url=f"http://eodhistoricaldata.com/api/bulk-fundamentals/{market}",
+                             params=params,
+                             timeout=timeout_)
+        if resp_.status_code == 200:
+            return resp_.json()
+        else:
+            resp_.raise_for_status()
+    # cada pagina queda como instantánea (sin la clave de la API)
+    return capturar(f'eod/bulk-fundamentals/{market}/limit={limit}/offset={offset}', solicitar)
         
 #%% Datos financieros fundamentales para los calculos
 
@@ -186,6 +109,8 @@ inc_ = fundamental_caller(stock, filter_='Financials::Income_Statement::quarterl
 cf_ = fundamental_caller(stock, filter_='Financials::Cash_Flow::quarterly').fillna(0)
 # Balance. Debe ser dividido por 4, debido a que ya estan anualizado
 bs_ = fundamental_caller(stock, filter_='Financials::Balance_Sheet::quarterly').fillna(0) / 4
+# guardar los TTM para la proxima ejecucion
+almacen_ttm.guardar()
 
 # Solicitar los datos iniciales para el exchange
 market_fundamentals = bulk_fundamental(market=exchange, offset=0)
@@ -203,90 +128,73 @@ stock_op_margin = stock_fundamentals['Highlights']['OperatingMarginTTM']
 # Industria de la acción
 stock_industry = stock_fundamentals['General']['Sector']
 
+# Distribución de los multiplos de las empresas en pesos chilenos, ordenada
+# por sector y para todo el mercado
+pares = IndicePares.desde_bulk(market_fundamentals, moneda='CLP')
+pares.guardar()
 # Caso industry
-industry_roe = []
-industry_pb = []
-industry_pe = []
-industry_forward_pe = []
-industry_ps = []
-industry_ev_ebitda = []
-industry_yield = []
-industry_peg = []
-industry_op_margin = []
-
+industry_pe = pares.valores('pe', stock_industry)
+industry_ps = pares.valores('ps', stock_industry)
 # Caso mercado
-mercado_roe = []
-mercado_pb = []
-mercado_pe = []
-mercado_forward_pe = []
-mercado_ps = []
-mercado_ev_ebitda = []
-mercado_yield = []
-mercado_peg = []
-mercado_op_margin = []
-
-# iterar por cada accion para extraer los datos fundamentales del MERCADO
-for stock_, _ in market_fundamentals.items():
-    # Solo extraer compañias denominadas en pesos chilenos
-    if market_fundamentals[stock_]['General']['CurrencyCode'] == 'CLP':
-        mercado_roe.append(market_fundamentals[stock_]['Highlights']['ReturnOnEquityTTM'])
-        mercado_pb.append(market_fundamentals[stock_]['Valuation']['PriceBookMRQ'])
-        mercado_pe.append(market_fundamentals[stock_]['Valuation']['TrailingPE'])
-        mercado_forward_pe.append(market_fundamentals[stock_]['Valuation']['ForwardPE'])
-        mercado_ps.append(market_fundamentals[stock_]['Valuation']['PriceSalesTTM'])
-        mercado_ev_ebitda.append(market_fundamentals[stock_]['Valuation']['EnterpriseValueEbitda'])
-        mercado_yield.append(market_fundamentals[stock_]['Highlights']['DividendYield'])
-        mercado_peg.append(market_fundamentals[stock_]['Highlights']['PEGRatio'])
-        mercado_op_margin.append(market_fundamentals[stock_]['Highlights']['OperatingMarginTTM'])
-        
-# iterar por cada accion para extraer los datos fundamentales de la INDUSTRIA
-for stock_, _ in market_fundamentals.items():
-    # Solo extraer compañias denominadas en pesos chilenos
-    if market_fundamentals[stock_]['General']['CurrencyCode'] == 'CLP':
-        if market_fundamentals[stock_]['General']['Sector'] == stock_industry:
-            industry_roe.append(market_fundamentals[stock_]['Highlights']['ReturnOnEquityTTM'])
-            industry_pb.append(market_fundamentals[stock_]['Valuation']['PriceBookMRQ'])
-            industry_pe.append(market_fundamentals[stock_]['Valuation']['TrailingPE'])
-            industry_forward_pe.append(market_fundamentals[stock_]['Valuation']['ForwardPE'])
-            industry_ps.append(market_fundamentals[stock_]['Valuation']['PriceSalesTTM'])
-            industry_ev_ebitda.append(market_fundamentals[stock_]['Valuation']['EnterpriseValueEbitda'])
-            industry_yield.append(market_fundamentals[stock_]['Highlights']['DividendYield'])
-            industry_peg.append(market_fundamentals[stock_]['Highlights']['PEGRatio'])
-            industry_op_margin.append(market_fundamentals[stock_]['Highlights']['OperatingMarginTTM'])
-            
-        
-precios_indice_mercado = cleaner_macro_valorizacion(indice_mercado).dropna()
+mercado_pb = pares.valores('pb')
+
+# percentil de la acción en cada multiplo frente a su sector
+posicion_sector = pd.DataFrame({
+    multiplo: pares.posicion(multiplo, valor, stock_industry)
+    for multiplo, valor in {
+        'pe': stock_pe, 'forward_pe': stock_forward_pe, 'pb': stock_pb, 'ps': stock_ps,
+        'ev_ebitda': stock_ev_ebitda, 'yield': stock_yield, 'peg': stock_peg,
+        'op_margin': stock_op_margin, 'roe': stock_roe,
+        }.items() if valor is not None
+    }).T
+print(posicion_sector)
+
+# el sector frente a su propia historia (si ya se calculó con multiplos_sectoriales.py)
+historia_sectorial = multiplos_sectoriales.cargar()
+if historia_sectorial is not None and stock_industry in historia_sectorial.index.get_level_values('sector'):
+    print(pd.DataFrame({
+        multiplo: multiplos_sectoriales.frente_a_historia(historia_sectorial, stock_industry, multiplo)
+        for multiplo in multiplos_sectoriales.MULTIPLOS
+        }).T)
+
+# promedio mensual del indice (remuestreo memorizado)
+precios_indice_mercado = serie_frecuencia(indice_mercado, pd.offsets.MonthEnd(), 'mean')
 
 #%% Paso 1: margenes operacionales antes de impuestos (EBITDA margin)
 
-ebitda = inc_['netIncome'] + inc_['depreciationAndAmortization'] +\
-    inc_['interestExpense'] + inc_['incomeTaxExpense']
-
-ebitda_margin = (ebitda / inc_['totalRevenue']).mean()
+ebitda_margin = margen_ebitda(inc_)
 
 #%% Paso 2: Estimar la tasa de costo de capital
-import fredpy as fp
-fp.api_key = os.environ['API_FRED']
+fp = cliente_fred()
+
+# precios de la accion, el IPSA y el dolar al dia (solo los dias faltantes)
+panel_precios.actualizar(tickers=[stock, 'SPIPSA.INDX', 'USDCLP.FOREX'])
+panel_precios.guardar()
 
 beta_estadistico = stock_fundamentals['Technicals']['Beta']
+# sin precios de la accion o del indice en el panel queda el beta de EOD
+if beta_local and {stock, 'SPIPSA.INDX'} <= set(panel_precios.tickers):
+    beta_ = betas(
+        rendimientos(panel_precios.precios([stock, 'SPIPSA.INDX'])),
+        'SPIPSA.INDX', window=104, ajuste='blume'
+        )['beta_ajustado'].get(stock, np.nan)
+    # sin precios suficientes tambien
+    if pd.notna(beta_):
+        beta_estadistico = float(beta_)
 # retornos mensuales anualizados
 r_e = float(
-    precios_indice_mercado.resample('M').mean().pct_change().dropna().mean().values * 12
+    precios_indice_mercado.pct_change().dropna().mean().values * 12
     )
 # Bono de gobierno a 10 años - EE.UU. | Dias de trading 250
-r_f_us = float(cleaner_macro_valorizacion('F019.TBG.TAS.10.D').dropna().rolling(window=250).mean().iloc[-1]) / 100
+r_f_us = almacen_ttm.ultimo('F019.TBG.TAS.10.D', serie_macro('F019.TBG.TAS.10.D').dropna(), MediaMovil(250)) / 100
 # Expectativas de inflación en 11 meses (variación 12 meses, mediana)
-exp_inf_cl = float(cleaner_macro_valorizacion('F089.IPC.V12.14.M').iloc[-1]) / 100
+exp_inf_cl = float(serie_macro('F089.IPC.V12.14.M').iloc[-1]) / 100
 # 1-Year Expected Inflation -> https://fred.stlouisfed.org/series/EXPINF1YR
 exp_inf_us = float(fp.series('EXPINF1YR').data.iloc[-1]) / 100
 
 # Tasa libre de riesgo local transformada
 # pagina 159 libro damodoran
-r_f = ((1+r_f_us) * ((1+exp_inf_cl) / (1+exp_inf_us))) - 1
-
-equity_risk_premium = r_e - r_f
-
-cost_of_equity = r_f + beta_estadistico * equity_risk_premium
+r_f = tasa_libre_riesgo_local(r_f_us, exp_inf_cl, exp_inf_us)
 
 total_debt = (bs_['shortTermDebt'] + bs_['longTermDebt'])[-1]
 total_equity_ = bs_['totalStockholderEquity'][-1]
@@ -294,33 +202,30 @@ de = total_debt / total_equity_
 
 # Calculado el costo de capital para la firma
 # Spread EMBI Chile (promedio, puntos base)
-spread_chile = float(cleaner_macro_valorizacion('F019.SPS.PBP.91.D').dropna().rolling(window=250).mean().iloc[-1]) / 10000
-cost_of_debt = r_f + spread_chile
-cost_of_capital = cost_of_equity * (1 - de) + cost_of_debt * (1-tasa_impuestos) * de
+spread_chile = almacen_ttm.ultimo('F019.SPS.PBP.91.D', serie_macro('F019.SPS.PBP.91.D').dropna(), MediaMovil(250)) / 10000
+# medias moviles al dia para la proxima ejecucion
+almacen_ttm.guardar()
+cost_of_capital = costo_capital(r_f, r_e, beta_estadistico, de, spread_chile, tasa_impuestos)
 
 #%% Paso 3: Estimar la tasa de reinversión
 # Calculando el ROC
 # https://www.youtube.com/watch?v=c5iigcEppZw&t=82s
 # https://research-doc.credit-suisse.com/docView?language=ENG&format=PDF&sourceid=csplusresearchcp&document_id=806230540&serialid=dBve3cH%2BHSFm1zoXnWVgkwZUHD2g0c1RqyUyHTE3o%2BM%3D&cspId=null
-nopat = inc_['ebit'] * (1-tasa_impuestos)
-invested_capital = (bs_['netReceivables'] + bs_['inventory'] - bs_['accountsPayable']) +\
-    bs_['propertyPlantAndEquipmentNet'] + bs_['goodWill'] + bs_['otherAssets']
-    
-roc = np.mean(nopat / invested_capital)
+roc = retorno_capital(inc_, bs_, tasa_impuestos)
 
 # Tasa de crecimiento perpetuo
 # PIB, volumen a precios del año anterior encadenado, referencia 2018 (miles de millones de pesos encadenados)
 pib_ = float(
-    cleaner_macro_valorizacion('F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T').pct_change().rolling(window=16).median().iloc[-1].values
+    serie_macro('F032.PIB.FLU.R.CLP.EP18.Z.Z.0.T').pct_change().rolling(window=16).median().iloc[-1].values
     )
 
 reinvested_rate = pib_ / roc
 
 #%% Paso 4: calcular el valor de los activos operativos
 # Calcular la proyeccion de ingresos operacionales normalizados 
-normalized_op_income = ebitda_margin * inc_['totalRevenue'][-1]
-
-value_op_assets = (normalized_op_income * (1+pib_)*(1-tasa_impuestos)*(1-reinvested_rate)) / (cost_of_capital - pib_)
+value_op_assets = valor_activos_operativos(
+    ebitda_margin, inc_['totalRevenue'][-1], pib_, tasa_impuestos, reinvested_rate, cost_of_capital
+    )
 
 #%% Paso 5: Valor por accion
 
@@ -341,25 +246,20 @@ non_op_assets = bs_['otherAssets'][-1]
 # https://www.investopedia.com/terms/n/noncontrolling_interest.asp#:~:text=Key%20Takeaways-,A%20non%2Dcontrolling%20interest%2C%20also%20known%20as%20a%20minority%20interest,decisions%20or%20votes%20by%20themselves.
 minority_interest = bs_['noncontrollingInterestInConsolidatedEntity'][-1]
 
-value_per_share = (value_op_assets + cash + non_op_assets - total_debt - minority_interest) / available_shares
+value_per_share = valor_por_accion(value_op_assets, cash, non_op_assets, total_debt, minority_interest, available_shares)
 
-# Transformando a CLP si es que el balance está en dolares
-if stock_fundamentals['Financials']['Income_Statement']['currency_symbol'] == 'USD':
-    # solicitar datos del tipo de cambio oficial -> Promedio mensual movil
-    usdclp = price_normalizer(
-        client.get_prices_eod('USDCLP.FOREX')
-        ).close.rolling(
-            window=20
-            ).median()[-1]
-    value_per_share_clp = usdclp * value_per_share
+# Transformando a CLP si es que el balance está en otra moneda (dolares)
+moneda_estados = stock_fundamentals['Financials']['Income_Statement']['currency_symbol']
+if moneda_estados != 'CLP':
+    # tipo de cambio del panel de precios -> mediana movil de 20 dias
+    cambios = TablaCambios(panel_precios, destino='CLP', monedas=[moneda_estados])
+    value_per_share_clp = cambios.tasa(moneda_estados) * value_per_share
 
 #%% Tests
 
-precio_mercado_accion = price_normalizer(
-    client.get_prices_eod(stock)
-    ).close.iloc[-1]
+precio_mercado_accion = panel_precios.ultimo(stock)
 
-if stock_fundamentals['Financials']['Income_Statement']['currency_symbol'] == 'USD':
+if moneda_estados != 'CLP':
     if value_per_share_clp > precio_mercado_accion:
         print(f"{stock_fundamentals['General']['Name']} cotiza por DEBAJO de la estimación de valor ({porcentaje_accion(value_per_share_clp, precio_mercado_accion)}%)")
     else:
@@ -461,11 +361,11 @@ elif precio_mercado_accion < valor_instrinsico * 0.8:
 fig, ax = plt.subplots(figsize=(10, 5))
 ax.hist(industry_pe, bins=21, color='dimgray')
 ax.axvline(x=stock_pe, color='navy', linestyle='solid', linewidth=5)
-ax.axvline(x=np.median(industry_pe), color='gold', linestyle='solid', linewidth=5)
+ax.axvline(x=pares.mediana('pe', stock_industry), color='gold', linestyle='solid', linewidth=5)
 # Subvalorado
-ax.axvspan(np.min(industry_pe), np.median(industry_pe)*0.99, alpha=0.5, color='forestgreen')
+ax.axvspan(pares.minimo('pe', stock_industry), pares.mediana('pe', stock_industry)*0.99, alpha=0.5, color='forestgreen')
 # Sobrevalorado
-ax.axvspan(np.median(industry_pe)*1.01, np.max(industry_pe), alpha=0.5, color='darkred')
+ax.axvspan(pares.mediana('pe', stock_industry)*1.01, pares.maximo('pe', stock_industry), alpha=0.5, color='darkred')
 
 fig.suptitle("Relación precio-beneficio (PE) vs el Sector", fontweight='bold')
 plt.title(f"¿Cómo se compara el PE de {stock[:stock.index('.')]} vs con otras empresas del sector {stock_industry}?")
@@ -495,11 +395,11 @@ plt.show()
 fig, ax = plt.subplots(figsize=(10, 5))
 ax.hist(mercado_pb, bins=21, color='dimgray')
 ax.axvline(x=stock_pb, color='navy', linestyle='solid', linewidth=5)
-ax.axvline(x=np.median(mercado_pb), color='gold', linestyle='solid', linewidth=5)
+ax.axvline(x=pares.mediana('pb'), color='gold', linestyle='solid', linewidth=5)
 # Subvalorado
-ax.axvspan(np.min(mercado_pb), np.median(mercado_pb)*0.99, alpha=0.5, color='forestgreen')
+ax.axvspan(pares.minimo('pb'), pares.mediana('pb')*0.99, alpha=0.5, color='forestgreen')
 # Sobrevalorado
-ax.axvspan(np.median(mercado_pb)*1.01, np.max(mercado_pb), alpha=0.5, color='darkred')
+ax.axvspan(pares.mediana('pb')*1.01, pares.maximo('pb'), alpha=0.5, color='darkred')
 
 fig.suptitle("Relación precio-valor contable (PB) vs el Sector ", fontweight='bold')
 plt.title(f"¿Cómo se compara el PB de {stock[:stock.index('.')]} vs con otras empresas del sector {stock_industry}?")
@@ -528,11 +428,11 @@ plt.show()
 fig, ax = plt.subplots(figsize=(10, 5))
 ax.hist(industry_ps, bins=21, color='dimgray')
 ax.axvline(x=stock_ps, color='navy', linestyle='solid', linewidth=5)
-ax.axvline(x=np.median(industry_ps), color='gold', linestyle='solid', linewidth=5)
+ax.axvline(x=pares.mediana('ps', stock_industry), color='gold', linestyle='solid', linewidth=5)
 # Subvalorado
-ax.axvspan(np.min(industry_ps), np.median(industry_ps)*0.99, alpha=0.5, color='forestgreen')
+ax.axvspan(pares.minimo('ps', stock_industry), pares.mediana('ps', stock_industry)*0.99, alpha=0.5, color='forestgreen')
 # Sobrevalorado
-ax.axvspan(np.median(industry_ps)*1.01, np.max(industry_ps), alpha=0.5, color='darkred')
+ax.axvspan(pares.mediana('ps', stock_industry)*1.01, pares.maximo('ps', stock_industry), alpha=0.5, color='darkred')
 
 fig.suptitle("Relación precio/ventas (PS) vs el Sector", fontweight='bold')
 plt.title(f"¿Cómo se compara el PS de {stock[:stock.index('.')]} vs con otras empresas del sector {stock_industry}?")
@@ -680,23 +580,13 @@ def gauge(labels=['BAJO','MEDIO','ALTO','MUY ALTO','EXTREMO'], \
              color='black',
              bbox=dict(facecolor='tab:gray', alpha=0.5))
     
-try:
-    # https://www.investopedia.com/ask/answers/06/pegratioearningsgrowthrate.asp#:~:text=The%20price%2Fearnings%20to%20growth,by%20its%20percentage%20growth%20rate.
-    # Eliminar los datos iniciales del TTM y luego calcular el promedio movil de 4 periodos (anual)
-    eps_growth = inc_.drop(inc_[inc_.netIncome == 0].index).netIncome.pct_change().rolling(window=4).mean()[-1]
-    peg = stock_pe / (eps_growth*100)
-    # considerar la categoria del peg
-    if peg > 0 and peg < 0.5:
-        arrow_ = 1
-    elif peg >= 0.5 and peg < 1:
-        arrow_ = 2
-    elif peg >= 1 and peg < 1.5:
-        arrow_ = 3
-    elif peg >= 1.5:
-        arrow_ = 4
+# https://www.investopedia.com/ask/answers/06/pegratioearningsgrowthrate.asp#:~:text=The%20price%2Fearnings%20to%20growth,by%20its%20percentage%20growth%20rate.
+# crecimiento anual (promedio movil de 4 trimestres) de las utilidades sin los trimestres en cero
+tabla_peg = peg(inc_[['netIncome']].rename(columns={'netIncome': stock}), pd.Series({stock: stock_pe}))
+arrow_ = tabla_peg.at[stock, 'categoria']
+if arrow_ > 0:
     # graficar 
     gauge(labels=['BAJO','MEDIO','ALTO','EXTREMO'], \
       colors=['#007A00','#0063BF','#FFCC00','#ED1C24'], arrow=arrow_, title=f"Ratio PEG para {stock[:stock.index('.')]}") 
-
-except:
-    print("No se pudo calcular el PEG")
\ No newline at end of file
+else:
+    print("No se pudo calcular el PEG (utilidades o crecimiento negativos)")
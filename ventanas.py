@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+Ventanas moviles (TTM) que se actualizan con los datos nuevos.
+
+`AlmacenVentanas` guarda por serie los ultimos `window` datos y la
+historia ya acumulada, de modo que al publicarse un nuevo mes o trimestre
+solo se calcula la ventana de ese periodo, en vez de repetir el
+`rolling(window)` sobre toda la historia. Junto al estado se guarda el
+numero de filas incorporadas y una huella de las ultimas `2 * window`:
+si el Banco Central o EOD revisan un dato de esa cola (o cambia el numero
+de periodos anteriores), la serie se recalcula completa. Así cada
+actualización cuesta O(window); una revisión más antigua que la cola no
+se detecta.
+
+Para las series diarias largas, de las que solo interesa el ultimo valor
+(la media de 250 dias de la tasa a 10 años, la EWM del spread, la media
+mensual del IPSA), los agregadores `MediaMovil`, `MedianaMovil`,
+`MediaExponencial` y `MediaMensual` se actualizan dato a dato y entregan
+su valor actual en O(1). `AlmacenVentanas.agregado` los guarda entre
+ejecuciones y solo les pasa las observaciones nuevas.
+
+@author: lauta
+"""
+
+import os
+import math
+import pickle
+import hashlib
+from bisect import insort, bisect_left
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from clientes import directorio_cache, temporal, candado_archivo
+
+
+_OPERACIONES = {
+    'sum': lambda x: np.sum(x, axis=0),
+    'mean': lambda x: np.mean(x, axis=0),
+    'median': lambda x: np.median(x, axis=0),
+    }
+
+class VentanaMovil:
+    """
+    Ultimos `window` datos de una o varias columnas y su agregado.
+
+    Igual que `rolling(window)` de pandas, el resultado es NaN mientras la
+    ventana no esté completa o si contiene algun dato faltante.
+
+    Parameters
+    ----------
+    window : int
+        Numero de periodos de la ventana.
+    operacion : str, optional
+        'sum', 'mean' o 'median'. The default is 'sum'.
+
+    """
+
+    def __init__(self, window:int, operacion:str='sum'):
+        if operacion not in _OPERACIONES:
+            raise ValueError(f"Los unicos valores validos para la operacion son {list(_OPERACIONES)}")
+        self.window = window
+        self.operacion = operacion
+        self.valores = deque(maxlen=window)
+
+    @property
+    def valor(self):
+        """Agregado de la ventana actual."""
+        if len(self.valores) < self.window:
+            return np.full(np.shape(self.valores[-1]) if self.valores else (), np.nan)
+        return _OPERACIONES[self.operacion](np.asarray(self.valores, dtype=float))
+
+    def agregar(self, valor):
+        """
+        Incorporar un periodo y devolver el agregado de la ventana.
+
+        Parameters
+        ----------
+        valor : float | np.ndarray
+            Dato nuevo (uno por columna).
+
+        Returns
+        -------
+        float | np.ndarray
+            Agregado de los ultimos `window` periodos.
+
+        """
+        self.valores.append(np.asarray(valor, dtype=float))
+        return self.valor
+
+class _Agregador:
+    """
+    Agregado de una serie que se actualiza con cada observación nueva.
+
+    Guarda la fecha y el valor de la ultima observación para detectar
+    revisiones de los datos ya incorporados.
+    """
+
+    def __init__(self):
+        self.fecha = None
+        self.ultimo_dato = None
+
+    def llave(self):
+        """Tipo y parametros del agregador, para guardarlo en el almacen."""
+        return (type(self).__name__,) + self._parametros()
+
+    def _parametros(self):
+        return ()
+
+    def actualizar(self, serie_:pd.Series):
+        """
+        Incorporar las observaciones de `serie_` (ordenadas por fecha).
+
+        Returns
+        -------
+        float
+            Valor actual del agregado.
+
+        """
+        for fecha, valor in zip(serie_.index, serie_.to_numpy(dtype=float)):
+            self._agregar(fecha, valor)
+        if len(serie_):
+            self.fecha, self.ultimo_dato = serie_.index[-1], float(serie_.iloc[-1])
+        return self.valor
+
+    def vigente(self, serie_:pd.Series):
+        """La serie contiene la ultima observación incorporada, sin cambios?"""
+        if self.fecha is None or not serie_.index.is_monotonic_increasing:
+            return False
+        # busqueda binaria, sin armar la tabla hash del indice completo
+        posicion = serie_.index.searchsorted(self.fecha)
+        if posicion >= len(serie_) or serie_.index[posicion] != self.fecha:
+            return False
+        if posicion + 1 < len(serie_) and serie_.index[posicion + 1] == self.fecha:
+            return False
+        actual = float(serie_.iloc[posicion])
+        return (math.isnan(actual) and math.isnan(self.ultimo_dato)) or math.isclose(actual, self.ultimo_dato)
+
+class MediaMovil(_Agregador):
+    """
+    Media de los ultimos `window` datos, como `rolling(window).mean()`.
+
+    Es NaN mientras la ventana no esté completa o si contiene un NaN.
+    """
+
+    def __init__(self, window:int):
+        super().__init__()
+        self.window = window
+        self.valores = deque()
+        self.suma = 0.0
+        self.nulos = 0
+        self.pasos = 0
+
+    def _parametros(self):
+        return (self.window,)
+
+    def _agregar(self, fecha, valor):
+        self.valores.append(valor)
+        if math.isnan(valor):
+            self.nulos += 1
+        else:
+            self.suma += valor
+        if len(self.valores) > self.window:
+            saliente = self.valores.popleft()
+            if math.isnan(saliente):
+                self.nulos -= 1
+            else:
+                self.suma -= saliente
+        self.pasos += 1
+        if self.pasos % (10 * self.window) == 0:
+            # recalcular de vez en cuando para que no se acumule error de redondeo
+            self.suma = math.fsum(v for v in self.valores if not math.isnan(v))
+
+    @property
+    def valor(self):
+        if self.nulos or len(self.valores) < self.window:
+            return np.nan
+        return self.suma / self.window
+
+class MedianaMovil(_Agregador):
+    """
+    Mediana de los ultimos `window` datos, como `rolling(window).median()`.
+    """
+
+    def __init__(self, window:int):
+        super().__init__()
+        self.window = window
+        self.valores = deque()
+        self.ordenados = []
+        self.nulos = 0
+
+    def _parametros(self):
+        return (self.window,)
+
+    def _agregar(self, fecha, valor):
+        self.valores.append(valor)
+        if math.isnan(valor):
+            self.nulos += 1
+        else:
+            insort(self.ordenados, valor)
+        if len(self.valores) > self.window:
+            saliente = self.valores.popleft()
+            if math.isnan(saliente):
+                self.nulos -= 1
+            else:
+                del self.ordenados[bisect_left(self.ordenados, saliente)]
+
+    @property
+    def valor(self):
+        if self.nulos or len(self.valores) < self.window:
+            return np.nan
+        mitad = self.window // 2
+        if self.window % 2:
+            return self.ordenados[mitad]
+        return (self.ordenados[mitad - 1] + self.ordenados[mitad]) / 2
+
+class MediaExponencial(_Agregador):
+    """
+    Media exponencial, como `ewm(span=span).mean()` (adjust=True).
+
+    Los NaN no se incorporan pero hacen decaer el peso de los datos
+    anteriores, igual que pandas con ignore_na=False.
+    """
+
+    def __init__(self, span:float):
+        super().__init__()
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.numerador = 0.0
+        self.denominador = 0.0
+
+    def _parametros(self):
+        return (self.span,)
+
+    def _agregar(self, fecha, valor):
+        decaimiento = 1 - self.alpha
+        self.numerador *= decaimiento
+        self.denominador *= decaimiento
+        if not math.isnan(valor):
+            self.numerador += valor
+            self.denominador += 1
+
+    @property
+    def valor(self):
+        return self.numerador / self.denominador if self.denominador else np.nan
+
+class MediaMensual(_Agregador):
+    """
+    Media de cada mes, como `resample('M').mean()`.
+
+    `valor` es la media del ultimo mes (posiblemente incompleto) y
+    `medias` la serie de medias mensuales.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.meses = {}
+        self.mes = None
+        self.suma = 0.0
+        self.n = 0
+
+    def _agregar(self, fecha, valor):
+        mes = pd.Timestamp(fecha).to_period('M')
+        if mes != self.mes:
+            self.mes, self.suma, self.n = mes, 0.0, 0
+        if not math.isnan(valor):
+            self.suma += valor
+            self.n += 1
+        self.meses[mes] = self.suma / self.n if self.n else np.nan
+
+    @property
+    def valor(self):
+        return self.meses[self.mes] if self.mes is not None else np.nan
+
+    @property
+    def medias(self):
+        """Media de cada mes, indexada al cierre del mes."""
+        medias = pd.Series(self.meses, dtype=float).sort_index()
+        medias.index = medias.index.to_timestamp(how='end').normalize()
+        return medias
+
+def _huella(serie_:pd.DataFrame):
+    """Hash de las fechas y valores de un tramo de la serie."""
+    filas = pd.util.hash_pandas_object(serie_, index=True).to_numpy()
+    return hashlib.sha1(filas.tobytes()).hexdigest()
+
+def _crecer(arreglo:np.ndarray, filas:int):
+    """Arreglo con espacio para al menos `filas` filas (duplica la capacidad)."""
+    if len(arreglo) >= filas:
+        return arreglo
+    nuevo = np.empty((max(filas, 2 * len(arreglo)),) + arreglo.shape[1:], dtype=arreglo.dtype)
+    nuevo[:len(arreglo)] = arreglo
+    return nuevo
+
+def _solo_lectura(arreglo:np.ndarray):
+    """Vista del arreglo que no se puede modificar."""
+    vista = arreglo.view()
+    vista.flags.writeable = False
+    return vista
+
+class _EstadoSerie:
+    """
+    Ventana, huella de la cola e historia acumulada de una serie.
+
+    La historia se guarda en arreglos con capacidad de sobra, así cada
+    periodo nuevo se escribe en su lugar sin copiar lo anterior.
+    """
+
+    def __init__(self, serie_:pd.DataFrame, window:int, operacion:str):
+        self.ventana = VentanaMovil(window, operacion)
+        self.columnas = list(serie_.columns)
+        historia = getattr(serie_.rolling(window=window, min_periods=window), operacion)()
+        self._valores = historia.to_numpy(dtype=float, copy=True)
+        self._fechas = serie_.index.to_numpy(copy=True)
+        self._nombre_indice = serie_.index.name
+        self.filas = len(serie_)
+        for fila in serie_.values[-window:]:
+            self.ventana.valores.append(fila.astype(float))
+        self.fechas_ventana = list(serie_.index[-window:])
+        self.huella = self._cola(serie_)
+
+    def _cola(self, serie_:pd.DataFrame):
+        """Huella de las ultimas 2 * window filas ya incorporadas."""
+        return _huella(serie_.iloc[max(self.filas - 2 * self.ventana.window, 0):self.filas])
+
+    @property
+    def historia(self):
+        """Serie acumulada, sobre los arreglos guardados (solo lectura)."""
+        indice = pd.Index(_solo_lectura(self._fechas[:self.filas]), name=self._nombre_indice)
+        return pd.DataFrame(_solo_lectura(self._valores[:self.filas]), index=indice,
+                            columns=self.columnas, copy=False)
+
+    def vigente(self, serie_:pd.DataFrame):
+        """La serie nueva coincide con la cola ya incorporada?"""
+        if not self.fechas_ventana or list(serie_.columns) != self.columnas:
+            return False
+        # estados guardados antes de que existiera la huella de la cola: se recalculan
+        if getattr(self, '_valores', None) is None:
+            return False
+        if len(serie_) < self.filas or not serie_.index.is_monotonic_increasing:
+            return False
+        # mismas filas hasta la ultima fecha vista y la misma cola
+        if serie_.index[self.filas - 1] != self.fechas_ventana[-1]:
+            return False
+        return self._cola(serie_) == self.huella
+
+    def extender(self, serie_:pd.DataFrame):
+        """Acumular solo los periodos posteriores a la ultima fecha vista."""
+        nuevas = serie_.iloc[self.filas:]
+        if nuevas.empty:
+            return
+        filas = [self.ventana.agregar(fila) for fila in nuevas.values]
+        total = self.filas + len(nuevas)
+        self._valores = _crecer(self._valores, total)
+        self._fechas = _crecer(self._fechas, total)
+        self._valores[self.filas:total] = np.asarray(filas, dtype=float).reshape(len(nuevas), -1)
+        self._fechas[self.filas:total] = nuevas.index.to_numpy()
+        self.filas = total
+        self.fechas_ventana = (self.fechas_ventana + list(nuevas.index))[-self.ventana.window:]
+        self.huella = self._cola(serie_)
+
+    def __getstate__(self):
+        # sin la capacidad de sobra
+        estado = dict(self.__dict__)
+        estado['_valores'] = self._valores[:self.filas].copy()
+        estado['_fechas'] = self._fechas[:self.filas].copy()
+        return estado
+
+class AlmacenVentanas:
+    """
+    Estados de las ventanas moviles por serie, persistidos entre ejecuciones.
+
+    Parameters
+    ----------
+    ruta : str, optional
+        Archivo donde se guardan los estados. The default is
+        'ventanas.pkl' en el directorio de cache.
+
+    """
+
+    def __init__(self, ruta:str=None):
+        self.ruta = ruta or os.path.join(directorio_cache(), 'ventanas.pkl')
+        self._estados = {}
+        # estados actualizados por este proceso desde el ultimo guardado
+        self._cambiados = set()
+
+    @classmethod
+    def cargar(cls, ruta:str=None):
+        """
+        Recuperar el almacen guardado (o uno vacio si no existe).
+        """
+        almacen = cls(ruta)
+        if os.path.exists(almacen.ruta):
+            with open(almacen.ruta, 'rb') as archivo:
+                almacen._estados = pickle.load(archivo)
+        return almacen
+
+    def guardar(self):
+        """
+        Guardar los estados en disco.
+
+        Otras etapas pueden estar guardando el mismo almacen: dentro de un
+        bloqueo se vuelve a leer el archivo, se reemplazan solo los estados
+        actualizados por este proceso y se conservan los demás.
+        """
+        if not self._cambiados:
+            return
+        with candado_archivo(self.ruta):
+            estados = {}
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'rb') as archivo:
+                    estados = pickle.load(archivo)
+            # los que no se tocaron aquí pueden ser más nuevos en el disco
+            self._estados = {**self._estados, **estados, **{l: self._estados[l] for l in self._cambiados}}
+            temporal_ = temporal(self.ruta)
+            with open(temporal_, 'wb') as archivo:
+                pickle.dump(self._estados, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal_, self.ruta)
+        self._cambiados = set()
+
+    def ultima_fecha(self, clave:str, agregador:_Agregador):
+        """
+        Ultima fecha incorporada al agregado guardado (o None), para
+        solicitar a la API solo los datos desde ahí.
+        """
+        estado = self._estados.get((clave,) + agregador.llave())
+        return None if estado is None else estado.fecha
+
+    def agregado(self, clave:str, serie_, agregador:_Agregador, parcial:bool=False):
+        """
+        Agregador actualizado con las observaciones nuevas de `serie_`.
+
+        Parameters
+        ----------
+        clave : str
+            Identificador de la serie.
+        serie_ : pd.Series | pd.DataFrame
+            Historia de la serie (se ocupa su primera columna), o solo los
+            datos desde `ultima_fecha` si `parcial` es True.
+        agregador : MediaMovil | MedianaMovil | MediaExponencial | MediaMensual
+            Agregador vacio, se ocupa si no hay uno guardado para la clave.
+        parcial : bool, optional
+            `serie_` no tiene la historia completa. The default is False.
+
+        Raises
+        ------
+        ValueError
+            Si `parcial` es True y los datos ya incorporados fueron revisados.
+
+        Returns
+        -------
+        _Agregador
+            Agregador al dia; su `valor` es el ultimo dato del agregado.
+
+        """
+        if isinstance(serie_, pd.DataFrame):
+            serie_ = serie_.iloc[:, 0]
+        llave = (clave,) + agregador.llave()
+        estado = self._estados.get(llave)
+        if estado is not None and estado.vigente(serie_):
+            # solo las observaciones posteriores a la ultima incorporada
+            estado.actualizar(serie_.iloc[serie_.index.searchsorted(estado.fecha, side='right'):])
+        elif parcial:
+            raise ValueError(f'Los datos de {clave} fueron revisados, se necesita la historia completa')
+        else:
+            estado = agregador
+            estado.actualizar(serie_)
+            self._estados[llave] = estado
+        self._cambiados.add(llave)
+        return estado
+
+    def ultimo(self, clave:str, serie_, agregador:_Agregador):
+        """
+        Valor actual del agregado, p.ej. `serie_.rolling(250).mean().iloc[-1]`.
+        """
+        return self.agregado(clave, serie_, agregador).valor
+
+    def acumular(self, clave:str, serie_:pd.DataFrame, window:int=12, operacion:str='sum'):
+        """
+        Equivalente a `serie_.rolling(window).<operacion>()`, calculando solo
+        los periodos nuevos desde la ultima llamada con la misma clave.
+
+        Parameters
+        ----------
+        clave : str
+            Identificador de la serie (codigo BCCh, ticker y filtro, etc).
+        serie_ : pd.DataFrame
+            Historia completa de la serie, ordenada por fecha.
+        window : int, optional
+            Numero de periodos de la ventana. The default is 12.
+        operacion : str, optional
+            'sum', 'mean' o 'median'. The default is 'sum'.
+
+        Returns
+        -------
+        pd.DataFrame
+            Serie acumulada en la ventana. Comparte los datos con el estado
+            guardado y es de solo lectura; `copy()` si se va a modificar.
+
+        """
+        llave = (clave, window, operacion)
+        estado = self._estados.get(llave)
+        if estado is None or not estado.vigente(serie_):
+            estado = _EstadoSerie(serie_, window, operacion)
+            self._estados[llave] = estado
+        else:
+            estado.extender(serie_)
+        self._cambiados.add(llave)
+        return estado.historia